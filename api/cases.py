@@ -1,14 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Header, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
 from typing import List, Optional
 from datetime import datetime
-import uuid
+import base64
+import json
 import sqlite3
 
+from app.api.auth import User
 from app.core.security import get_current_user, check_permission, log_audit
+from app.core.http_utils import etag_matches
+from app.core.access import case_access
+from app.core.events import event_bus
+from app.modules.search.case_search import CaseSearch
+from app.modules.search.near_duplicates import near_duplicates
+from app.modules.search.contact_index import contact_index
+from app.modules.case_io.case_transfer import CaseTransfer, generate_case_id
+from app.modules.work_queue.case_queue import CaseWorkQueue
 from app.config import settings
 
 router = APIRouter()
 
+case_search = CaseSearch()
+case_transfer = CaseTransfer()
+work_queue = CaseWorkQueue()
+
+# أقسام عرض القضية المتاحة عبر المعامل include
+CASE_VIEW_SECTIONS = ("case", "evidence", "networks", "activity_log")
+
 class CaseCreate(BaseModel):
     title: str
     description: str
@@ -23,6 +43,29 @@ class CaseUpdate(BaseModel):
     priority: Optional[int] = None
     assigned_to: Optional[int] = None
 
+class CaseFilter(BaseModel):
+    status: Optional[str] = None
+    violation_type: Optional[str] = None
+    priority: Optional[int] = None
+    assigned_to: Optional[int] = None
+
+class CaseBulkUpdate(BaseModel):
+    case_ids: Optional[List[str]] = None
+    filter: Optional[CaseFilter] = None
+    update: CaseUpdate
+
+class CaseAccessGrant(BaseModel):
+    principal_type: str = "user"
+    principal_id: int
+
+def _ensure_case_access(current_user: User, case_db_id: int):
+    """رفض الطلب إذا لم تكن القضية ضمن صلاحيات المستخدم"""
+    if not case_access.can_access(current_user, case_db_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="غير مصرح لك بالوصول إلى هذه القضية"
+        )
+
 @router.post("/", status_code=status.HTTP_201_CREATED)
 async def create_case(
     case_data: CaseCreate,
@@ -37,7 +80,7 @@ async def create_case(
         )
     
     # إنشاء معرف فريد للقضية
-    case_id = f"CASE-{datetime.now().strftime('%Y%m%d')}-{str(uuid.uuid4())[:8].upper()}"
+    case_id = generate_case_id()
     
     conn = sqlite3.connect("cybershield.db")
     cursor = conn.cursor()
@@ -61,8 +104,14 @@ async def create_case(
         
         case_db_id = cursor.lastrowid
         
+        # مفاتيح جهات الاتصال الموحدة في نفس المعاملة
+        contact_index.index_cases(cursor, [case_db_id])
+        
         conn.commit()
         
+        # المنشئ يحصل على صلاحية القضية عبر المشغل
+        case_access.invalidate([current_user.id])
+        
         # تسجيل النشاط
         log_audit(
             current_user.id, 
@@ -72,6 +121,15 @@ async def create_case(
             f"إنشاء قضية جديدة: {case_data.title}"
         )
         
+        event_bus.publish(
+            "case.created",
+            case_id=case_db_id,
+            status="new",
+            case_number=case_id,
+            title=case_data.title,
+            violation_type=case_data.violation_type
+        )
+        
         return {
             "message": "تم إنشاء القضية بنجاح",
             "case_id": case_id,
@@ -101,26 +159,21 @@ async def get_cases(
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
-    query = "SELECT * FROM cases WHERE 1=1"
-    params = []
+    # تقييد القائمة بالقضايا المتاحة للمستخدم داخل الاستعلام نفسه
+    conditions, params = case_access.sql_filter(current_user)
     
     if status:
-        query += " AND status = ?"
+        conditions += " AND status = ?"
         params.append(status)
     
-    query += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
-    params.extend([limit, offset])
-    
-    cursor.execute(query, params)
+    cursor.execute(
+        f"SELECT * FROM cases WHERE 1=1{conditions} ORDER BY created_at DESC LIMIT ? OFFSET ?",
+        params + [limit, offset]
+    )
     cases = cursor.fetchall()
     
     # الحصول على العدد الإجمالي
-    count_query = "SELECT COUNT(*) as total FROM cases"
-    if status:
-        count_query += " WHERE status = ?"
-        cursor.execute(count_query, (status,))
-    else:
-        cursor.execute(count_query)
+    cursor.execute(f"SELECT COUNT(*) as total FROM cases WHERE 1=1{conditions}", params)
     
     total = cursor.fetchone()["total"]
     
@@ -134,57 +187,542 @@ async def get_cases(
         "total_pages": (total + limit - 1) // limit
     }
 
+@router.post("/import")
+async def import_cases(
+    request: Request,
+    format: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """استيراد قضايا بالجملة من NDJSON أو CSV متدفق"""
+    if not check_permission(current_user.role, "admin"):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="غير مصرح لك باستيراد القضايا"
+        )
+    
+    if format is None:
+        format = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    
+    if format not in CaseTransfer.FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="صيغة غير مدعومة"
+        )
+    
+    imported = 0
+    errors = []
+    batch = []
+    batch_rows = []
+    
+    async def flush_batch():
+        nonlocal imported
+        try:
+            await run_in_threadpool(case_transfer.insert_batch, batch, current_user.id)
+            imported += len(batch)
+        except Exception as e:
+            errors.extend({"row": row, "errors": [f"خطأ في حفظ الدفعة: {str(e)}"]} for row in batch_rows)
+        batch.clear()
+        batch_rows.clear()
+    
+    async for row_number, record, error in case_transfer.iter_records(request.stream(), format):
+        if error:
+            errors.append({"row": row_number, "errors": [error]})
+            continue
+        
+        # التحقق من كل صف بنفس نموذج إنشاء القضية
+        try:
+            case_data = CaseCreate(**record)
+        except ValidationError as e:
+            errors.append({
+                "row": row_number,
+                "errors": [f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in e.errors()]
+            })
+            continue
+        
+        batch.append(case_data.dict())
+        batch_rows.append(row_number)
+        if len(batch) >= settings.CASE_IMPORT_BATCH_SIZE:
+            await flush_batch()
+    
+    if batch:
+        await flush_batch()
+    
+    log_audit(
+        current_user.id,
+        "IMPORT",
+        "CASE",
+        None,
+        f"استيراد {imported} قضية بالجملة ({len(errors)} صف مرفوض)"
+    )
+    
+    if imported:
+        event_bus.publish("cases.imported", status="new", imported=imported)
+    
+    return {
+        "message": "تم الاستيراد",
+        "imported": imported,
+        "failed": len(errors),
+        "errors": errors
+    }
+
+@router.get("/export")
+async def export_cases(
+    format: str = "ndjson",
+    status_filter: Optional[str] = Query(None, alias="status"),
+    current_user: User = Depends(get_current_user)
+):
+    """تصدير القضايا بشكل متدفق بصيغة NDJSON أو CSV"""
+    if not check_permission(current_user.role, "analyst"):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="غير مصرح لك بتصدير القضايا"
+        )
+    
+    if format not in CaseTransfer.FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="صيغة غير مدعومة"
+        )
+    
+    log_audit(current_user.id, "EXPORT", "CASE", None, f"تصدير القضايا بصيغة {format}")
+    
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    filename = f"cases_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format}"
+    return StreamingResponse(
+        case_transfer.stream_export(
+            format,
+            status_filter,
+            access_filter=lambda column: case_access.sql_filter(current_user, column)
+        ),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.post("/claim-next")
+async def claim_next_case(
+    violation_type: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """حجز القضية التالية ذات الأولوية الأعلى من طابور العمل"""
+    if current_user.role not in settings.WORK_QUEUE_STATUSES:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="لا يوجد طابور عمل لهذا الدور"
+        )
+    
+    case = work_queue.claim_next(current_user.id, current_user.role, violation_type)
+    # الحجز قد يسحب القضية من مستخدم انتهت مهلته
+    case_access.invalidate(None if case else [current_user.id])
+    if not case:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="لا توجد قضايا متاحة في الطابور"
+        )
+    
+    log_audit(
+        current_user.id,
+        "CLAIM",
+        "CASE",
+        case["id"],
+        f"حجز القضية من طابور العمل حتى {case['lease_expires_at']}"
+    )
+    
+    event_bus.publish(
+        "case.claimed",
+        case_id=case["id"],
+        status=case["status"],
+        case_number=case["case_id"],
+        assigned_to=current_user.id
+    )
+    
+    return case
+
+@router.post("/{case_id}/lease")
+async def renew_case_lease(
+    case_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """تمديد مهلة حجز القضية"""
+    lease_expires_at = work_queue.renew_lease(case_id, current_user.id)
+    if not lease_expires_at:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="القضية غير محجوزة لك أو انتهت مهلة الحجز"
+        )
+    
+    return {"case_id": case_id, "lease_expires_at": lease_expires_at}
+
+@router.delete("/{case_id}/lease")
+async def release_case_lease(
+    case_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """إعادة القضية المحجوزة إلى طابور العمل"""
+    case_db_id = work_queue.release(case_id, current_user.id)
+    case_access.invalidate([current_user.id])
+    if not case_db_id:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="القضية غير محجوزة لك"
+        )
+    
+    log_audit(current_user.id, "RELEASE", "CASE", case_db_id, "إعادة القضية إلى طابور العمل")
+    
+    return {"message": "تمت إعادة القضية إلى الطابور", "case_id": case_id}
+
+def _get_case_db_id(case_id: str) -> int:
+    conn = sqlite3.connect("cybershield.db")
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM cases WHERE case_id = ?", (case_id,))
+        case = cursor.fetchone()
+    finally:
+        conn.close()
+    
+    if not case:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="القضية غير موجودة"
+        )
+    return case[0]
+
+@router.post("/{case_id}/access", status_code=status.HTTP_201_CREATED)
+async def grant_case_access(
+    case_id: str,
+    grant: CaseAccessGrant,
+    current_user: User = Depends(get_current_user)
+):
+    """منح مستخدم أو فريق صلاحية الوصول إلى القضية"""
+    if not check_permission(current_user.role, "analyst"):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="غير مصرح لك بمنح صلاحيات القضايا"
+        )
+    
+    if grant.principal_type not in ("user", "team"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="نوع الجهة الممنوحة غير صالح"
+        )
+    
+    case_db_id = _get_case_db_id(case_id)
+    _ensure_case_access(current_user, case_db_id)
+    
+    case_access.grant(case_db_id, grant.principal_type, grant.principal_id, current_user.id)
+    
+    log_audit(
+        current_user.id,
+        "GRANT",
+        "CASE",
+        case_db_id,
+        f"منح صلاحية الوصول إلى {grant.principal_type} #{grant.principal_id}"
+    )
+    
+    return {"message": "تم منح الصلاحية", "case_id": case_id}
+
+@router.delete("/{case_id}/access")
+async def revoke_case_access(
+    case_id: str,
+    principal_id: int,
+    principal_type: str = "user",
+    current_user: User = Depends(get_current_user)
+):
+    """سحب صلاحية ممنوحة صراحةً على القضية"""
+    if not check_permission(current_user.role, "analyst"):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="غير مصرح لك بسحب صلاحيات القضايا"
+        )
+    
+    case_db_id = _get_case_db_id(case_id)
+    _ensure_case_access(current_user, case_db_id)
+    
+    if not case_access.revoke(case_db_id, principal_type, principal_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="لا توجد صلاحية ممنوحة بهذه البيانات"
+        )
+    
+    log_audit(
+        current_user.id,
+        "REVOKE",
+        "CASE",
+        case_db_id,
+        f"سحب صلاحية الوصول من {principal_type} #{principal_id}"
+    )
+    
+    return {"message": "تم سحب الصلاحية", "case_id": case_id}
+
+@router.get("/search")
+async def search_cases(
+    q: str,
+    scope: str = "all",
+    page: int = 1,
+    limit: int = 20,
+    current_user: User = Depends(get_current_user)
+):
+    """البحث النصي الكامل في القضايا والأدلة"""
+    if scope not in CaseSearch.SCOPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="نطاق بحث غير صالح"
+        )
+    
+    if page < 1 or not 1 <= limit <= 100:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="معاملات الترقيم غير صالحة"
+        )
+    
+    return case_search.search(
+        q,
+        scope=scope,
+        page=page,
+        limit=limit,
+        access_filter=lambda column: case_access.sql_filter(current_user, column)
+    )
+
 @router.get("/{case_id}")
 async def get_case(
     case_id: str,
+    response: Response,
+    include: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user)
 ):
-    """الحصول على تفاصيل قضية محددة"""
+    """الحصول على تفاصيل قضية محددة (مع اختيار الأقسام عبر include)"""
+    if include:
+        sections = {section.strip() for section in include.split(",") if section.strip()}
+        unknown = sections - set(CASE_VIEW_SECTIONS)
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"أقسام غير معروفة: {', '.join(sorted(unknown))}"
+            )
+    else:
+        sections = set(CASE_VIEW_SECTIONS)
+    
     conn = sqlite3.connect("cybershield.db")
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
-    # الحصول على القضية
-    cursor.execute("SELECT * FROM cases WHERE case_id = ?", (case_id,))
-    case = cursor.fetchone()
-    
-    if not case:
+    try:
+        # الحصول على القضية
+        cursor.execute("SELECT * FROM cases WHERE case_id = ?", (case_id,))
+        case = cursor.fetchone()
+        
+        if not case:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="القضية غير موجودة"
+            )
+        
+        _ensure_case_access(current_user, case["id"])
+        
+        # وسم ضعيف مبني على رقم نسخة القضية والأقسام المطلوبة
+        etag = f'W/"{case["id"]}-{case["version"]}-{"+".join(sorted(sections))}"'
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        
+        response.headers["ETag"] = etag
+        result = {}
+        
+        if "case" in sections:
+            result["case"] = dict(case)
+        
+        # الحصول على الأدلة المرتبطة
+        if "evidence" in sections:
+            # أدلة القضية والأدلة الموجودة المربوطة بها دون إعادة رفع
+            cursor.execute('''
+            SELECT e.*, NULL AS linked_at FROM evidence e WHERE e.case_id = ?
+            UNION ALL
+            SELECT e.*, el.linked_at FROM evidence_links el
+            JOIN evidence e ON e.id = el.evidence_id
+            WHERE el.case_id = ?
+            ''', (case["id"], case["id"]))
+            result["evidence"] = [dict(row) for row in cursor.fetchall()]
+        
+        # الحصول على الشبكات المرتبطة
+        if "networks" in sections:
+            cursor.execute('''
+            SELECT n.* FROM networks n
+            JOIN case_network cn ON n.id = cn.network_id
+            WHERE cn.case_id = ?
+            ''', (case["id"],))
+            result["networks"] = [dict(row) for row in cursor.fetchall()]
+        
+        # الحصول على سجل النشاطات
+        if "activity_log" in sections:
+            cursor.execute('''
+            SELECT al.*, u.username FROM audit_log al
+            LEFT JOIN users u ON al.user_id = u.id
+            WHERE al.entity_type = 'CASE' AND al.entity_id = ?
+            ORDER BY al.created_at DESC
+            LIMIT 50
+            ''', (case["id"],))
+            result["activity_log"] = [dict(row) for row in cursor.fetchall()]
+        
+        return result
+    finally:
         conn.close()
+
+def _build_case_update(update_data: CaseUpdate, now: str):
+    """بناء حقول وقيم UPDATE لتحديث القضية (مشترك بين التحديث الفردي والجماعي)"""
+    update_fields = []
+    update_values = []
+    
+    if update_data.title is not None:
+        update_fields.append("title = ?")
+        update_values.append(update_data.title)
+    
+    if update_data.description is not None:
+        update_fields.append("description = ?")
+        update_values.append(update_data.description)
+    
+    if update_data.status is not None:
+        update_fields.append("status = ?")
+        update_values.append(update_data.status)
+        
+        # إذا تم إغلاق القضية
+        if update_data.status == "closed":
+            update_fields.append("closed_at = ?")
+            update_values.append(now)
+    
+    if update_data.priority is not None:
+        update_fields.append("priority = ?")
+        update_values.append(update_data.priority)
+    
+    if update_data.assigned_to is not None:
+        update_fields.append("assigned_to = ?")
+        update_values.append(update_data.assigned_to)
+        
+        # الإسناد اليدوي دائم ويلغي أي حجز مؤقت من طابور العمل
+        update_fields.append("claimed_at = NULL")
+        update_fields.append("lease_expires_at = NULL")
+    
+    # إضافة تاريخ التحديث
+    update_fields.append("updated_at = ?")
+    update_values.append(now)
+    
+    return update_fields, update_values
+
+def _describe_case_update(update_data: CaseUpdate) -> str:
+    """وصف التحديث لسجل التدقيق"""
+    changes = []
+    if update_data.status:
+        changes.append(f"تغيير الحالة إلى: {update_data.status}")
+    if update_data.assigned_to is not None:
+        changes.append(f"إسناد إلى المستخدم #{update_data.assigned_to}")
+    
+    return f"تحديث القضية: {', '.join(changes) if changes else 'تحديث عام'}"
+
+@router.put("/bulk")
+async def bulk_update_cases(
+    bulk_data: CaseBulkUpdate,
+    current_user: User = Depends(get_current_user)
+):
+    """تحديث مجموعة من القضايا (إسناد أو تغيير حالة) في معاملة واحدة"""
+    if not check_permission(current_user.role, "analyst"):
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="القضية غير موجودة"
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="غير مصرح لك بتحديث القضايا"
         )
     
-    # الحصول على الأدلة المرتبطة
-    cursor.execute("SELECT * FROM evidence WHERE case_id = ?", (case["id"],))
-    evidence_list = cursor.fetchall()
-    
-    # الحصول على الشبكات المرتبطة
-    cursor.execute('''
-    SELECT n.* FROM networks n
-    JOIN case_network cn ON n.id = cn.network_id
-    WHERE cn.case_id = ?
-    ''', (case["id"],))
-    networks = cursor.fetchall()
-    
-    # الحصول على سجل النشاطات
-    cursor.execute('''
-    SELECT al.*, u.username FROM audit_log al
-    LEFT JOIN users u ON al.user_id = u.id
-    WHERE al.entity_type = 'CASE' AND al.entity_id = ?
-    ORDER BY al.created_at DESC
-    LIMIT 50
-    ''', (case["id"],))
-    activity_log = cursor.fetchall()
+    # منع تحديث جميع القضايا عن طريق الخطأ
+    filters = bulk_data.filter.dict(exclude_none=True) if bulk_data.filter else {}
+    if not bulk_data.case_ids and not filters:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="يجب تحديد قائمة قضايا أو شرط تصفية"
+        )
     
-    conn.close()
+    conditions = []
+    params = []
+    if bulk_data.case_ids:
+        conditions.append(f"case_id IN ({', '.join('?' for _ in bulk_data.case_ids)})")
+        params.extend(bulk_data.case_ids)
+    for field, value in filters.items():
+        conditions.append(f"{field} = ?")
+        params.append(value)
+    
+    # القضايا التي لا يصل إليها المستخدم لا تُحدّث حتى لو طابقت الشرط
+    access_sql, access_params = case_access.sql_filter(current_user, "id")
+    
+    now = datetime.now().isoformat()
+    update_fields, update_values = _build_case_update(bulk_data.update, now)
+    details = _describe_case_update(bulk_data.update)
+    
+    # المعاملة وسجلات التدقيق ونشر الأحداث لآلاف القضايا تعمل خارج حلقة الأحداث
+    def apply_update():
+        conn = sqlite3.connect("cybershield.db")
+        cursor = conn.cursor()
+        
+        try:
+            # قفل الكتابة من البداية حتى لا تتغير مجموعة القضايا بين التحديد والتحديث
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(
+                f"SELECT id, case_id, status FROM cases WHERE {' AND '.join(conditions)}{access_sql} LIMIT ?",
+                params + access_params + [settings.CASE_BULK_UPDATE_MAX + 1]
+            )
+            matched = cursor.fetchall()
+            ids = [row[0] for row in matched]
+            
+            if len(ids) > settings.CASE_BULK_UPDATE_MAX:
+                conn.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"عدد القضايا يتجاوز الحد الأقصى ({settings.CASE_BULK_UPDATE_MAX})"
+                )
+            
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                cursor.execute(
+                    f"UPDATE cases SET {', '.join(update_fields)} WHERE id IN ({', '.join('?' for _ in chunk)})",
+                    update_values + chunk
+                )
+            
+            if bulk_data.update.title is not None or bulk_data.update.description is not None:
+                contact_index.index_cases(cursor, ids)
+            
+            # سجلات التدقيق للدفعة كاملة
+            cursor.executemany('''
+            INSERT INTO audit_log (user_id, action, entity_type, entity_id, details)
+            VALUES (?, ?, ?, ?, ?)
+            ''', [(current_user.id, "UPDATE", "CASE", case_db_id, details) for case_db_id in ids])
+            
+            conn.commit()
+            
+            if bulk_data.update.assigned_to is not None:
+                case_access.invalidate()
+            
+            changes = bulk_data.update.dict(exclude_none=True)
+            for case_db_id, case_number, case_status in matched:
+                event_bus.publish(
+                    "case.updated",
+                    case_id=case_db_id,
+                    status=bulk_data.update.status or case_status,
+                    case_number=case_number,
+                    changes=changes
+                )
+            
+            return {
+                "message": "تم تحديث القضايا بنجاح",
+                "updated": len(ids),
+                "updated_at": now
+            }
+        
+        except HTTPException:
+            raise
+        except Exception as e:
+            conn.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"خطأ في تحديث القضايا: {str(e)}"
+            )
+        finally:
+            conn.close()
     
-    return {
-        "case": case,
-        "evidence": evidence_list,
-        "networks": networks,
-        "activity_log": activity_log
-    }
+    return await run_in_threadpool(apply_update)
 
 @router.put("/{case_id}")
 async def update_case(
@@ -204,7 +742,7 @@ async def update_case(
     
     try:
         # الحصول على القضية الحالية
-        cursor.execute("SELECT id, status FROM cases WHERE case_id = ?", (case_id,))
+        cursor.execute("SELECT id, status, assigned_to FROM cases WHERE case_id = ?", (case_id,))
         case = cursor.fetchone()
         
         if not case:
@@ -214,38 +752,10 @@ async def update_case(
                 detail="القضية غير موجودة"
             )
         
-        # بناء استعلام التحديث
-        update_fields = []
-        update_values = []
-        
-        if update_data.title is not None:
-            update_fields.append("title = ?")
-            update_values.append(update_data.title)
-        
-        if update_data.description is not None:
-            update_fields.append("description = ?")
-            update_values.append(update_data.description)
-        
-        if update_data.status is not None:
-            update_fields.append("status = ?")
-            update_values.append(update_data.status)
-            
-            # إذا تم إغلاق القضية
-            if update_data.status == "closed":
-                update_fields.append("closed_at = ?")
-                update_values.append(datetime.now().isoformat())
+        _ensure_case_access(current_user, case[0])
         
-        if update_data.priority is not None:
-            update_fields.append("priority = ?")
-            update_values.append(update_data.priority)
-        
-        if update_data.assigned_to is not None:
-            update_fields.append("assigned_to = ?")
-            update_values.append(update_data.assigned_to)
-        
-        # إضافة تاريخ التحديث
-        update_fields.append("updated_at = ?")
-        update_values.append(datetime.now().isoformat())
+        # بناء استعلام التحديث
+        update_fields, update_values = _build_case_update(update_data, datetime.now().isoformat())
         
         # إضافة معرف القضية
         update_values.append(case_id)
@@ -254,23 +764,36 @@ async def update_case(
         update_query = f"UPDATE cases SET {', '.join(update_fields)} WHERE case_id = ?"
         cursor.execute(update_query, update_values)
         
+        if update_data.title is not None or update_data.description is not None:
+            contact_index.index_cases(cursor, [case[0]])
+        
         conn.commit()
         
-        # تسجيل النشاط
-        changes = []
-        if update_data.status:
-            changes.append(f"تغيير الحالة إلى: {update_data.status}")
+        # المشغل ينقل صلاحية المسند إليه، والذاكرة تُبطل للطرفين
+        if update_data.assigned_to is not None:
+            case_access.invalidate([case[2], update_data.assigned_to])
         
+        # تسجيل النشاط
         log_audit(
             current_user.id,
             "UPDATE",
             "CASE",
             case[0],
-            f"تحديث القضية: {', '.join(changes) if changes else 'تحديث عام'}"
+            _describe_case_update(update_data)
+        )
+        
+        event_bus.publish(
+            "case.updated",
+            case_id=case[0],
+            status=update_data.status or case[1],
+            case_number=case_id,
+            changes=update_data.dict(exclude_none=True)
         )
         
         return {"message": "تم تحديث القضية بنجاح"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         conn.rollback()
         raise HTTPException(
@@ -280,83 +803,201 @@ async def update_case(
     finally:
         conn.close()
 
+# أحداث الخط الزمني مدمجة في استعلام واحد ومرتبة داخل SQLite
+# (kind يحدد الترتيب بين الأحداث ذات الوقت نفسه)
+TIMELINE_QUERY = '''
+SELECT * FROM (
+    SELECT 'case_created' AS type, 0 AS kind, id AS row_id,
+           replace(created_at, 'T', ' ') AS timestamp,
+           'تم إنشاء القضية في النظام' AS description
+    FROM cases WHERE id = :case_id
+    UNION ALL
+    SELECT 'evidence_uploaded', 1, id,
+           replace(uploaded_at, 'T', ' '),
+           COALESCE(description, 'تم رفع دليل جديد')
+    FROM evidence WHERE case_id = :case_id
+    UNION ALL
+    SELECT 'status_change', 2, id,
+           replace(created_at, 'T', ' '),
+           details
+    FROM audit_log WHERE entity_type = 'CASE' AND entity_id = :case_id AND action = 'UPDATE'
+    UNION ALL
+    SELECT 'report_generated', 3, id,
+           replace(generated_at, 'T', ' '),
+           'تقرير ' || report_type
+    FROM reports WHERE case_id = :case_id
+)
+WHERE (timestamp, kind, row_id) > (:after_timestamp, :after_kind, :after_id)
+ORDER BY timestamp, kind, row_id
+LIMIT :limit
+'''
+
+TIMELINE_TITLES = {
+    "case_created": "إنشاء القضية",
+    "evidence_uploaded": "رفع دليل",
+    "status_change": "تغيير حالة",
+    "report_generated": "توليد تقرير"
+}
+
+def _encode_timeline_cursor(row) -> str:
+    """تحويل موضع آخر حدث إلى مؤشر ترقيم معتم"""
+    position = json.dumps([row["timestamp"], row["kind"], row["row_id"]])
+    return base64.urlsafe_b64encode(position.encode("utf-8")).decode("ascii")
+
+def _decode_timeline_cursor(cursor: str) -> list:
+    timestamp, kind, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    return [str(timestamp), int(kind), int(row_id)]
+
+def _stream_timeline(case_db_id: int, after: list, limit: int):
+    """بث صفحة الخط الزمني كـ JSON دون تجميعها في الذاكرة"""
+    # قد يُستهلك المولد من خيوط مختلفة أثناء البث
+    conn = sqlite3.connect("cybershield.db", check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    
+    try:
+        cursor = conn.cursor()
+        cursor.execute(TIMELINE_QUERY, {
+            "case_id": case_db_id,
+            "after_timestamp": after[0],
+            "after_kind": after[1],
+            "after_id": after[2],
+            "limit": limit + 1
+        })
+        
+        yield '{"timeline": ['
+        
+        count = 0
+        last_row = None
+        while count < limit:
+            rows = cursor.fetchmany(min(500, limit - count))
+            if not rows:
+                break
+            
+            for row in rows:
+                event = {
+                    "type": row["type"],
+                    "timestamp": row["timestamp"],
+                    "title": TIMELINE_TITLES[row["type"]],
+                    "description": row["description"]
+                }
+                yield ("," if count else "") + json.dumps(event, ensure_ascii=False)
+                count += 1
+                last_row = row
+        
+        # وجود صف إضافي يعني أن هناك صفحة تالية
+        has_more = count == limit and cursor.fetchone() is not None
+        next_cursor = _encode_timeline_cursor(last_row) if has_more else None
+        
+        yield f'], "next_cursor": {json.dumps(next_cursor)}}}'
+    finally:
+        conn.close()
+
 @router.get("/{case_id}/timeline")
 async def get_case_timeline(
     case_id: str,
+    cursor: Optional[str] = None,
+    limit: int = 200,
     current_user: User = Depends(get_current_user)
 ):
-    """الحصول على الخط الزمني للقضية"""
-    conn = sqlite3.connect("cybershield.db")
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    """الحصول على الخط الزمني للقضية (مرتب ومقسم إلى صفحات)"""
+    if not 1 <= limit <= 1000:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="معاملات الترقيم غير صالحة"
+        )
     
-    # الحصول على القضية
-    cursor.execute("SELECT id, created_at FROM cases WHERE case_id = ?", (case_id,))
-    case = cursor.fetchone()
+    # بداية الخط الزمني أو الموضع بعد آخر حدث في الصفحة السابقة
+    after = ["", -1, -1]
+    if cursor:
+        try:
+            after = _decode_timeline_cursor(cursor)
+        except (ValueError, TypeError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="مؤشر الترقيم غير صالح"
+            )
+    
+    conn = sqlite3.connect("cybershield.db")
+    db_cursor = conn.cursor()
+    db_cursor.execute("SELECT id FROM cases WHERE case_id = ?", (case_id,))
+    case = db_cursor.fetchone()
+    conn.close()
     
     if not case:
-        conn.close()
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="القضية غير موجودة"
         )
     
-    # جمع جميع الأحداث
-    timeline = []
-    
-    # 1. إنشاء القضية
-    timeline.append({
-        "type": "case_created",
-        "timestamp": case["created_at"],
-        "title": "إنشاء القضية",
-        "description": "تم إنشاء القضية في النظام"
-    })
+    _ensure_case_access(current_user, case[0])
     
-    # 2. الأدلة المرفوعة
-    cursor.execute(
-        "SELECT uploaded_at, description FROM evidence WHERE case_id = ? ORDER BY uploaded_at",
-        (case["id"],)
+    return StreamingResponse(
+        _stream_timeline(case[0], after, limit),
+        media_type="application/json"
     )
-    for evidence in cursor.fetchall():
-        timeline.append({
-            "type": "evidence_uploaded",
-            "timestamp": evidence["uploaded_at"],
-            "title": "رفع دليل",
-            "description": evidence["description"] or "تم رفع دليل جديد"
-        })
+
+@router.get("/{case_id}/near-duplicates")
+async def get_case_near_duplicates(
+    case_id: str,
+    limit: int = 20,
+    current_user: User = Depends(get_current_user)
+):
+    """القضايا والأدلة التي يشبه نصها وصف القضية (بلاغات مكررة أو منسوخة)"""
+    if not 1 <= limit <= 100:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="معاملات الترقيم غير صالحة"
+        )
     
-    # 3. تغييرات الحالة
-    cursor.execute('''
-    SELECT created_at, details FROM audit_log 
-    WHERE entity_type = 'CASE' AND entity_id = ? 
-    AND action = 'UPDATE'
-    ORDER BY created_at
-    ''', (case["id"],))
-    
-    for log in cursor.fetchall():
-        timeline.append({
-            "type": "status_change",
-            "timestamp": log["created_at"],
-            "title": "تغيير حالة",
-            "description": log["details"]
-        })
+    conn = sqlite3.connect("cybershield.db")
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM cases WHERE case_id = ?", (case_id,))
+    case = cursor.fetchone()
+    conn.close()
     
-    # 4. التقارير المولدة
-    cursor.execute(
-        "SELECT generated_at, report_type FROM reports WHERE case_id = ? ORDER BY generated_at",
-        (case["id"],)
-    )
-    for report in cursor.fetchall():
-        timeline.append({
-            "type": "report_generated",
-            "timestamp": report["generated_at"],
-            "title": "توليد تقرير",
-            "description": f"تقرير {report['report_type']}"
-        })
+    if not case:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="القضية غير موجودة"
+        )
     
-    # ترتيب الخط الزمني حسب التاريخ
-    timeline.sort(key=lambda x: x["timestamp"])
+    _ensure_case_access(current_user, case[0])
     
+    matches = await run_in_threadpool(near_duplicates.find_similar, "case", case[0], None, limit) or []
+    return {
+        "case_id": case_id,
+        "matches": [m for m in matches if m["case_db_id"] and case_access.can_access(current_user, m["case_db_id"])]
+    }
+
+@router.get("/{case_id}/related-contacts")
+async def get_case_related_contacts(
+    case_id: str,
+    limit: int = 20,
+    current_user: User = Depends(get_current_user)
+):
+    """القضايا التي تشترك مع القضية في هاتف أو بريد أو حساب (بعد التوحيد)"""
+    if not 1 <= limit <= 100:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="معاملات الترقيم غير صالحة"
+        )
+    
+    conn = sqlite3.connect("cybershield.db")
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM cases WHERE case_id = ?", (case_id,))
+    case = cursor.fetchone()
     conn.close()
     
-    return {"timeline": timeline}
+    if not case:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="القضية غير موجودة"
+        )
+    
+    _ensure_case_access(current_user, case[0])
+    
+    matches = await run_in_threadpool(contact_index.related_cases, case[0], limit)
+    return {
+        "case_id": case_id,
+        "matches": [m for m in matches if case_access.can_access(current_user, m["id"])]
+    }
@@ -0,0 +1,87 @@
+from fastapi import APIRouter, Depends, Header, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+import asyncio
+
+from app.api.auth import User
+from app.config import settings
+from app.core.security import get_current_user
+from app.core.access import case_access
+from app.core.events import event_bus, format_sse
+
+router = APIRouter()
+
+# أحداث سجل التدقيق (ومنها تسجيل الدخول) تكشف نشاط المستخدمين وتفاصيله: للمدير فقط
+ADMIN_ONLY_EVENT_TYPES = {"audit"}
+
+def _event_visible(user: User, event: dict) -> bool:
+    """هل يحق للمستخدم استلام الحدث: نوعه مسموح لدوره والقضية ضمن صلاحياته"""
+    if event["type"] in ADMIN_ONLY_EVENT_TYPES and user.role != "admin":
+        return False
+    return event["case_id"] is None or case_access.can_access(user, event["case_id"])
+
+@router.get("/stream")
+async def stream_events(
+    request: Request,
+    case: Optional[List[int]] = Query(None),
+    status: Optional[List[str]] = Query(None),
+    types: Optional[List[str]] = Query(None),
+    last_event_id: Optional[int] = Query(None),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+    current_user: User = Depends(get_current_user)
+):
+    """موجز تغييرات القضايا والأدلة عبر Server-Sent Events
+
+    يمكن تقييد الاشتراك بقضايا (case) أو حالات (status) أو أنواع أحداث (types)،
+    والاستئناف بعد انقطاع عبر ترويسة Last-Event-ID.
+    """
+    if last_event_id_header and last_event_id_header.isdigit():
+        last_event_id = int(last_event_id_header)
+
+    async def event_stream():
+        subscription = event_bus.subscribe(
+            case_ids=case,
+            statuses=status,
+            event_types=types
+        )
+        try:
+            last_sent = subscription.start_id
+
+            # إعادة إرسال ما فات العميل منذ آخر حدث استلمه
+            if last_event_id is not None:
+                missed, complete = event_bus.replay(last_event_id, subscription)
+                if not complete:
+                    yield "event: reset\ndata: {}\n\n"
+                for event in missed:
+                    if await run_in_threadpool(_event_visible, current_user, event):
+                        yield format_sse(event)
+
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.queue.get(),
+                        timeout=settings.EVENT_HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                if event["id"] <= last_sent:
+                    continue
+                last_sent = event["id"]
+                # صلاحية المستخدم تُفحص هنا لا في الناشر، فلا يتحمل النشر استعلامًا لكل مشترك
+                if await run_in_threadpool(_event_visible, current_user, event):
+                    yield format_sse(event)
+
+                # بعد تجاوز سعة الطابور: إنهاء الاتصال ليستأنف العميل من المخزن
+                if subscription.overflowed and subscription.queue.empty():
+                    break
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,12 +1,76 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Header, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime
+from urllib.parse import quote, urlparse
+import mimetypes
+import os
+import re
 import aiofiles
 
-from app.core.security import get_current_user, check_permission, log_audit
+from app.core.security import User, get_current_user, check_permission, log_audit, log_audit_batched
+from app.core.http_utils import FileRangeResponse, etag_matches, parse_range_header
+from app.core.access import case_access
 from app.modules.evidence_engine.evidence_manager import EvidenceManager
+from app.modules.evidence_engine.upload_sessions import UploadSessionManager, UploadError
+from app.modules.evidence_engine.url_archiver import UrlArchiver
+from app.modules.evidence_engine.archive_ingest import ArchiveIngester, IngestError
+from app.modules.search.near_duplicates import near_duplicates
+from app.config import settings
 
 router = APIRouter()
 evidence_manager = EvidenceManager()
+upload_sessions = UploadSessionManager(evidence_manager)
+url_archiver = UrlArchiver(evidence_manager)
+archive_ingester = ArchiveIngester(evidence_manager)
+
+SHA256_PATTERN = re.compile(r"^[0-9a-fA-F]{64}$")
+
+class EvidencePrecheck(BaseModel):
+    case_id: int
+    sha256: str
+    size: Optional[int] = None
+    description: Optional[str] = None
+
+class UploadSessionCreate(BaseModel):
+    case_id: int
+    evidence_type: str
+    filename: str
+    size: int
+    sha256: str
+    description: Optional[str] = None
+
+class ArchiveRequest(BaseModel):
+    case_id: int
+    urls: List[str]
+    description: Optional[str] = None
+
+def _upload_http_error(e: UploadError) -> HTTPException:
+    """تحويل خطأ الرفع إلى استجابة HTTP مع الإزاحة الحالية للاستئناف"""
+    headers = {"Upload-Offset": str(e.offset)} if e.offset is not None else None
+    return HTTPException(status_code=e.status_code, detail=e.message, headers=headers)
+
+def _ensure_case_access(current_user: User, case_id: int):
+    if not case_access.can_access(current_user, case_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="غير مصرح لك بالوصول إلى هذه القضية"
+        )
+
+def _ensure_evidence_access(current_user: User, evidence_id: int):
+    """التحقق من وجود الدليل وصلاحية الوصول إلى قضيته"""
+    case_ids = evidence_manager.get_evidence_case_ids(evidence_id)
+    if not case_ids:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="الدليل غير موجود"
+        )
+    if not any(case_access.can_access(current_user, case_id) for case_id in case_ids):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="غير مصرح لك بالوصول إلى هذه القضية"
+        )
 
 @router.post("/upload")
 async def upload_evidence(
@@ -23,6 +87,8 @@ async def upload_evidence(
             detail="غير مصرح لك برفع الأدلة"
         )
     
+    _ensure_case_access(current_user, case_id)
+    
     # قراءة محتوى الملف
     file_content = await file.read()
     
@@ -44,34 +110,256 @@ async def upload_evidence(
     
     return result
 
-@router.post("/archive-url")
+@router.post("/precheck")
+async def precheck_evidence(
+    precheck: EvidencePrecheck,
+    current_user: User = Depends(get_current_user)
+):
+    """التفاوض قبل الرفع: إذا كان المحتوى معروفًا يُربط بالقضية دون نقل الملف"""
+    if not check_permission(current_user.role, "analyst"):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="غير مصرح لك برفع الأدلة"
+        )
+    
+    if not SHA256_PATTERN.match(precheck.sha256):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="بصمة SHA-256 غير صالحة"
+        )
+    
+    _ensure_case_access(current_user, precheck.case_id)
+    
+    # الربط دون رفع فقط لدليل يستطيع المستخدم الوصول إليه أصلًا؛ البصمة وحدها ليست إثباتًا لحيازة الملف.
+    # في غير ذلك يُطلب الرفع، ويُربط الدليل الموجود بعد استلام المحتوى ومطابقة بصمته.
+    existing = evidence_manager.find_by_hash(precheck.sha256, precheck.size)
+    if not existing or not any(
+        case_access.can_access(current_user, case_id)
+        for case_id in evidence_manager.get_evidence_case_ids(existing["id"])
+    ):
+        return {"exists": False, "upload_required": True}
+    
+    linked = evidence_manager.link_existing(
+        existing["id"],
+        precheck.case_id,
+        description=precheck.description,
+        linked_by=current_user.id
+    )
+    
+    return {
+        "exists": True,
+        "upload_required": False,
+        "evidence_id": existing["id"],
+        "filename": existing["filename"],
+        "linked": linked,
+        "message": "تم ربط الدليل الموجود بالقضية" if linked else "الدليل مرتبط بالقضية مسبقًا"
+    }
+
+@router.post("/uploads", status_code=status.HTTP_201_CREATED)
+async def create_upload_session(
+    upload: UploadSessionCreate,
+    current_user: User = Depends(get_current_user)
+):
+    """بدء رفع قابل للاستئناف لملف كبير"""
+    if not check_permission(current_user.role, "analyst"):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="غير مصرح لك برفع الأدلة"
+        )
+    
+    if not SHA256_PATTERN.match(upload.sha256):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="بصمة SHA-256 غير صالحة"
+        )
+    
+    _ensure_case_access(current_user, upload.case_id)
+    
+    try:
+        return upload_sessions.create_session(
+            case_id=upload.case_id,
+            evidence_type=upload.evidence_type,
+            filename=upload.filename,
+            total_size=upload.size,
+            sha256=upload.sha256,
+            description=upload.description,
+            uploaded_by=current_user.id
+        )
+    except UploadError as e:
+        raise _upload_http_error(e)
+
+@router.get("/uploads/{upload_id}")
+async def get_upload_session(
+    upload_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """حالة الرفع: الإزاحة التي يستأنف منها العميل"""
+    try:
+        session = upload_sessions.get_session(upload_id, current_user.id)
+    except UploadError as e:
+        raise _upload_http_error(e)
+    
+    return {
+        "upload_id": upload_id,
+        "offset": session["received_bytes"],
+        "total_size": session["total_size"],
+        "expires_at": session["expires_at"]
+    }
+
+@router.put("/uploads/{upload_id}")
+async def upload_chunk(
+    upload_id: str,
+    offset: int,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """رفع جزء من الملف بدءًا من الإزاحة المحددة (جسم الطلب هو البيانات الخام)"""
+    try:
+        return await upload_sessions.write_chunk(upload_id, current_user.id, offset, request.stream())
+    except UploadError as e:
+        raise _upload_http_error(e)
+
+@router.post("/uploads/{upload_id}/finalize")
+async def finalize_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """إنهاء الرفع: مطابقة البصمة وتسجيل الدليل"""
+    try:
+        result = await run_in_threadpool(upload_sessions.finalize, upload_id, current_user.id)
+    except UploadError as e:
+        raise _upload_http_error(e)
+    
+    if "error" in result:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=result["error"]
+        )
+    
+    return result
+
+@router.delete("/uploads/{upload_id}")
+async def abort_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """إلغاء جلسة الرفع وحذف الأجزاء المستلمة"""
+    try:
+        upload_sessions.abort(upload_id, current_user.id)
+    except UploadError as e:
+        raise _upload_http_error(e)
+    
+    return {"message": "تم إلغاء الرفع"}
+
+@router.post("/archive-url", status_code=status.HTTP_202_ACCEPTED)
 async def archive_url(
     case_id: int = Form(...),
     url: str = Form(...),
     description: str = Form(None),
     current_user: User = Depends(get_current_user)
 ):
-    """أرشفة رابط كدليل"""
+    """أرشفة رابط كدليل (تُنفذ في الخلفية وتُتابع عبر حالة المهمة)"""
+    return await archive_urls(
+        ArchiveRequest(case_id=case_id, urls=[url], description=description),
+        current_user
+    )
+
+@router.post("/archive", status_code=status.HTTP_202_ACCEPTED)
+async def archive_urls(
+    archive_request: ArchiveRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """أرشفة مجموعة روابط لقضية في مهمة خلفية واحدة"""
     if not check_permission(current_user.role, "analyst"):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="غير مصرح لك بأرشفة الروابط"
         )
     
-    # أرشفة الرابط
-    result = evidence_manager.archive_url(
-        url=url,
-        case_id=case_id,
-        uploaded_by=current_user.id
-    )
+    urls = list(dict.fromkeys(url.strip() for url in archive_request.urls if url.strip()))
+    if not urls or len(urls) > settings.ARCHIVE_MAX_URLS_PER_JOB:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"يجب تحديد رابط واحد على الأقل وحتى {settings.ARCHIVE_MAX_URLS_PER_JOB} رابط"
+        )
     
-    if "error" in result:
+    invalid = [url for url in urls if urlparse(url).scheme not in ("http", "https") or not urlparse(url).netloc]
+    if invalid:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=result["error"]
+            detail=f"روابط غير صالحة: {', '.join(invalid[:10])}"
         )
     
-    return result
+    _ensure_case_access(current_user, archive_request.case_id)
+    
+    job = await url_archiver.submit(
+        archive_request.case_id,
+        urls,
+        current_user.id,
+        archive_request.description
+    )
+    
+    log_audit(
+        current_user.id,
+        "ARCHIVE",
+        "CASE",
+        archive_request.case_id,
+        f"طلب أرشفة {len(urls)} رابط (المهمة {job['id']})"
+    )
+    
+    return job
+
+@router.get("/archive/{job_id}")
+async def get_archive_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """حالة مهمة الأرشفة ونتيجة كل رابط"""
+    job = await run_in_threadpool(url_archiver.get_job, job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="مهمة الأرشفة غير موجودة"
+        )
+    
+    _ensure_case_access(current_user, job["case_id"])
+    
+    return job
+
+@router.post("/ingest")
+async def ingest_archive(
+    case_id: int,
+    evidence_type: str,
+    request: Request,
+    filename: str = "archive",
+    description: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """استيراد كل ملفات ZIP أو TAR كأدلة للقضية (جسم الطلب هو الملف المضغوط الخام)
+
+    يعيد بيانًا بنتيجة كل عنصر: stored أو duplicate أو linked أو exists أو skipped أو failed.
+    """
+    if not check_permission(current_user.role, "analyst"):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="غير مصرح لك برفع الأدلة"
+        )
+    
+    _ensure_case_access(current_user, case_id)
+    
+    try:
+        spooled = await archive_ingester.spool(request.stream())
+        return await run_in_threadpool(
+            archive_ingester.ingest,
+            spooled,
+            case_id,
+            evidence_type,
+            os.path.basename(filename),
+            description,
+            current_user.id
+        )
+    except IngestError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
 
 @router.get("/{evidence_id}")
 async def get_evidence(
@@ -79,7 +367,11 @@ async def get_evidence(
     current_user: User = Depends(get_current_user)
 ):
     """الحصول على معلومات الدليل"""
-    info = evidence_manager.get_evidence_info(evidence_id)
+    # التحقق من صلاحية الوصول للقضية قبل حساب بصمة الملف
+    _ensure_evidence_access(current_user, evidence_id)
+    
+    # الحساب في خيط منفصل؛ الطلبات المتزامنة لنفس الدليل تتشارك عملية التحقق
+    info = await run_in_threadpool(evidence_manager.get_evidence_info, evidence_id)
     
     if not info:
         raise HTTPException(
@@ -87,26 +379,127 @@ async def get_evidence(
             detail="الدليل غير موجود"
         )
     
-    # التحقق من صلاحية الوصول للقضية
-    conn = sqlite3.connect("cybershield.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT case_id FROM evidence WHERE id = ?", (evidence_id,))
-    evidence_case = cursor.fetchone()
-    conn.close()
+    return info
+
+@router.get("/{evidence_id}/download")
+async def download_evidence(
+    evidence_id: int,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_range: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
+    """تنزيل ملف الدليل بعد التحقق من الصلاحية، مع دعم Range و ETag"""
+    _ensure_evidence_access(current_user, evidence_id)
     
-    if evidence_case:
-        # يمكن إضافة التحقق من صلاحية الوصول للقضية هنا
-        pass
+    evidence = evidence_manager.get_evidence_file(evidence_id)
+    if not evidence or not evidence["file_path"] or not os.path.isfile(evidence["file_path"]):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="ملف الدليل غير موجود"
+        )
     
-    return info
+    size = os.path.getsize(evidence["file_path"])
+    filename = evidence["filename"] or os.path.basename(evidence["file_path"])
+    # الوسم القوي هو بصمة SHA-256 المخزنة للمحتوى
+    etag = f'"{evidence["file_hash"]}"'
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Cache-Control": "private, no-transform",
+        "Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}"
+    }
+    
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    # If-Range: النطاق صالح فقط إذا لم يتغير المحتوى منذ الجزء السابق
+    if if_range and if_range.strip() != etag:
+        range_header = None
+    
+    try:
+        byte_range = parse_range_header(range_header, size)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="نطاق البيانات المطلوب غير صالح",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    
+    start, end = byte_range or (0, size - 1)
+    
+    # التحقق من أجزاء Merkle التي يغطيها النطاق قبل إرسالها
+    if byte_range:
+        corrupt = await run_in_threadpool(evidence_manager.verify_range, evidence_id, start, end)
+        if corrupt:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail={
+                    "message": "محتوى الدليل في النطاق المطلوب لا يطابق بصمته المخزنة",
+                    "corrupt_chunks": corrupt
+                }
+            )
+    
+    log_audit_batched(
+        current_user.id,
+        "DOWNLOAD",
+        "EVIDENCE",
+        evidence_id,
+        f"تنزيل الدليل: {filename}" + (f" (بايت {start}-{end})" if byte_range else "")
+    )
+    
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return FileRangeResponse(
+            evidence["file_path"], start, end,
+            status_code=status.HTTP_206_PARTIAL_CONTENT,
+            headers=headers,
+            media_type=media_type
+        )
+    
+    return FileRangeResponse(evidence["file_path"], start, end, headers=headers, media_type=media_type)
 
 @router.get("/{evidence_id}/verify")
 async def verify_evidence(
     evidence_id: int,
+    mode: str = "full",
+    resume: bool = False,
     current_user: User = Depends(get_current_user)
 ):
-    """التحقق من سلامة الدليل"""
-    is_valid = evidence_manager.verify_integrity(evidence_id)
+    """التحقق من سلامة الدليل
+
+    mode=full يعيد حساب بصمة SHA-256 القانونية، و mode=chunks يتحقق من أجزاء Merkle
+    بالتوازي ويحدد مواضع التلف (resume لإكمال تحقق سابق انقطع).
+    """
+    _ensure_evidence_access(current_user, evidence_id)
+    
+    if mode not in ("full", "chunks"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="نمط تحقق غير معروف"
+        )
+    
+    if mode == "chunks":
+        result = await run_in_threadpool(evidence_manager.verify_chunks, evidence_id, resume)
+        if not result:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="ملف الدليل غير موجود"
+            )
+        
+        log_audit(
+            current_user.id,
+            "VERIFY",
+            "EVIDENCE",
+            evidence_id,
+            f"التحقق من أجزاء الدليل: {'ناجح' if result['verified'] else 'فشل'}"
+            + (f" ({len(result['corrupt_chunks'])} جزء تالف)" if result.get("corrupt_chunks") else "")
+        )
+        
+        return {**result, "verified_at": datetime.now().isoformat()}
+    
+    is_valid = await run_in_threadpool(evidence_manager.verify_integrity, evidence_id)
     
     log_audit(
         current_user.id,
@@ -121,3 +514,24 @@ async def verify_evidence(
         "integrity_verified": is_valid,
         "verified_at": datetime.now().isoformat()
     }
+
+@router.get("/{evidence_id}/near-duplicates")
+async def get_evidence_near_duplicates(
+    evidence_id: int,
+    limit: int = 20,
+    current_user: User = Depends(get_current_user)
+):
+    """الأدلة والقضايا التي يشبه نصها نص الدليل (وصفه ومحتوى ملفه النصي)"""
+    if not 1 <= limit <= 100:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="معاملات الترقيم غير صالحة"
+        )
+    
+    _ensure_evidence_access(current_user, evidence_id)
+    
+    matches = await run_in_threadpool(near_duplicates.find_similar, "evidence", evidence_id, None, limit) or []
+    return {
+        "evidence_id": evidence_id,
+        "matches": [m for m in matches if m["case_db_id"] and case_access.can_access(current_user, m["case_db_id"])]
+    }
@@ -0,0 +1,142 @@
+from fastapi import APIRouter, Depends, HTTPException, Header, status
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime
+
+from app.api.auth import User
+from app.core.security import get_current_user, check_permission, log_audit
+from app.core.http_utils import parse_range_header, etag_matches
+from app.core.access import case_access
+from app.modules.report_gen.bulk_exporter import BulkReportExporter
+from app.modules.report_gen.report_generator import ReportGenerator
+
+router = APIRouter()
+bulk_exporter = BulkReportExporter()
+
+class BulkReportRequest(BaseModel):
+    case_ids: Optional[List[str]] = None
+    network_id: Optional[str] = None
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+    report_type: str = "detailed"
+
+@router.post("/bulk")
+async def generate_bulk_reports(
+    request_data: BulkReportRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """توليد تقارير متعددة وبثها كأرشيف ZIP"""
+    if not check_permission(current_user.role, "reporter"):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="غير مصرح لك بتوليد التقارير"
+        )
+
+    if not (request_data.case_ids or request_data.network_id
+            or request_data.date_from or request_data.date_to):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="يجب تحديد قائمة قضايا أو شبكة أو نطاق زمني"
+        )
+
+    # القضايا المطلوبة بالاسم يجب أن تكون كلها ضمن صلاحيات المستخدم
+    if request_data.case_ids:
+        requested = bulk_exporter.resolve_case_ids(case_ids=request_data.case_ids)
+        if not all(case_access.can_access(current_user, case_id) for case_id in requested):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="غير مصرح لك بالوصول إلى بعض القضايا المطلوبة"
+            )
+
+    # الشبكة والنطاق الزمني يقتصران على القضايا المتاحة
+    case_ids = bulk_exporter.resolve_case_ids(
+        case_ids=request_data.case_ids,
+        network_id=request_data.network_id,
+        date_from=request_data.date_from,
+        date_to=request_data.date_to,
+        access_filter=lambda column: case_access.sql_filter(current_user, column)
+    )
+
+    if not case_ids:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="لا توجد قضايا مطابقة"
+        )
+
+    log_audit(
+        current_user.id,
+        "BULK_EXPORT",
+        "REPORT",
+        None,
+        f"توليد {len(case_ids)} تقرير كأرشيف مجمع"
+    )
+
+    filename = f"reports_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    return StreamingResponse(
+        bulk_exporter.stream_zip(case_ids, request_data.report_type),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.get("/{report_id}/download")
+async def download_report(
+    report_id: str,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
+    """تنزيل محتوى التقرير بشكل متدفق مع دعم ETag و Range"""
+    report_generator = ReportGenerator()
+    report = report_generator.get_report_metadata(report_id)
+    
+    if not report:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="التقرير غير موجود"
+        )
+    
+    if not case_access.can_access(current_user, report["case_id"]):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="غير مصرح لك بالوصول إلى هذه القضية"
+        )
+    
+    size = report["content_size"] or 0
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{report_id}.txt"'
+    }
+    if report["content_hash"]:
+        headers["ETag"] = f'"{report["content_hash"]}"'
+        if etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    try:
+        byte_range = parse_range_header(range_header, size)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="نطاق البيانات المطلوب غير صالح",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    
+    log_audit(current_user.id, "DOWNLOAD", "REPORT", report["id"], f"تنزيل التقرير: {report_id}")
+    
+    if byte_range:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(
+            report_generator.iter_report_content(report, start, end),
+            status_code=status.HTTP_206_PARTIAL_CONTENT,
+            media_type="text/plain; charset=utf-8",
+            headers=headers
+        )
+    
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(
+        report_generator.iter_report_content(report),
+        media_type="text/plain; charset=utf-8",
+        headers=headers
+    )
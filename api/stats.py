@@ -0,0 +1,59 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime, timedelta
+import sqlite3
+
+from app.core.security import User, get_current_user
+from app.core.access import case_access
+from app.database import CASE_STATS_DIMENSIONS
+
+router = APIRouter()
+
+@router.get("/")
+async def get_case_statistics(
+    days: int = 30,
+    current_user: User = Depends(get_current_user)
+):
+    """إحصائيات القضايا للوحة التحكم (تُقرأ من العدادات المجمعة مباشرة)"""
+    # العدادات تشمل كل القضايا، فلا تُعرض إلا لمن يصل إلى كل القضايا
+    if not case_access.has_global_access(current_user):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="غير مصرح لك بعرض إحصائيات القضايا"
+        )
+
+    if not 1 <= days <= 366:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="عدد الأيام غير صالح"
+        )
+
+    since = (datetime.utcnow() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+
+    conn = sqlite3.connect("cybershield.db")
+    cursor = conn.cursor()
+
+    # العدادات الصفرية تبقى في الجدول بعد نقل القضايا لقيمة أخرى
+    cursor.execute('''
+    SELECT dimension, key, count FROM case_stats
+    WHERE count > 0 AND (dimension != 'day' OR key >= ?)
+    ''', (since,))
+    rows = cursor.fetchall()
+    conn.close()
+
+    stats = {dimension: {} for dimension in CASE_STATS_DIMENSIONS}
+    total = 0
+    for dimension, key, count in rows:
+        if dimension == "total":
+            total = count
+        else:
+            stats[dimension][key] = count
+
+    return {
+        "total_cases": total,
+        "by_status": stats["status"],
+        "by_violation_type": stats["violation_type"],
+        "by_priority": stats["priority"],
+        "by_assignee": stats["assignee"],
+        "by_day": dict(sorted(stats["day"].items())),
+        "generated_at": datetime.now().isoformat()
+    }
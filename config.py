@@ -13,11 +13,130 @@ class Settings:
     SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
     ALGORITHM = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES = 30
+    TOKEN_CACHE_SIZE = 10000
+    USER_CACHE_TTL_SECONDS = 30
+    TOKEN_REVOCATION_REFRESH_SECONDS = 5  # مزامنة التوكنات الملغاة من العمليات الأخرى
+    
+    # مجمع تشفير كلمات المرور (bcrypt)
+    BCRYPT_ROUNDS = 12
+    PASSWORD_HASH_WORKERS = 4
+    PASSWORD_HASH_QUEUE_SIZE = 32
+    PASSWORD_HASH_RETRY_AFTER = 2
+    
+    # الكتابة المجمعة لسجل التدقيق
+    AUDIT_BATCH_SIZE = 200
+    AUDIT_BATCH_INTERVAL_SECONDS = 1.0
     
     # إعدادات التخزين
     UPLOAD_DIR = "app/static/uploads"
     MAX_UPLOAD_SIZE = 50 * 1024 * 1024  # 50MB
     
+    # الرفع القابل للاستئناف على أجزاء
+    UPLOAD_STAGING_DIR = "app/upload_staging"
+    UPLOAD_CHUNK_MAX_SIZE = 16 * 1024 * 1024  # 16MB
+    RESUMABLE_UPLOAD_MAX_SIZE = 4 * 1024 * 1024 * 1024  # 4GB
+    UPLOAD_SESSION_TTL_HOURS = 24
+    UPLOAD_WRITE_LEASE_SECONDS = 300  # حجز الجلسة لكاتب واحد (يُجدد أثناء الكتابة)
+    
+    CONTENT_STORE_DIR = "app/content_store"
+    CONTENT_STORE_COMPRESSION_LEVEL = 6
+    EVIDENCE_BLOOM_CAPACITY = 1_000_000
+    EVIDENCE_BLOOM_ERROR_RATE = 0.001
+    
+    # بصمات أجزاء الأدلة (شجرة Merkle)
+    MERKLE_CHUNK_SIZE = 4 * 1024 * 1024  # 4MB
+    MERKLE_HASH_WORKERS = os.cpu_count() or 4
+    MERKLE_REVERIFY_SECONDS = 300  # مدة الثقة بتحقق جزء قبل إعادة فحصه عند التنزيل
+    
+    # أرشفة الروابط
+    ARCHIVE_WORKERS = 8
+    ARCHIVE_PER_HOST_CONCURRENCY = 2
+    ARCHIVE_MAX_BYTES = 50 * 1024 * 1024  # 50MB
+    ARCHIVE_TIMEOUT_SECONDS = 30
+    ARCHIVE_CONNECT_TIMEOUT_SECONDS = 10
+    ARCHIVE_MAX_URLS_PER_JOB = 500
+    ARCHIVE_ALLOW_PRIVATE_HOSTS = os.getenv("ARCHIVE_ALLOW_PRIVATE_HOSTS", "").lower() in ("1", "true")
+    ARCHIVE_USER_AGENT = "AbuJamal-CyberShield-Archiver/1.0"
+    
+    # استيراد الأدلة من ملفات ZIP/TAR
+    INGEST_MAX_ARCHIVE_SIZE = 8 * 1024 * 1024 * 1024  # 8GB
+    INGEST_MAX_EXTRACTED_SIZE = 32 * 1024 * 1024 * 1024  # 32GB (حماية من الملفات المضغوطة المفخخة)
+    INGEST_MAX_MEMBERS = 50_000
+    INGEST_WORKERS = os.cpu_count() or 4
+    
+    # استخراج البيانات الوصفية للأدلة في الخلفية
+    METADATA_WORKERS = 2
+    METADATA_QUEUE_SIZE = 10_000
+    METADATA_SNIFF_BYTES = 256 * 1024  # ترويسة الملف (التوقيع، أبعاد الصورة، EXIF)
+    METADATA_TEXT_EXCERPT_CHARS = 2000
+    
+    # فهرسة نصوص ملفات الأدلة للبحث
+    CONTENT_INDEX_WORKERS = 2
+    CONTENT_INDEX_QUEUE_SIZE = 10_000
+    CONTENT_INDEX_CHUNK_CHARS = 32 * 1024
+    CONTENT_INDEX_BATCH_ROWS = 64
+    
+    # كشف النصوص شبه المكررة (MinHash/LSH)
+    NEAR_DUP_NUM_PERM = 128  # عدد قيم البصمة
+    NEAR_DUP_BANDS = 32  # نطاقات LSH (4 قيم لكل نطاق)
+    NEAR_DUP_SHINGLE_SIZE = 3  # عدد الكلمات في المقطع
+    NEAR_DUP_THRESHOLD = 0.5  # أدنى تشابه Jaccard تقديري للنتائج
+    NEAR_DUP_MAX_TEXT_CHARS = 500_000  # ما بعد ذلك من نص الملف لا يدخل في البصمة
+    NEAR_DUP_POLL_SECONDS = 5
+    NEAR_DUP_BATCH_SIZE = 100
+    
+    # مطابقة جهات اتصال المبلغين والمشتبه بهم
+    CONTACT_DEFAULT_COUNTRY_CODE = "966"  # للأرقام المحلية مثل 05xxxxxxxx
+    CONTACT_MATCH_THRESHOLD = 0.85  # أدنى تشابه بين قيمتين في نفس مفتاح التجميع
+    CONTACT_BLOCK_MAX_CANDIDATES = 500  # حد المرشحين لكل مفتاح تجميع
+    CONTACT_RESUME_BATCH_SIZE = 1000
+    
+    # إعدادات الاستيراد بالجملة
+    CASE_IMPORT_BATCH_SIZE = 500
+    CASE_IMPORT_MAX_RECORD_CHARS = 1024 * 1024  # أقصى حجم لسجل CSV واحد (الحقول متعددة الأسطر)
+    CASE_BULK_UPDATE_MAX = 5000
+    
+    # طابور العمل: الحالات التي يسحب منها كل دور
+    WORK_QUEUE_STATUSES = {
+        "admin": ["new", "under_analysis", "evidence_collected", "network_linked", "escalated"],
+        "analyst": ["new", "under_analysis", "escalated"],
+        "reporter": ["evidence_collected", "network_linked"],
+        "intake": ["new"]
+    }
+    CASE_LEASE_MINUTES = 60
+    
+    # صلاحيات الوصول لكل قضية
+    CASE_ACCESS_GLOBAL_ROLES = ["admin"]
+    CASE_ACCESS_CACHE_TTL_SECONDS = 60
+    
+    # تحديد معدل الطلبات لكل فئة مسار (معدل بالثانية، رصيد أقصى، حد التزامن، مهلة الانتظار)
+    RATE_LIMIT_ENABLED = True
+    RATE_LIMIT_SHARED_DB = os.getenv("RATE_LIMIT_SHARED_DB")  # ملف SQLite مشترك بين العمليات
+    RATE_LIMIT_CLASSES = {
+        "login": {"user_rate": 0.2, "user_burst": 5, "route_rate": 20, "route_burst": 50,
+                  "concurrency": 8, "queue_timeout": 2},
+        "upload": {"user_rate": 1, "user_burst": 10, "route_rate": 10, "route_burst": 40,
+                   "concurrency": 4, "queue_timeout": 10},
+        "upload_chunk": {"user_rate": 5, "user_burst": 20, "route_rate": 50, "route_burst": 200,
+                         "concurrency": 8, "queue_timeout": 10},
+        "verify": {"user_rate": 0.5, "user_burst": 5, "route_rate": 5, "route_burst": 20,
+                   "concurrency": 2, "queue_timeout": 5},
+        "report": {"user_rate": 0.2, "user_burst": 3, "route_rate": 2, "route_burst": 10,
+                   "concurrency": 2, "queue_timeout": 10},
+        "bulk": {"user_rate": 0.1, "user_burst": 2, "route_rate": 1, "route_burst": 4,
+                 "concurrency": 1, "queue_timeout": 5},
+        "default": {"user_rate": 20, "user_burst": 60, "concurrency": 64, "queue_timeout": 5}
+    }
+    
+    # إعدادات موجز التغييرات (SSE)
+    EVENT_BUFFER_SIZE = 1000
+    EVENT_QUEUE_SIZE = 500
+    EVENT_HEARTBEAT_SECONDS = 15
+    
+    # إعدادات التقارير
+    REPORT_BULK_WORKERS = 4
+    REPORT_BULK_MAX_CASES = 1000
+    
     # الأدوار
     ROLES = {
         "admin": "المسؤول العام",
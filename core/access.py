@@ -0,0 +1,111 @@
+import sqlite3
+import threading
+import time
+from typing import FrozenSet, Iterable, Optional, Tuple
+
+from app.config import settings
+
+
+class CaseAccessIndex:
+    """صلاحيات الوصول لكل قضية (المسند إليه، الفريق، المنح الصريح)
+
+    الصلاحيات مخزنة في جدول case_access المفهرس (تحدّثه المشغلات عند الإسناد)،
+    وتُحمّل لكل مستخدم كمجموعة معرفات في الذاكرة ليكون التحقق بحث مجموعة فقط.
+    """
+
+    # استعلام القضايا المتاحة للمستخدم مباشرة أو عبر فرقه
+    ACCESSIBLE_CASES_SQL = '''
+    SELECT case_id FROM case_access
+    WHERE principal_type = 'user' AND principal_id = ?
+    UNION
+    SELECT ca.case_id FROM case_access ca
+    JOIN team_members tm ON tm.team_id = ca.principal_id
+    WHERE ca.principal_type = 'team' AND tm.user_id = ?
+    '''
+
+    def __init__(self, ttl_seconds: int = None):
+        self.ttl_seconds = ttl_seconds or settings.CASE_ACCESS_CACHE_TTL_SECONDS
+        self._lock = threading.Lock()
+        self._cache = {}
+
+    def has_global_access(self, user) -> bool:
+        return user.role in settings.CASE_ACCESS_GLOBAL_ROLES
+
+    def accessible_case_ids(self, user_id: int) -> FrozenSet[int]:
+        """مجموعة القضايا المتاحة للمستخدم (من الذاكرة أو قاعدة البيانات)"""
+        now = time.time()
+        with self._lock:
+            cached = self._cache.get(user_id)
+            if cached and cached[1] > now:
+                return cached[0]
+
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.ACCESSIBLE_CASES_SQL, (user_id, user_id))
+            case_ids = frozenset(row[0] for row in cursor.fetchall())
+        finally:
+            conn.close()
+
+        with self._lock:
+            self._cache[user_id] = (case_ids, now + self.ttl_seconds)
+        return case_ids
+
+    def can_access(self, user, case_db_id: int) -> bool:
+        if self.has_global_access(user):
+            return True
+        return case_db_id in self.accessible_case_ids(user.id)
+
+    def sql_filter(self, user, column: str = "id") -> Tuple[str, list]:
+        """شرط SQL لتصفية القوائم بالقضايا المتاحة (فارغ للأدوار العامة)"""
+        if self.has_global_access(user):
+            return "", []
+        return f" AND {column} IN ({self.ACCESSIBLE_CASES_SQL})", [user.id, user.id]
+
+    def invalidate(self, user_ids: Optional[Iterable[Optional[int]]] = None):
+        """إبطال الذاكرة بعد تغيير الإسناد أو المنح (None لإبطال الجميع)"""
+        with self._lock:
+            if user_ids is None:
+                self._cache.clear()
+                return
+            for user_id in user_ids:
+                self._cache.pop(user_id, None)
+
+    def grant(self, case_db_id: int, principal_type: str, principal_id: int, granted_by: int):
+        """منح صريح لمستخدم أو فريق"""
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            conn.execute('''
+            INSERT OR IGNORE INTO case_access (case_id, principal_type, principal_id, source, granted_by)
+            VALUES (?, ?, ?, 'grant', ?)
+            ''', (case_db_id, principal_type, principal_id, granted_by))
+            conn.commit()
+        finally:
+            conn.close()
+        self._invalidate_principal(principal_type, principal_id)
+
+    def revoke(self, case_db_id: int, principal_type: str, principal_id: int) -> bool:
+        """سحب منح صريح (لا يؤثر على صلاحية المسند إليه أو المنشئ)"""
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+            DELETE FROM case_access
+            WHERE case_id = ? AND principal_type = ? AND principal_id = ? AND source = 'grant'
+            ''', (case_db_id, principal_type, principal_id))
+            conn.commit()
+            removed = cursor.rowcount > 0
+        finally:
+            conn.close()
+        self._invalidate_principal(principal_type, principal_id)
+        return removed
+
+    def _invalidate_principal(self, principal_type: str, principal_id: int):
+        if principal_type == "user":
+            self.invalidate([principal_id])
+        else:
+            # أعضاء الفريق غير معروفين هنا دون استعلام إضافي
+            self.invalidate()
+
+
+case_access = CaseAccessIndex()
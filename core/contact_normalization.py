@@ -0,0 +1,159 @@
+import re
+from typing import List, Optional, Tuple
+
+from app.config import settings
+
+# الأرقام العربية الهندية والفارسية إلى أرقام لاتينية
+_DIGIT_TABLE = str.maketrans(
+    "٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹",
+    "01234567890123456789"
+)
+
+# مزودو البريد الذين يتجاهلون النقاط في اسم المستخدم
+DOTLESS_EMAIL_DOMAINS = {"gmail.com": "gmail.com", "googlemail.com": "gmail.com"}
+
+_EMAIL_RE = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
+_SOCIAL_URL_RE = re.compile(
+    r"(?<![\w-])(?:instagram|facebook|twitter|x|tiktok|snapchat|telegram|t)\.(?:com|me|org|net)/@?([A-Za-z0-9_.]{2,50})",
+    re.IGNORECASE
+)
+_MENTION_RE = re.compile(r"(?<![\w@])@([A-Za-z0-9_.]{2,50})")
+_PHONE_RE = re.compile(r"(?<![\w+])(?:\+|00)?\d(?:[\s\-.()]{0,2}\d){7,16}(?!\w)")
+_HANDLE_RE = re.compile(r"^[a-z0-9_.]{2,50}$")
+_DATE_RE = re.compile(r"\d{4}[-./]\d{1,2}[-./]\d{1,2}|\d{1,2}[-./]\d{1,2}[-./]\d{2,4}")
+
+# رموز دول المنطقة وأطوال أرقامها الوطنية: تُقبل بلا + في النص الحر إذا طابق الطول
+KNOWN_COUNTRY_CODES = {
+    "966": 9, "971": 9, "965": 8, "973": 8, "974": 8, "968": 8,
+    "962": 9, "964": 10, "963": 9, "961": 8, "970": 9, "967": 9, "20": 10,
+}
+
+# مقاطع روابط التواصل التي ليست أسماء حسابات
+_NON_HANDLE_PATHS = {"p", "reel", "reels", "watch", "share", "profile.php", "groups", "pages", "stories", "status"}
+
+MIN_PHONE_DIGITS = 8
+MIN_LOCAL_PHONE_DIGITS = 9
+MAX_PHONE_DIGITS = 15  # حد E.164
+
+
+def normalize_phone(value: str, country_code: str = None, strict: bool = False) -> Optional[str]:
+    """توحيد رقم الهاتف بصيغة E.164 (‎+9665xxxxxxxx) أو None إذا لم يكن رقمًا صالحًا
+
+    الأرقام المحلية (05xxxxxxxx أو 5xxxxxxxx) تُنسب إلى رمز الدولة الافتراضي.
+    في الوضع الصارم (أرقام من نص حر) يُقبل فقط ما له شكل الهاتف: بادئة + أو 00 أو 0،
+    أو رمز دولة معروف بطول رقم صحيح، ودون شكل التاريخ؛ ولا يُضاف الرمز الافتراضي لسلسلة أرقام مجردة.
+    """
+    country_code = country_code or settings.CONTACT_DEFAULT_COUNTRY_CODE
+    value = value.translate(_DIGIT_TABLE).strip()
+    digits = re.sub(r"\D", "", value)
+
+    if strict:
+        if _DATE_RE.search(value):
+            return None
+        if not value.startswith("+") and not digits.startswith("0") and not any(
+            digits.startswith(code) and len(digits) - len(code) == length
+            for code, length in KNOWN_COUNTRY_CODES.items()
+        ):
+            return None
+
+    if value.startswith("+"):
+        pass
+    elif digits.startswith("00"):
+        digits = digits[2:]
+    elif len(digits) < MIN_LOCAL_PHONE_DIGITS:
+        # أرقام قصيرة بلا رمز دولة (تواريخ ومبالغ غالبًا)
+        return None
+    elif digits.startswith("0"):
+        digits = country_code + digits[1:]
+    elif not (digits.startswith(country_code) and len(digits) > len(country_code) + MIN_PHONE_DIGITS):
+        digits = country_code + digits
+
+    if not MIN_PHONE_DIGITS <= len(digits) <= MAX_PHONE_DIGITS:
+        return None
+    return "+" + digits
+
+
+def phone_block_key(phone: str) -> str:
+    """آخر 9 أرقام (رقم المشترك): يجمع الرقم نفسه مهما اختلف رمز الدولة المُدخل"""
+    return phone[-9:]
+
+
+def normalize_email(value: str) -> Optional[str]:
+    """توحيد البريد: أحرف صغيرة وحذف الوسم (+tag)، وحذف النقاط لدى مزودي Gmail"""
+    value = value.strip().lower()
+    local, _, domain = value.rpartition("@")
+    local = local.split("+", 1)[0]
+    if not local or "." not in domain:
+        return None
+    if domain in DOTLESS_EMAIL_DOMAINS:
+        local = local.replace(".", "")
+        domain = DOTLESS_EMAIL_DOMAINS[domain]
+    return f"{local}@{domain}"
+
+
+def email_block_key(email: str) -> str:
+    """اسم المستخدم بلا نقاط: يجمع الحساب نفسه لدى مزودين مختلفين"""
+    return email.split("@", 1)[0].replace(".", "")
+
+
+def normalize_handle(value: str) -> Optional[str]:
+    """توحيد اسم حساب التواصل: أحرف صغيرة بلا @ (الأرقام المجردة ليست أسماء حسابات)"""
+    value = value.strip().lstrip("@").lower()
+    if not _HANDLE_RE.match(value) or value.replace(".", "").replace("_", "").isdigit():
+        return None
+    return value
+
+
+def handle_block_key(handle: str) -> str:
+    """اسم الحساب بلا فواصل: abu.jamal وabu_jamal في نفس المجموعة"""
+    return handle.replace(".", "").replace("_", "")
+
+
+def _contact(kind: str, value: Optional[str]) -> Optional[Tuple[str, str, str]]:
+    if not value:
+        return None
+    block_key = {"phone": phone_block_key, "email": email_block_key, "handle": handle_block_key}[kind](value)
+    return kind, value, block_key
+
+
+def extract_contacts(text: str, strict_phones: bool = True) -> List[Tuple[str, str, str]]:
+    """استخراج جهات الاتصال من نص حر: (النوع، القيمة الموحدة، مفتاح التجميع) بلا تكرار
+
+    strict_phones يقصر الهواتف على الأرقام ذات شكل الهاتف حتى لا تُعد التواريخ وأرقام المراجع هواتف.
+    """
+    if not text:
+        return []
+
+    contacts = []
+    for match in _EMAIL_RE.findall(text):
+        contacts.append(_contact("email", normalize_email(match)))
+    # حذف عناوين البريد حتى لا يُلتقط نطاقها كاسم حساب أو أرقامها كهاتف
+    text = _EMAIL_RE.sub(" ", text)
+
+    for match in _SOCIAL_URL_RE.findall(text):
+        if match.lower() not in _NON_HANDLE_PATHS:
+            contacts.append(_contact("handle", normalize_handle(match)))
+    text = _SOCIAL_URL_RE.sub(" ", text)
+
+    for match in _MENTION_RE.findall(text):
+        contacts.append(_contact("handle", normalize_handle(match)))
+
+    for match in _PHONE_RE.findall(text):
+        contacts.append(_contact("phone", normalize_phone(match, strict=strict_phones)))
+
+    return list(dict.fromkeys(contact for contact in contacts if contact))
+
+
+def parse_contact_field(value: str) -> List[Tuple[str, str, str]]:
+    """جهات الاتصال من حقل مخصص لها (مثل reporter_contact)
+
+    الحقل قد يحوي أكثر من جهة اتصال؛ وإن لم يُعثر على هاتف أو بريد أو رابط
+    فالقيمة المفردة تُعامل كاسم حساب (مثل abu_jamal بلا @).
+    """
+    # الحقل مخصص لجهة الاتصال، فالأرقام المحلية بلا بادئة (5xxxxxxxx) مقبولة
+    contacts = extract_contacts(value, strict_phones=False)
+    if not contacts and value and len(value.split()) == 1:
+        handle = _contact("handle", normalize_handle(value))
+        if handle:
+            contacts.append(handle)
+    return contacts
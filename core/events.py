@@ -0,0 +1,130 @@
+import asyncio
+import json
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+from app.config import settings
+
+
+class EventSubscription:
+    """اشتراك عميل في موجز التغييرات مع مرشحات اختيارية"""
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        start_id: int,
+        case_ids: Optional[Iterable[int]] = None,
+        statuses: Optional[Iterable[str]] = None,
+        event_types: Optional[Iterable[str]] = None,
+        queue_size: int = 500
+    ):
+        self.loop = loop
+        self.start_id = start_id
+        self.case_ids = set(case_ids or [])
+        self.statuses = set(statuses or [])
+        self.event_types = set(event_types or [])
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def matches(self, event: dict) -> bool:
+        if self.case_ids and event["case_id"] not in self.case_ids:
+            return False
+        if self.statuses and event["status"] not in self.statuses:
+            return False
+        if self.event_types and event["type"] not in self.event_types:
+            return False
+        return True
+
+    def _deliver(self, event: dict):
+        # يعمل داخل حلقة الأحداث الخاصة بالمشترك
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # العميل البطيء يُفصل ويستأنف لاحقًا عبر Last-Event-ID
+            self.overflowed = True
+
+
+class EventBus:
+    """ناقل أحداث داخل العملية يغذي موجز التغييرات (SSE)
+
+    النشر آمن من أي خيط، وآخر الأحداث تُحفظ في ذاكرة دائرية لاستئناف الاتصال.
+    """
+
+    def __init__(self, buffer_size: int = None, queue_size: int = None):
+        self._lock = threading.Lock()
+        self._buffer = deque(maxlen=buffer_size or settings.EVENT_BUFFER_SIZE)
+        self._queue_size = queue_size or settings.EVENT_QUEUE_SIZE
+        self._last_id = 0
+        self._subscribers = set()
+
+    def publish(
+        self,
+        event_type: str,
+        case_id: Optional[int] = None,
+        status: Optional[str] = None,
+        **data
+    ) -> dict:
+        """نشر حدث لجميع المشتركين المطابقين"""
+        with self._lock:
+            self._last_id += 1
+            event = {
+                "id": self._last_id,
+                "type": event_type,
+                "case_id": case_id,
+                "status": status,
+                "data": data,
+                "timestamp": datetime.now().isoformat()
+            }
+            self._buffer.append(event)
+            subscribers = list(self._subscribers)
+
+        for subscription in subscribers:
+            if subscription.matches(event):
+                try:
+                    subscription.loop.call_soon_threadsafe(subscription._deliver, event)
+                except RuntimeError:
+                    # حلقة الأحداث أُغلقت
+                    pass
+
+        return event
+
+    def subscribe(self, **filters) -> EventSubscription:
+        """الاشتراك في الأحداث الجديدة (يجب استدعاؤها من داخل حلقة أحداث)"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            subscription = EventSubscription(loop, self._last_id, queue_size=self._queue_size, **filters)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: EventSubscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def replay(self, after_id: int, subscription: EventSubscription) -> Tuple[List[dict], bool]:
+        """الأحداث المطابقة بعد after_id وحتى بداية الاشتراك
+
+        القيمة الثانية False إذا لم يعد المخزن يحتوي كل الأحداث المفقودة
+        (أو كان المعرف من تشغيل سابق) ويجب على العميل إعادة تحميل البيانات.
+        """
+        with self._lock:
+            events = list(self._buffer)
+
+        if after_id > subscription.start_id:
+            return [], False
+
+        complete = not events or events[0]["id"] <= after_id + 1
+        missed = [
+            event for event in events
+            if after_id < event["id"] <= subscription.start_id and subscription.matches(event)
+        ]
+        return missed, complete
+
+
+def format_sse(event: dict) -> str:
+    """تنسيق الحدث حسب بروتوكول Server-Sent Events"""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+event_bus = EventBus()
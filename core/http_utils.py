@@ -0,0 +1,124 @@
+import os
+from typing import Mapping, Optional, Tuple
+
+import anyio
+from starlette.responses import Response
+
+
+def parse_range_header(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """تحليل ترويسة Range (نطاق واحد) وإرجاع (البداية، النهاية) شاملة
+
+    ترجع None إذا لم تُرسل الترويسة، وترفع ValueError إذا كان النطاق غير قابل للتلبية.
+    """
+    if not range_header:
+        return None
+
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        raise ValueError("نطاق غير مدعوم")
+
+    start_str, _, end_str = spec.strip().partition("-")
+
+    try:
+        if start_str == "":
+            # صيغة اللاحقة: آخر N بايت
+            length = int(end_str)
+            if length <= 0:
+                raise ValueError("نطاق غير صالح")
+            start = max(size - length, 0)
+            end = size - 1
+        else:
+            start = int(start_str)
+            end = int(end_str) if end_str else size - 1
+            end = min(end, size - 1)
+    except (TypeError, ValueError):
+        raise ValueError("نطاق غير صالح")
+
+    if start < 0 or start > end or start >= size:
+        raise ValueError("نطاق غير قابل للتلبية")
+
+    return start, end
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """مقارنة ضعيفة لترويسة If-None-Match مع وسم الكيان"""
+    if not if_none_match:
+        return False
+
+    if if_none_match.strip() == "*":
+        return True
+
+    def _opaque(tag: str) -> str:
+        tag = tag.strip()
+        return tag[2:] if tag.startswith("W/") else tag
+
+    return _opaque(etag) in [_opaque(tag) for tag in if_none_match.split(",")]
+
+
+class FileRangeResponse(Response):
+    """إرسال ملف كامل أو نطاق منه دون تحميله في الذاكرة
+
+    يستخدم امتداد ASGI للإرسال دون نسخ (http.response.zerocopy) إذا دعمه الخادم،
+    وإلا يقرأ أجزاء بـ os.pread من الموضع المطلوب مباشرة.
+    """
+
+    chunk_size = 256 * 1024
+
+    def __init__(
+        self,
+        path: str,
+        start: int,
+        end: int,
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+        media_type: Optional[str] = None
+    ):
+        self.path = path
+        self.start = start
+        self.count = max(0, end - start + 1)
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        headers = dict(headers or {})
+        headers["Content-Length"] = str(self.count)
+        self.init_headers(headers)
+
+    async def __call__(self, scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+
+        if scope.get("method") == "HEAD" or not self.count:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        fd = await anyio.to_thread.run_sync(os.open, self.path, os.O_RDONLY)
+        try:
+            if "http.response.zerocopy" in scope.get("extensions", {}):
+                await send({
+                    "type": "http.response.zerocopy",
+                    "file": fd,
+                    "offset": self.start,
+                    "count": self.count,
+                    "more_body": False,
+                })
+                return
+
+            offset = self.start
+            remaining = self.count
+            while remaining:
+                chunk = await anyio.to_thread.run_sync(
+                    os.pread, fd, min(self.chunk_size, remaining), offset
+                )
+                if not chunk:
+                    # الملف قُصّ أثناء الإرسال
+                    break
+                offset += len(chunk)
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": bool(remaining)})
+            if remaining:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            os.close(fd)
@@ -0,0 +1,218 @@
+import asyncio
+import json
+import math
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.core.security import decode_access_token
+
+
+# تصنيف المسارات المكلفة (الطريقة، نمط المسار، فئة المسار)
+# المسارات غير المذكورة تتبع الفئة default
+ROUTE_CLASSES = [
+    ("POST", re.compile(r"^/api/auth/token$"), "login"),
+    ("POST", re.compile(r"^/api/evidence/(upload|archive-url|archive|uploads)$"), "upload"),
+    ("PUT", re.compile(r"^/api/evidence/uploads/[^/]+$"), "upload_chunk"),
+    ("POST", re.compile(r"^/api/evidence/uploads/[^/]+/finalize$"), "upload_chunk"),
+    ("GET", re.compile(r"^/api/evidence/\d+(/verify)?$"), "verify"),
+    ("POST", re.compile(r"^/api/reports/"), "report"),
+    ("GET", re.compile(r"^/api/reports/[^/]+/download$"), "report"),
+    ("POST", re.compile(r"^/api/cases/import$"), "bulk"),
+    ("POST", re.compile(r"^/api/evidence/ingest$"), "bulk"),
+    ("GET", re.compile(r"^/api/cases/export$"), "bulk"),
+    ("PUT", re.compile(r"^/api/cases/bulk$"), "bulk"),
+]
+
+# اتصالات طويلة لا تُحتسب ضمن حد التزامن
+EXEMPT_PATHS = ("/api/events/stream", "/static/")
+
+
+def classify_route(method: str, path: str) -> Optional[str]:
+    if path.startswith(EXEMPT_PATHS):
+        return None
+    for route_method, pattern, route_class in ROUTE_CLASSES:
+        if method == route_method and pattern.match(path):
+            return route_class
+    return "default"
+
+
+class MemoryBucketStore:
+    """دلاء الرموز في ذاكرة العملية"""
+
+    blocking = False
+    MAX_BUCKETS = 100000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        """سحب رموز من الدلو؛ يعيد 0 عند السماح أو عدد الثواني حتى يتوفر الرصيد"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.MAX_BUCKETS:
+                self._prune(now)
+        return (cost - tokens) / rate
+
+    def _prune(self, now: float):
+        # الدلاء الخاملة منذ ساعة ممتلئة بالتأكيد ويمكن حذفها
+        idle = [key for key, (_, updated) in self._buckets.items() if now - updated > 3600]
+        for key in idle:
+            del self._buckets[key]
+
+
+class SqliteBucketStore:
+    """دلاء رموز مشتركة بين عدة عمليات عبر ملف SQLite"""
+
+    blocking = True
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            ) WITHOUT ROWID
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        # الساعة الحقيقية لأن العمليات لا تتشارك time.monotonic
+        now = time.time()
+        conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?", (key,)
+            ).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute('''
+            INSERT INTO rate_limit_buckets (key, tokens, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at
+            ''', (key, tokens, now))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return 0.0 if allowed else (cost - tokens) / rate
+
+
+class RateLimitMiddleware:
+    """تحديد معدل الطلبات وحماية المسارات المكلفة من الحمل الزائد
+
+    لكل فئة مسار: دلو رموز لكل مستخدم، ودلو مشترك للفئة، وحد للطلبات المتزامنة.
+    الطلب الذي يتجاوز الحد ينتظر دوره حتى مهلة محددة ثم يُرفض مع Retry-After،
+    فلا يؤثر تحميل فئة واحدة على بقية الفئات.
+    """
+
+    def __init__(self, app, store=None, classes: Dict[str, dict] = None):
+        self.app = app
+        self.classes = classes or settings.RATE_LIMIT_CLASSES
+        if store is None:
+            store = (
+                SqliteBucketStore(settings.RATE_LIMIT_SHARED_DB)
+                if settings.RATE_LIMIT_SHARED_DB else MemoryBucketStore()
+            )
+        self.store = store
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._waiting: Dict[str, int] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        route_class = classify_route(scope["method"], scope["path"])
+        limits = self.classes.get(route_class) if route_class else None
+        if not limits:
+            await self.app(scope, receive, send)
+            return
+
+        # دلو المستخدم أولًا: الطلبات المرفوضة لمستخدم متجاوز لا تستهلك رصيد الفئة المشترك
+        principal = self._principal(scope)
+        retry_after = await self._take(
+            f"{principal}:{route_class}", limits.get("user_rate"), limits.get("user_burst")
+        )
+        if not retry_after:
+            retry_after = await self._take(f"route:{route_class}", limits.get("route_rate"), limits.get("route_burst"))
+        if retry_after:
+            await self._reject(send, 429, "تم تجاوز الحد المسموح من الطلبات، حاول لاحقًا", retry_after)
+            return
+
+        semaphore = self._semaphores.get(route_class)
+        if semaphore is None:
+            semaphore = self._semaphores[route_class] = asyncio.Semaphore(limits["concurrency"])
+
+        # رفض فوري إذا امتلأ طابور الانتظار
+        if semaphore.locked() and self._waiting.get(route_class, 0) >= limits.get("max_waiting", limits["concurrency"]):
+            await self._reject(send, 503, "الخدمة مشغولة حاليًا، حاول لاحقًا", limits["queue_timeout"])
+            return
+
+        self._waiting[route_class] = self._waiting.get(route_class, 0) + 1
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=limits["queue_timeout"])
+        except asyncio.TimeoutError:
+            await self._reject(send, 503, "الخدمة مشغولة حاليًا، حاول لاحقًا", limits["queue_timeout"])
+            return
+        finally:
+            self._waiting[route_class] -= 1
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            semaphore.release()
+
+    async def _take(self, key: str, rate: Optional[float], burst: Optional[float]) -> float:
+        if not rate:
+            return 0.0
+        if self.store.blocking:
+            return await run_in_threadpool(self.store.take, key, rate, burst)
+        return self.store.take(key, rate, burst)
+
+    def _principal(self, scope) -> str:
+        """هوية الطالب: معرف المستخدم من التوكن أو عنوان IP"""
+        for name, value in scope.get("headers", []):
+            if name == b"authorization":
+                scheme, _, token = value.decode("latin-1").partition(" ")
+                if scheme.lower() == "bearer" and token:
+                    try:
+                        return f"user:{decode_access_token(token)['id']}"
+                    except Exception:
+                        break
+                break
+        client = scope.get("client")
+        return f"ip:{client[0] if client else 'unknown'}"
+
+    async def _reject(self, send, status_code: int, detail: str, retry_after: float):
+        body = json.dumps({"detail": detail}, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode("ascii")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
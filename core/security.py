@@ -1,13 +1,50 @@
 from datetime import datetime, timedelta
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import HTTPException, status
+from fastapi import Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
+from pydantic import BaseModel
+import asyncio
+import queue
 import sqlite3
+import threading
+import time
+import uuid
 
 from app.config import settings
+from app.core.events import event_bus
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
+
+# مجمع خيوط محدود لعمليات bcrypt حتى لا تحجب حلقة الأحداث
+_password_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    thread_name_prefix="password-hash"
+)
+# عدد المهام المسموح بها (قيد التنفيذ + في الانتظار) قبل الرفض الفوري
+_password_slots = threading.BoundedSemaphore(
+    settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_QUEUE_SIZE
+)
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
+
+class User(BaseModel):
+    id: int
+    username: str
+    full_name: str
+    email: str
+    role: str
+
+# ذاكرة التوكنات المتحقق منها: توكن -> المطالبات (حتى انتهاء صلاحية التوكن)
+_token_cache = OrderedDict()
+# ذاكرة المستخدمين: معرف المستخدم -> (المستخدم أو None، وقت الانتهاء)
+_user_cache = {}
+# التوكنات الملغاة: jti -> وقت انتهاء التوكن (نسخة من جدول revoked_tokens تُحدَّث في الخلفية)
+_revoked_tokens = {}
+_revocation_thread = None
+_auth_cache_lock = threading.Lock()
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """التحقق من كلمة المرور"""
@@ -17,6 +54,21 @@ def get_password_hash(password: str) -> str:
     """تشفير كلمة المرور"""
     return pwd_context.hash(password)
 
+async def run_password_task(func, *args):
+    """تشغيل عملية تشفير/تحقق في المجمع المحدود، أو رفضها برمز 429 عند الامتلاء"""
+    if not _password_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="الخادم مشغول بطلبات تسجيل الدخول، حاول مجددًا بعد قليل",
+            headers={"Retry-After": str(settings.PASSWORD_HASH_RETRY_AFTER)}
+        )
+    
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_password_executor, func, *args)
+    finally:
+        _password_slots.release()
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """إنشاء توكن وصول"""
     to_encode = data.copy()
@@ -24,10 +76,163 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
+def _credentials_exception(detail: str = "بيانات الاعتماد غير صالحة") -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+def decode_access_token(token: str) -> dict:
+    """فك التوكن والتحقق منه، مع تخزين المطالبات مؤقتًا حتى انتهاء صلاحيته"""
+    now = time.time()
+    
+    with _auth_cache_lock:
+        claims = _token_cache.get(token)
+        if claims is not None:
+            if claims["exp"] > now:
+                _token_cache.move_to_end(token)
+                return claims
+            del _token_cache[token]
+    
+    try:
+        claims = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        raise _credentials_exception()
+    
+    if "id" not in claims or "exp" not in claims:
+        raise _credentials_exception()
+    
+    with _auth_cache_lock:
+        _token_cache[token] = claims
+        if len(_token_cache) > settings.TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+    
+    return claims
+
+def _load_user(user_id: int) -> Optional[User]:
+    """قراءة المستخدم النشط من قاعدة البيانات"""
+    conn = sqlite3.connect("cybershield.db")
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT id, username, full_name, email, role, is_active FROM users WHERE id = ?",
+        (user_id,)
+    )
+    row = cursor.fetchone()
+    conn.close()
+    
+    if not row or not row["is_active"]:
+        return None
+    
+    return User(
+        id=row["id"],
+        username=row["username"],
+        full_name=row["full_name"],
+        email=row["email"],
+        role=row["role"]
+    )
+
+def get_cached_user(user_id: int) -> Optional[User]:
+    """قراءة المستخدم عبر ذاكرة مؤقتة قصيرة الصلاحية"""
+    now = time.time()
+    
+    with _auth_cache_lock:
+        cached = _user_cache.get(user_id)
+        if cached and cached[1] > now:
+            return cached[0]
+    
+    user = _load_user(user_id)
+    
+    with _auth_cache_lock:
+        _user_cache[user_id] = (user, now + settings.USER_CACHE_TTL_SECONDS)
+    
+    return user
+
+def revoke_token(token: str):
+    """إلغاء التوكن (تسجيل الخروج) حتى انتهاء صلاحيته في كل العمليات"""
+    claims = decode_access_token(token)
+    jti = claims.get("jti") or token
+    now = time.time()
+    
+    conn = sqlite3.connect("cybershield.db")
+    try:
+        # تنظيف التوكنات الملغاة المنتهية أصلًا
+        conn.execute("DELETE FROM revoked_tokens WHERE expires_at <= ?", (now,))
+        conn.execute(
+            "INSERT OR REPLACE INTO revoked_tokens (jti, expires_at) VALUES (?, ?)",
+            (jti, claims["exp"])
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    
+    with _auth_cache_lock:
+        for revoked in [revoked for revoked, exp in _revoked_tokens.items() if exp <= now]:
+            del _revoked_tokens[revoked]
+        _revoked_tokens[jti] = claims["exp"]
+        _token_cache.pop(token, None)
+
+def _refresh_revoked_tokens():
+    """مزامنة التوكنات الملغاة في العمليات الأخرى دوريًا (خيط خلفي)"""
+    while True:
+        now = time.time()
+        try:
+            conn = sqlite3.connect("cybershield.db")
+            try:
+                rows = conn.execute(
+                    "SELECT jti, expires_at FROM revoked_tokens WHERE expires_at > ?", (now,)
+                ).fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"❌ خطأ في مزامنة التوكنات الملغاة: {e}")
+            rows = []
+        
+        with _auth_cache_lock:
+            _revoked_tokens.update(rows)
+            for jti in [jti for jti, exp in _revoked_tokens.items() if exp <= now]:
+                del _revoked_tokens[jti]
+        
+        time.sleep(settings.TOKEN_REVOCATION_REFRESH_SECONDS)
+
+def start_revocation_refresh():
+    global _revocation_thread
+    if _revocation_thread is not None:
+        return
+    with _auth_cache_lock:
+        if _revocation_thread is None:
+            _revocation_thread = threading.Thread(
+                target=_refresh_revoked_tokens, name="token-revocations", daemon=True
+            )
+            _revocation_thread.start()
+
+def is_token_revoked(token: str, claims: dict) -> bool:
+    """هل أُلغي التوكن: فحص في الذاكرة فقط
+
+    إلغاءات العمليات الأخرى تصل خلال TOKEN_REVOCATION_REFRESH_SECONDS.
+    """
+    start_revocation_refresh()
+    with _auth_cache_lock:
+        return (claims.get("jti") or token) in _revoked_tokens
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
+    """المستخدم الحالي من توكن الوصول (بدون قاعدة البيانات في الحالة المعتادة)"""
+    claims = decode_access_token(token)
+    
+    if is_token_revoked(token, claims):
+        raise _credentials_exception("تم إلغاء التوكن")
+    
+    user = get_cached_user(claims["id"])
+    if not user:
+        raise _credentials_exception("المستخدم غير موجود أو معطل")
+    
+    return user
+
 def create_admin_user():
     """إنشاء مستخدم المدير الافتراضي"""
     try:
@@ -69,11 +274,24 @@ def authenticate_user(username: str, password: str):
     
     if not user:
         return False
-    if not verify_password(password, user["hashed_password"]):
+    
+    is_valid, new_hash = pwd_context.verify_and_update(password, user["hashed_password"])
+    if not is_valid:
         return False
     
+    # إعادة التشفير الشفافة عند تغيير معاملات التكلفة
+    if new_hash:
+        conn = sqlite3.connect("cybershield.db")
+        conn.execute("UPDATE users SET hashed_password = ? WHERE id = ?", (new_hash, user["id"]))
+        conn.commit()
+        conn.close()
+    
     return user
 
+async def authenticate_user_async(username: str, password: str):
+    """مصادقة المستخدم في مجمع كلمات المرور المحدود"""
+    return await run_password_task(authenticate_user, username, password)
+
 def check_permission(user_role: str, required_role: str) -> bool:
     """التحقق من صلاحية المستخدم"""
     role_hierarchy = {
@@ -101,7 +319,109 @@ def log_audit(user_id: int, action: str, entity_type: str, entity_id: int = None
         ''', (user_id, action, entity_type, entity_id, details))
         
         conn.commit()
+        
+        event_bus.publish(
+            "audit",
+            case_id=entity_id if entity_type == "CASE" else None,
+            action=action,
+            entity_type=entity_type,
+            entity_id=entity_id,
+            user_id=user_id,
+            details=details
+        )
     except Exception as e:
         print(f"❌ خطأ في تسجيل النشاط: {e}")
     finally:
         conn.close()
+
+class AuditBatcher:
+    """تجميع سجلات التدقيق عالية التكرار (مثل التنزيلات) وكتابتها دفعة واحدة
+
+    خيط خلفي يكتب السجلات المتراكمة كل فترة قصيرة أو عند بلوغ حجم الدفعة،
+    فلا يتحمل كل طلب كلفة معاملة كتابة مستقلة.
+    """
+    
+    def __init__(self, batch_size: int = None, interval: float = None):
+        self.batch_size = batch_size or settings.AUDIT_BATCH_SIZE
+        self.interval = interval or settings.AUDIT_BATCH_INTERVAL_SECONDS
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+    
+    def add(self, user_id: int, action: str, entity_type: str, entity_id: int = None, details: str = None):
+        self._queue.put((user_id, action, entity_type, entity_id, details))
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="audit-batcher", daemon=True)
+                    self._thread.start()
+    
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.interval)
+            except queue.Empty:
+                continue
+            # انتظار قصير لتجميع ما يصل خلال الفترة، وينتهي فورًا عند الإيقاف
+            self._stop.wait(self.interval)
+            self._write([first] + self._drain())
+    
+    def _drain(self) -> list:
+        records = []
+        while len(records) < self.batch_size * 10:
+            try:
+                records.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return records
+    
+    def flush(self):
+        """كتابة كل السجلات المعلقة فورًا (عند الإغلاق)
+
+        يوقف الخيط الخلفي وينتظره حتى يكتب الدفعة التي سحبها، ثم يكتب ما بقي في الطابور.
+        """
+        with self._lock:
+            thread = self._thread
+            if thread is not None:
+                self._stop.set()
+                thread.join()
+                self._thread = None
+                self._stop.clear()
+        
+        records = self._drain()
+        while records:
+            self._write(records)
+            records = self._drain()
+    
+    def _write(self, records: list):
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            for start in range(0, len(records), self.batch_size):
+                conn.executemany('''
+                INSERT INTO audit_log (user_id, action, entity_type, entity_id, details)
+                VALUES (?, ?, ?, ?, ?)
+                ''', records[start:start + self.batch_size])
+                conn.commit()
+        except Exception as e:
+            print(f"❌ خطأ في تسجيل دفعة النشاطات: {e}")
+            return
+        finally:
+            conn.close()
+        
+        for user_id, action, entity_type, entity_id, details in records:
+            event_bus.publish(
+                "audit",
+                case_id=entity_id if entity_type == "CASE" else None,
+                action=action,
+                entity_type=entity_type,
+                entity_id=entity_id,
+                user_id=user_id,
+                details=details
+            )
+
+audit_batcher = AuditBatcher()
+
+def log_audit_batched(user_id: int, action: str, entity_type: str, entity_id: int = None, details: str = None):
+    """تسجيل نشاط في سجل التدقيق عبر الكتابة المجمعة"""
+    audit_batcher.add(user_id, action, entity_type, entity_id, details)
@@ -0,0 +1,52 @@
+import functools
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """دمج الاستدعاءات المتزامنة المتطابقة في عملية واحدة
+
+    أول استدعاء لمفتاح معين ينفذ العملية، وبقية الاستدعاءات المتزامنة بنفس المفتاح
+    تنتظر النتيجة نفسها (أو الاستثناء نفسه) بدل تكرار العمل.
+    النتيجة مشتركة بين المستدعين فلا يجوز تعديلها.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs):
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def coalesce(self, operation: str):
+        """مزخرف لدوال الكائنات: المفتاح هو (اسم العملية، المعاملات)"""
+        def decorator(method):
+            @functools.wraps(method)
+            def wrapper(instance, *args, **kwargs):
+                key = (operation, args, tuple(sorted(kwargs.items())))
+                return self.do(key, method, instance, *args, **kwargs)
+            return wrapper
+        return decorator
+
+
+single_flight = SingleFlight()
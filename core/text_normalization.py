@@ -0,0 +1,80 @@
+import re
+
+# الحركات العربية والتطويل (تُحذف قبل الفهرسة والبحث)
+ARABIC_DIACRITICS = [chr(code) for code in range(0x064B, 0x0653)] + ["ٰ", "ـ"]
+
+# توحيد أشكال الألف والهمزة والتاء المربوطة والألف المقصورة
+ARABIC_LETTER_MAP = {
+    "أ": "ا",
+    "إ": "ا",
+    "آ": "ا",
+    "ٱ": "ا",
+    "ؤ": "و",
+    "ئ": "ي",
+    "ى": "ي",
+    "ة": "ه",
+}
+
+_DIACRITICS_RE = re.compile("[" + "".join(ARABIC_DIACRITICS) + "]")
+_LETTER_TABLE = str.maketrans(ARABIC_LETTER_MAP)
+
+
+def normalize_arabic(text: str) -> str:
+    """توحيد النص العربي للبحث: حذف الحركات وتوحيد الحروف المتشابهة"""
+    if not text:
+        return ""
+    return _DIACRITICS_RE.sub("", text).translate(_LETTER_TABLE).lower()
+
+
+def normalize_arabic_sql(expression: str) -> str:
+    """نفس التوحيد كتعبير SQL (replace متداخلة) لاستخدامه داخل المشغلات
+
+    المشغلات تعمل على أي اتصال، لذلك لا يمكن الاعتماد على دوال بايثون مسجلة.
+    """
+    sql = f"lower(coalesce({expression}, ''))"
+    for char in ARABIC_DIACRITICS:
+        sql = f"replace({sql}, '{char}', '')"
+    for source, target in ARABIC_LETTER_MAP.items():
+        sql = f"replace({sql}, '{source}', '{target}')"
+    return sql
+
+
+def mark_original(original: str, marked: str, open_tag: str = "<mark>", close_tag: str = "</mark>") -> str:
+    """نقل علامات الإبراز من النص الموحد (ناتج highlight في FTS5) إلى النص الأصلي
+
+    التوحيد يحذف الحركات ويبدل الحروف حرفًا بحرف، فيُطابق النصان حرفًا حرفًا.
+    الحركات تبقى مع الحرف السابق، وإن تعذرت المطابقة يُعاد النص الموحد كما هو.
+    """
+    if not original or not marked:
+        return marked or ""
+
+    result = []
+    position = 0
+    for char in original:
+        if _DIACRITICS_RE.match(char):
+            result.append(char)
+            continue
+        while True:
+            if marked.startswith(open_tag, position):
+                result.append(open_tag)
+                position += len(open_tag)
+            elif marked.startswith(close_tag, position):
+                result.append(close_tag)
+                position += len(close_tag)
+            else:
+                break
+        mapped = ARABIC_LETTER_MAP.get(char, char)
+        # المشغلات توحد حالة الأحرف اللاتينية فقط (lower في SQLite) وبايثون توحدها كلها
+        for form in (mapped.lower(), mapped):
+            if marked.startswith(form, position):
+                position += len(form)
+                break
+        else:
+            return marked
+        result.append(char)
+
+    rest = marked[position:].replace(open_tag, "").replace(close_tag, "")
+    if rest:
+        return marked
+    result.append(marked[position:])
+    return "".join(result)
@@ -2,6 +2,8 @@ import sqlite3
 from contextlib import contextmanager
 from datetime import datetime
 
+from app.core.text_normalization import normalize_arabic_sql
+
 DATABASE_PATH = "cybershield.db"
 
 def init_db():
@@ -41,6 +43,9 @@ def init_db():
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         updated_at TIMESTAMP,
         closed_at TIMESTAMP,
+        version INTEGER NOT NULL DEFAULT 1,
+        claimed_at TIMESTAMP,
+        lease_expires_at TIMESTAMP,
         FOREIGN KEY (assigned_to) REFERENCES users (id),
         FOREIGN KEY (created_by) REFERENCES users (id)
     )
@@ -60,6 +65,7 @@ def init_db():
         uploaded_by INTEGER,
         uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         metadata TEXT,
+        metadata_extracted_at TIMESTAMP,
         FOREIGN KEY (case_id) REFERENCES cases (id),
         FOREIGN KEY (uploaded_by) REFERENCES users (id)
     )
@@ -88,6 +94,104 @@ def init_db():
     )
     ''')
     
+    # جدول ربط الأدلة الموجودة بقضايا أخرى (نفس المحتوى دون إعادة رفع)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS evidence_links (
+        evidence_id INTEGER NOT NULL,
+        case_id INTEGER NOT NULL,
+        description TEXT,
+        linked_by INTEGER,
+        linked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (evidence_id, case_id),
+        FOREIGN KEY (evidence_id) REFERENCES evidence (id),
+        FOREIGN KEY (case_id) REFERENCES cases (id),
+        FOREIGN KEY (linked_by) REFERENCES users (id)
+    )
+    ''')
+    
+    # شجرة Merkle لبصمات أجزاء الأدلة (بجانب بصمة SHA-256 القانونية)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS evidence_merkle (
+        evidence_id INTEGER PRIMARY KEY,
+        chunk_size INTEGER NOT NULL,
+        chunk_count INTEGER NOT NULL,
+        file_size INTEGER NOT NULL,
+        merkle_root TEXT NOT NULL,
+        verify_started_at TIMESTAMP,
+        FOREIGN KEY (evidence_id) REFERENCES evidence (id)
+    )
+    ''')
+    
+    # status: ok أو corrupt حسب آخر تحقق من الجزء
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS evidence_chunks (
+        evidence_id INTEGER NOT NULL,
+        chunk_index INTEGER NOT NULL,
+        chunk_hash TEXT NOT NULL,
+        status TEXT,
+        verified_at TIMESTAMP,
+        PRIMARY KEY (evidence_id, chunk_index),
+        FOREIGN KEY (evidence_id) REFERENCES evidence (id)
+    ) WITHOUT ROWID
+    ''')
+    
+    # مهام أرشفة الروابط وعناصرها
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS archive_jobs (
+        id TEXT PRIMARY KEY,
+        case_id INTEGER NOT NULL,
+        requested_by INTEGER,
+        description TEXT,
+        created_at TIMESTAMP,
+        FOREIGN KEY (case_id) REFERENCES cases (id),
+        FOREIGN KEY (requested_by) REFERENCES users (id)
+    )
+    ''')
+    
+    # status: pending أو fetching أو done أو failed
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS archive_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        job_id TEXT NOT NULL,
+        url TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        evidence_id INTEGER,
+        http_status INTEGER,
+        bytes INTEGER,
+        error TEXT,
+        created_at TIMESTAMP,
+        started_at TIMESTAMP,
+        finished_at TIMESTAMP,
+        FOREIGN KEY (job_id) REFERENCES archive_jobs (id),
+        FOREIGN KEY (evidence_id) REFERENCES evidence (id)
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_archive_items_job ON archive_items (job_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_archive_items_status ON archive_items (status)")
+    
+    # جلسات الرفع القابل للاستئناف
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS upload_sessions (
+        id TEXT PRIMARY KEY,
+        case_id INTEGER NOT NULL,
+        evidence_type TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        description TEXT,
+        total_size INTEGER NOT NULL,
+        sha256 TEXT NOT NULL,
+        received_bytes INTEGER NOT NULL DEFAULT 0,
+        writer_token TEXT,
+        writer_expires_at TIMESTAMP,
+        uploaded_by INTEGER,
+        created_at TIMESTAMP,
+        updated_at TIMESTAMP,
+        expires_at TIMESTAMP NOT NULL,
+        FOREIGN KEY (case_id) REFERENCES cases (id),
+        FOREIGN KEY (uploaded_by) REFERENCES users (id)
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_upload_sessions_expires ON upload_sessions (expires_at)")
+    
     # جدول سجل الأنشطة (Audit Trail)
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS audit_log (
@@ -104,6 +208,14 @@ def init_db():
     )
     ''')
     
+    # التوكنات الملغاة بتسجيل الخروج (مشتركة بين العمليات) حتى انتهاء صلاحيتها
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS revoked_tokens (
+        jti TEXT PRIMARY KEY,
+        expires_at REAL NOT NULL
+    ) WITHOUT ROWID
+    ''')
+    
     # جدول التقارير
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS reports (
@@ -111,7 +223,9 @@ def init_db():
         report_id TEXT UNIQUE NOT NULL,
         case_id INTEGER NOT NULL,
         report_type TEXT NOT NULL,
-        content TEXT NOT NULL,
+        content TEXT NOT NULL DEFAULT '',
+        content_hash TEXT,
+        content_size INTEGER,
         generated_by INTEGER,
         generated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         sent_to TEXT,
@@ -122,11 +236,506 @@ def init_db():
     )
     ''')
     
+    # ترقية قواعد البيانات القديمة
+    _add_column_if_missing(cursor, "reports", "content_hash", "TEXT")
+    _add_column_if_missing(cursor, "reports", "content_size", "INTEGER")
+    _add_column_if_missing(cursor, "cases", "version", "INTEGER NOT NULL DEFAULT 1")
+    _add_column_if_missing(cursor, "cases", "claimed_at", "TIMESTAMP")
+    _add_column_if_missing(cursor, "cases", "lease_expires_at", "TIMESTAMP")
+    _add_column_if_missing(cursor, "evidence", "metadata_extracted_at", "TIMESTAMP")
+    _add_column_if_missing(cursor, "upload_sessions", "writer_token", "TEXT")
+    _add_column_if_missing(cursor, "upload_sessions", "writer_expires_at", "TIMESTAMP")
+    
+    # فهارس الاستعلامات الفرعية لعرض القضية
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_evidence_case ON evidence (case_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_case_network_case ON case_network (case_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_evidence_links_case ON evidence_links (case_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reports_case ON reports (case_id)")
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_audit_entity
+    ON audit_log (entity_type, entity_id, created_at)
+    ''')
+    
+    # فهرس طابور العمل: ترتيب القضايا حسب الأولوية ثم الأقدم
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_cases_work_queue
+    ON cases (status, violation_type, priority DESC, created_at, id)
+    ''')
+    # نفس الترتيب للسحب دون تحديد نوع المخالفة
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_cases_work_queue_status
+    ON cases (status, priority DESC, created_at, id)
+    ''')
+    
+    # الأدلة التي تنتظر استخراج بياناتها الوصفية
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_evidence_metadata_pending
+    ON evidence (id) WHERE metadata_extracted_at IS NULL
+    ''')
+    
+    # رقم نسخة القضية: يزداد مع كل تغيير في القضية أو أدلتها أو شبكاتها أو سجلها
+    _create_case_version_triggers(cursor)
+    
+    # فهارس البحث النصي الكامل (FTS5)
+    _create_search_index(cursor)
+    _create_content_index(cursor)
+    
+    # جداول الإحصائيات المجمعة للوحة التحكم
+    _create_case_stats(cursor)
+
+    # فهرس صلاحيات الوصول لكل قضية
+    _create_case_access(cursor)
+    
+    # فهرس النصوص شبه المكررة (MinHash/LSH)
+    _create_near_duplicate_index(cursor)
+    
+    # مفاتيح جهات الاتصال الموحدة لمطابقة المبلغين والمشتبه بهم
+    _create_contact_index(cursor)
+    
     conn.commit()
     conn.close()
     
     print("✅ تم تهيئة قاعدة البيانات بنجاح")
 
+def _create_case_version_triggers(cursor):
+    """إنشاء مشغلات زيادة رقم نسخة القضية (يُستخدم في ETag)"""
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_cases_version
+    AFTER UPDATE ON cases
+    WHEN NEW.version = OLD.version
+    BEGIN
+        UPDATE cases SET version = version + 1 WHERE id = NEW.id;
+    END
+    ''')
+
+    # عرض القضية يشمل الأدلة المرتبطة بها عبر evidence_links، فتغيير الدليل يغير نسختها أيضًا
+    linked_cases = {
+        "evidence": " OR id IN (SELECT case_id FROM evidence_links WHERE evidence_id = {row}.id)",
+        "case_network": "",
+        "evidence_links": "",
+    }
+    # إعادة إنشاء مشغلات الأدلة في قواعد البيانات القديمة التي لا تشمل القضايا المرتبطة
+    cursor.execute("DROP TRIGGER IF EXISTS trg_evidence_update_case_version")
+    cursor.execute("DROP TRIGGER IF EXISTS trg_evidence_delete_case_version")
+
+    for table, linked in linked_cases.items():
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_insert_case_version
+        AFTER INSERT ON {table}
+        BEGIN
+            UPDATE cases SET version = version + 1 WHERE id = NEW.case_id;
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_update_case_version
+        AFTER UPDATE ON {table}
+        BEGIN
+            UPDATE cases SET version = version + 1
+            WHERE id IN (OLD.case_id, NEW.case_id){linked.format(row="NEW")};
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_delete_case_version
+        AFTER DELETE ON {table}
+        BEGIN
+            UPDATE cases SET version = version + 1 WHERE id = OLD.case_id{linked.format(row="OLD")};
+        END
+        ''')
+
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_audit_case_version
+    AFTER INSERT ON audit_log
+    WHEN NEW.entity_type = 'CASE'
+    BEGIN
+        UPDATE cases SET version = version + 1 WHERE id = NEW.entity_id;
+    END
+    ''')
+
+def _create_search_index(cursor):
+    """إنشاء جداول FTS5 للقضايا والأدلة مع مشغلات المزامنة
+
+    النص يُخزن في الفهرس بعد التوحيد العربي، لذلك تُحسب القيم داخل المشغلات.
+    """
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('cases_fts', 'evidence_fts')")
+    existing = {row[0] for row in cursor.fetchall()}
+
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS cases_fts USING fts5(
+        title, description,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    ''')
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS evidence_fts USING fts5(
+        description, url, case_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    ''')
+
+    case_values = f"{normalize_arabic_sql('NEW.title')}, {normalize_arabic_sql('NEW.description')}"
+    evidence_values = f"{normalize_arabic_sql('NEW.description')}, {normalize_arabic_sql('NEW.url')}"
+
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_cases_fts_insert AFTER INSERT ON cases
+    BEGIN
+        INSERT INTO cases_fts (rowid, title, description) VALUES (NEW.id, {case_values});
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_cases_fts_update AFTER UPDATE OF title, description ON cases
+    BEGIN
+        DELETE FROM cases_fts WHERE rowid = OLD.id;
+        INSERT INTO cases_fts (rowid, title, description) VALUES (NEW.id, {case_values});
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_cases_fts_delete AFTER DELETE ON cases
+    BEGIN
+        DELETE FROM cases_fts WHERE rowid = OLD.id;
+    END
+    ''')
+
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_evidence_fts_insert AFTER INSERT ON evidence
+    BEGIN
+        INSERT INTO evidence_fts (rowid, description, url, case_id)
+        VALUES (NEW.id, {evidence_values}, NEW.case_id);
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_evidence_fts_update AFTER UPDATE OF description, url, case_id ON evidence
+    BEGIN
+        DELETE FROM evidence_fts WHERE rowid = OLD.id;
+        INSERT INTO evidence_fts (rowid, description, url, case_id)
+        VALUES (NEW.id, {evidence_values}, NEW.case_id);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_evidence_fts_delete AFTER DELETE ON evidence
+    BEGIN
+        DELETE FROM evidence_fts WHERE rowid = OLD.id;
+    END
+    ''')
+
+    # تعبئة الفهارس من البيانات الموجودة عند إنشائها لأول مرة
+    if "cases_fts" not in existing:
+        cursor.execute(f'''
+        INSERT INTO cases_fts (rowid, title, description)
+        SELECT id, {normalize_arabic_sql('title')}, {normalize_arabic_sql('description')} FROM cases
+        ''')
+    if "evidence_fts" not in existing:
+        cursor.execute(f'''
+        INSERT INTO evidence_fts (rowid, description, url, case_id)
+        SELECT id, {normalize_arabic_sql('description')}, {normalize_arabic_sql('url')}, case_id FROM evidence
+        ''')
+
+# أقصى عدد لأجزاء نص الدليل الواحد في فهرس المحتوى: rowid = معرف الدليل * الخطوة + رقم الجزء
+CONTENT_ROWID_STRIDE = 1 << 20
+
+def _create_content_index(cursor):
+    """فهرس FTS5 لنصوص ملفات الأدلة مقسمة إلى أجزاء، مع سجل الأدلة المفهرسة وبصماتها
+
+    content هو النص الموحد المفهرس، وoriginal نص الجزء الأصلي (غير مفهرس) لبناء المقتطفات.
+    """
+    # جداول FTS5 لا تقبل ALTER: الفهرس القديم بلا النص الأصلي يُعاد بناؤه من الملفات
+    cursor.execute("PRAGMA table_info(evidence_content_fts)")
+    columns = [row[1] for row in cursor.fetchall()]
+    if columns and "original" not in columns:
+        cursor.execute("DROP TABLE evidence_content_fts")
+        cursor.execute("DROP TABLE IF EXISTS evidence_content_index")
+
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS evidence_content_fts USING fts5(
+        content, original UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS evidence_content_index (
+        evidence_id INTEGER PRIMARY KEY,
+        file_hash TEXT NOT NULL,
+        chunk_count INTEGER NOT NULL,
+        text_chars INTEGER NOT NULL,
+        indexed_at TIMESTAMP,
+        FOREIGN KEY (evidence_id) REFERENCES evidence (id)
+    )
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_evidence_content_delete AFTER DELETE ON evidence
+    BEGIN
+        DELETE FROM evidence_content_fts
+        WHERE rowid BETWEEN OLD.id * {CONTENT_ROWID_STRIDE} AND OLD.id * {CONTENT_ROWID_STRIDE} + {CONTENT_ROWID_STRIDE - 1};
+        DELETE FROM evidence_content_index WHERE evidence_id = OLD.id;
+    END
+    ''')
+
+# أبعاد إحصائيات القضايا: اسم البعد -> (العمود المصدر، تعبير المفتاح)
+CASE_STATS_DIMENSIONS = {
+    "status": ("status", "{row}.status"),
+    "violation_type": ("violation_type", "{row}.violation_type"),
+    "priority": ("priority", "{row}.priority"),
+    "assignee": ("assigned_to", "{row}.assigned_to"),
+    "day": ("created_at", "date({row}.created_at)"),
+}
+
+def _create_case_stats(cursor):
+    """إنشاء جدول العدادات المجمعة ومشغلات تحديثه مع كل تغيير في القضايا"""
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'case_stats'")
+    is_new = cursor.fetchone() is None
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS case_stats (
+        dimension TEXT NOT NULL,
+        key TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (dimension, key)
+    ) WITHOUT ROWID
+    ''')
+
+    def key_sql(template: str, row: str) -> str:
+        return f"COALESCE(CAST({template.format(row=row)} AS TEXT), 'none')"
+
+    def increment(dimension: str, key: str) -> str:
+        return f'''
+        INSERT INTO case_stats (dimension, key, count) VALUES ('{dimension}', {key}, 1)
+        ON CONFLICT (dimension, key) DO UPDATE SET count = count + 1;'''
+
+    def decrement(dimension: str, key: str) -> str:
+        return f'''
+        UPDATE case_stats SET count = count - 1 WHERE dimension = '{dimension}' AND key = {key};'''
+
+    inserts = increment("total", "'all'")
+    deletes = decrement("total", "'all'")
+    for dimension, (column, template) in CASE_STATS_DIMENSIONS.items():
+        inserts += increment(dimension, key_sql(template, "NEW"))
+        deletes += decrement(dimension, key_sql(template, "OLD"))
+
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_case_stats_update_{dimension}
+        AFTER UPDATE OF {column} ON cases
+        WHEN {key_sql(template, "OLD")} IS NOT {key_sql(template, "NEW")}
+        BEGIN
+            {decrement(dimension, key_sql(template, "OLD"))}
+            {increment(dimension, key_sql(template, "NEW"))}
+        END
+        ''')
+
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_case_stats_insert AFTER INSERT ON cases
+    BEGIN
+        {inserts}
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_case_stats_delete AFTER DELETE ON cases
+    BEGIN
+        {deletes}
+    END
+    ''')
+
+    # تعبئة العدادات من البيانات الموجودة عند إنشاء الجدول لأول مرة
+    if is_new:
+        cursor.execute("INSERT INTO case_stats (dimension, key, count) SELECT 'total', 'all', COUNT(*) FROM cases")
+        for dimension, (column, template) in CASE_STATS_DIMENSIONS.items():
+            key = key_sql(template.replace("{row}.", ""), "")
+            cursor.execute(f'''
+            INSERT INTO case_stats (dimension, key, count)
+            SELECT '{dimension}', {key}, COUNT(*) FROM cases GROUP BY {key}
+            ''')
+
+def _create_case_access(cursor):
+    """إنشاء جداول الفرق وصلاحيات القضايا ومشغلات صيانة صلاحيات المنشئ والمسند إليه"""
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'case_access'")
+    is_new = cursor.fetchone() is None
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS teams (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS team_members (
+        team_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        PRIMARY KEY (team_id, user_id),
+        FOREIGN KEY (team_id) REFERENCES teams (id),
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_team_members_user ON team_members (user_id)")
+
+    # principal_type: user أو team — source: creator أو assignee أو grant
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS case_access (
+        case_id INTEGER NOT NULL,
+        principal_type TEXT NOT NULL,
+        principal_id INTEGER NOT NULL,
+        source TEXT NOT NULL,
+        granted_by INTEGER,
+        granted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (case_id, principal_type, principal_id, source),
+        FOREIGN KEY (case_id) REFERENCES cases (id)
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_case_access_principal
+    ON case_access (principal_type, principal_id, case_id)
+    ''')
+
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_case_access_insert AFTER INSERT ON cases
+    BEGIN
+        INSERT OR IGNORE INTO case_access (case_id, principal_type, principal_id, source)
+        SELECT NEW.id, 'user', NEW.created_by, 'creator' WHERE NEW.created_by IS NOT NULL;
+        INSERT OR IGNORE INTO case_access (case_id, principal_type, principal_id, source)
+        SELECT NEW.id, 'user', NEW.assigned_to, 'assignee' WHERE NEW.assigned_to IS NOT NULL;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_case_access_assign AFTER UPDATE OF assigned_to ON cases
+    WHEN OLD.assigned_to IS NOT NEW.assigned_to
+    BEGIN
+        DELETE FROM case_access WHERE case_id = OLD.id AND source = 'assignee';
+        INSERT OR IGNORE INTO case_access (case_id, principal_type, principal_id, source)
+        SELECT NEW.id, 'user', NEW.assigned_to, 'assignee' WHERE NEW.assigned_to IS NOT NULL;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_case_access_delete AFTER DELETE ON cases
+    BEGIN
+        DELETE FROM case_access WHERE case_id = OLD.id;
+    END
+    ''')
+
+    # تعبئة الصلاحيات من القضايا الموجودة عند إنشاء الجدول لأول مرة
+    if is_new:
+        cursor.execute('''
+        INSERT OR IGNORE INTO case_access (case_id, principal_type, principal_id, source)
+        SELECT id, 'user', created_by, 'creator' FROM cases WHERE created_by IS NOT NULL
+        ''')
+        cursor.execute('''
+        INSERT OR IGNORE INTO case_access (case_id, principal_type, principal_id, source)
+        SELECT id, 'user', assigned_to, 'assignee' FROM cases WHERE assigned_to IS NOT NULL
+        ''')
+
+def _create_near_duplicate_index(cursor):
+    """جداول بصمات MinHash ونطاقات LSH، وطابور المستندات التي تغير نصها
+
+    المشغلات تضيف القضية أو الدليل إلى الطابور عند الإنشاء أو تعديل النص،
+    وتحذف البصمة ونطاقاتها عند الحذف.
+    """
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'near_dup_queue'")
+    is_new = cursor.fetchone() is None
+
+    # doc_type: case أو evidence — signature: مصفوفة قيم MinHash (32 بت لكل قيمة)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS near_dup_signatures (
+        doc_type TEXT NOT NULL,
+        doc_id INTEGER NOT NULL,
+        shingle_count INTEGER NOT NULL,
+        signature BLOB,
+        updated_at TIMESTAMP,
+        PRIMARY KEY (doc_type, doc_id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS near_dup_bands (
+        band INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        doc_type TEXT NOT NULL,
+        doc_id INTEGER NOT NULL,
+        PRIMARY KEY (band, bucket, doc_type, doc_id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_near_dup_bands_doc ON near_dup_bands (doc_type, doc_id)")
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS near_dup_queue (
+        doc_type TEXT NOT NULL,
+        doc_id INTEGER NOT NULL,
+        queued_at TEXT NOT NULL,
+        PRIMARY KEY (doc_type, doc_id)
+    ) WITHOUT ROWID
+    ''')
+
+    queue_sql = "INSERT OR REPLACE INTO near_dup_queue (doc_type, doc_id, queued_at) VALUES ('{doc_type}', NEW.id, strftime('%Y-%m-%d %H:%M:%f', 'now'))"
+    for table, doc_type, text_columns in (("cases", "case", "title, description"), ("evidence", "evidence", "description")):
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_near_dup_insert AFTER INSERT ON {table}
+        BEGIN
+            {queue_sql.format(doc_type=doc_type)};
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_near_dup_update AFTER UPDATE OF {text_columns} ON {table}
+        BEGIN
+            {queue_sql.format(doc_type=doc_type)};
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_near_dup_delete AFTER DELETE ON {table}
+        BEGIN
+            DELETE FROM near_dup_signatures WHERE doc_type = '{doc_type}' AND doc_id = OLD.id;
+            DELETE FROM near_dup_bands WHERE doc_type = '{doc_type}' AND doc_id = OLD.id;
+            DELETE FROM near_dup_queue WHERE doc_type = '{doc_type}' AND doc_id = OLD.id;
+        END
+        ''')
+
+    # جدولة كل القضايا والأدلة الموجودة عند إنشاء الطابور لأول مرة
+    if is_new:
+        cursor.execute("INSERT OR IGNORE INTO near_dup_queue SELECT 'case', id, '' FROM cases")
+        cursor.execute("INSERT OR IGNORE INTO near_dup_queue SELECT 'evidence', id, '' FROM evidence")
+
+def _create_contact_index(cursor):
+    """جدول جهات الاتصال الموحدة لكل قضية مع مفتاح تجميع (blocking) مفهرس
+
+    المفاتيح تُحسب في بايثون عند الكتابة (توحيد أرقام الهواتف لا يمكن داخل مشغل)،
+    وcase_contact_index يسجل القضايا المفهرسة؛ تعديل نص القضية يحذف سجلها لتُعاد فهرستها.
+    """
+    # role: reporter (جهة اتصال المبلغ) أو mentioned (مذكورة في نص القضية)
+    # kind: phone أو email أو handle — value: القيمة الموحدة — block_key: مفتاح التجميع
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS case_contacts (
+        case_id INTEGER NOT NULL,
+        role TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        value TEXT NOT NULL,
+        block_key TEXT NOT NULL,
+        PRIMARY KEY (case_id, role, kind, value),
+        FOREIGN KEY (case_id) REFERENCES cases (id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_case_contacts_block ON case_contacts (kind, block_key)")
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS case_contact_index (
+        case_id INTEGER PRIMARY KEY,
+        indexed_at TIMESTAMP NOT NULL,
+        FOREIGN KEY (case_id) REFERENCES cases (id)
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_case_contacts_update AFTER UPDATE OF title, description, reporter_contact ON cases
+    BEGIN
+        DELETE FROM case_contact_index WHERE case_id = NEW.id;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_case_contacts_delete AFTER DELETE ON cases
+    BEGIN
+        DELETE FROM case_contacts WHERE case_id = OLD.id;
+        DELETE FROM case_contact_index WHERE case_id = OLD.id;
+    END
+    ''')
+
+def _add_column_if_missing(cursor, table: str, column: str, definition: str):
+    """إضافة عمود لجدول موجود إذا لم يكن موجودًا (ترقية المخطط)"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
 @contextmanager
 def get_db():
     """الحصول على اتصال قاعدة البيانات"""
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, Request, Depends
+from fastapi import FastAPI, HTTPException, Request, Depends
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
@@ -7,8 +7,14 @@ import sqlite3
 import os
 
 from app.database import init_db, get_db
-from app.api import auth, cases, evidence, reports
-from app.core.security import create_admin_user
+from app.api import auth, cases, evidence, reports, stats, events
+from app.core.security import create_admin_user, audit_batcher, start_revocation_refresh
+from app.core.rate_limit import RateLimitMiddleware
+from app.modules.evidence_engine.hash_index import known_hashes
+from app.modules.evidence_engine.metadata_extractor import metadata_extractor
+from app.modules.search.content_indexer import content_indexer
+from app.modules.search.near_duplicates import near_duplicates
+from app.modules.search.contact_index import contact_index
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -16,8 +22,18 @@ async def lifespan(app: FastAPI):
     print("🚀 بدء تشغيل Abu Jamal CyberShield...")
     init_db()
     create_admin_user()  # إنشاء مستخدم المدير الافتراضي
+    start_revocation_refresh()  # مزامنة التوكنات الملغاة بين العمليات
+    known_hashes.rebuild()  # مرشح بصمات الأدلة المعروفة
+    evidence.upload_sessions.cleanup_expired()  # جلسات الرفع المهجورة
+    metadata_extractor.resume()  # الأدلة التي لم تُستخرج بياناتها الوصفية
+    content_indexer.resume()  # الأدلة التي لم تُفهرس نصوصها
+    near_duplicates.start()  # بصمات النصوص شبه المكررة
+    contact_index.resume()  # القضايا التي لم تُحسب مفاتيح جهات اتصالها
+    await evidence.url_archiver.start()  # عمال أرشفة الروابط
     yield
     # تنظيف عند الإغلاق
+    await evidence.url_archiver.shutdown()
+    audit_batcher.flush()
     print("🛑 إغلاق النظام...")
 
 app = FastAPI(
@@ -27,8 +43,19 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# تحديد معدل الطلبات وحماية المسارات المكلفة
+app.add_middleware(RateLimitMiddleware)
+
+class PublicStaticFiles(StaticFiles):
+    """الملفات الثابتة العامة؛ ملفات الأدلة تُنزّل فقط عبر واجهة API المحمية"""
+    
+    async def get_response(self, path: str, scope):
+        if os.path.normpath(path).split(os.sep)[0] == "uploads":
+            raise HTTPException(status_code=404)
+        return await super().get_response(path, scope)
+
 # تحميل الملفات الثابتة والقوالب
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
+app.mount("/static", PublicStaticFiles(directory="app/static"), name="static")
 templates = Jinja2Templates(directory="app/templates")
 
 # تسجيل واجهات API
@@ -36,6 +63,8 @@ app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(cases.router, prefix="/api/cases", tags=["Cases"])
 app.include_router(evidence.router, prefix="/api/evidence", tags=["Evidence"])
 app.include_router(reports.router, prefix="/api/reports", tags=["Reports"])
+app.include_router(stats.router, prefix="/api/stats", tags=["Statistics"])
+app.include_router(events.router, prefix="/api/events", tags=["Events"])
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
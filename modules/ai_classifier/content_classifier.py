@@ -2,6 +2,8 @@ import re
 from typing import Dict, List, Tuple
 import sqlite3
 
+from app.modules.search.contact_index import contact_index
+
 class ContentClassifier:
     def __init__(self):
         # قوائم الكلمات المفتاحية للتصنيف
@@ -134,6 +136,9 @@ class ContentClassifier:
         # البحث عن قضايا متشابهة
         similar_cases = []
         
+        # البحث بناءً على جهات الاتصال الموحدة (المبلغ والمذكورة في النص) أولًا لأنها الأقوى دلالة
+        similar_cases.extend(contact_index.related_cases(case_id, limit=3))
+        
         # البحث بناءً على نوع المخالفة
         cursor.execute("""
         SELECT id, case_id, title, violation_type, created_at
@@ -143,19 +148,7 @@ class ContentClassifier:
         LIMIT 5
         """, (current_case["violation_type"], case_id))
         
-        similar_cases.extend(cursor.fetchall())
-        
-        # البحث بناءً على جهة الاتصال (إذا كانت متاحة)
-        if current_case["reporter_contact"]:
-            cursor.execute("""
-            SELECT id, case_id, title, violation_type, created_at
-            FROM cases 
-            WHERE reporter_contact = ? AND id != ?
-            ORDER BY created_at DESC
-            LIMIT 3
-            """, (current_case["reporter_contact"], case_id))
-            
-            similar_cases.extend(cursor.fetchall())
+        similar_cases.extend(dict(case) for case in cursor.fetchall())
         
         # إزالة التكرارات
         unique_cases = []
@@ -163,7 +156,7 @@ class ContentClassifier:
         for case in similar_cases:
             if case["id"] not in seen_ids:
                 seen_ids.add(case["id"])
-                unique_cases.append(dict(case))
+                unique_cases.append(case)
         
         conn.close()
         
@@ -0,0 +1,250 @@
+import codecs
+import csv
+import io
+import json
+import sqlite3
+import uuid
+from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.config import settings
+from app.modules.search.contact_index import contact_index
+
+# الحقول المصدرة (تطابق أعمدة جدول القضايا ويمكن إعادة استيرادها)
+EXPORT_FIELDS = [
+    "case_id", "title", "description", "violation_type", "status", "priority",
+    "reporter_name", "reporter_contact", "assigned_to", "created_by",
+    "created_at", "updated_at", "closed_at"
+]
+
+
+def generate_case_id() -> str:
+    """إنشاء معرف فريد للقضية"""
+    return f"CASE-{datetime.now().strftime('%Y%m%d')}-{str(uuid.uuid4())[:8].upper()}"
+
+
+# حالات تتبع علامات التنصيص في CSV (نفس قواعد csv.reader)
+_FIELD_START, _IN_FIELD, _IN_QUOTED, _QUOTE_IN_QUOTED = range(4)
+
+
+def _csv_line_state(line: str, state: int) -> int:
+    """حالة محلل CSV بعد السطر؛ _IN_QUOTED تعني أن حقلًا مقتبسًا يمتد إلى السطر التالي
+
+    علامة التنصيص لا تفتح حقلًا مقتبسًا إلا في بداية الحقل، فالعلامة داخل حقل عادي
+    (مثل 5" screen) حرف عادي كما يعاملها csv.reader.
+    """
+    if state == _FIELD_START and '"' not in line:
+        return _FIELD_START
+    for char in line:
+        if state == _IN_QUOTED:
+            if char == '"':
+                state = _QUOTE_IN_QUOTED
+        elif state == _QUOTE_IN_QUOTED:
+            state = _IN_QUOTED if char == '"' else _FIELD_START if char == "," else _IN_FIELD
+        elif char == ",":
+            state = _FIELD_START
+        elif state == _FIELD_START and char == '"':
+            state = _IN_QUOTED
+        else:
+            state = _IN_FIELD
+    return _IN_QUOTED if state == _IN_QUOTED else _FIELD_START
+
+
+class CaseTransfer:
+    FORMATS = ("ndjson", "csv")
+    # محاولات إعادة إدراج الدفعة بمعرفات جديدة عند تصادم معرف قضية
+    INSERT_ID_ATTEMPTS = 3
+
+    async def _iter_lines(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+        """تقسيم جسم الطلب المتدفق إلى أسطر دون قراءته كاملاً"""
+        decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        pending = ""
+
+        async for chunk in chunks:
+            pending += decoder.decode(chunk)
+            *lines, pending = pending.split("\n")
+            for line in lines:
+                yield line.rstrip("\r")
+
+        pending += decoder.decode(b"", final=True)
+        if pending:
+            yield pending.rstrip("\r")
+
+    async def iter_records(
+        self, chunks: AsyncIterator[bytes], fmt: str
+    ) -> AsyncIterator[Tuple[int, Optional[Dict], Optional[str]]]:
+        """إرجاع (رقم الصف، السجل، الخطأ) لكل صف في ملف NDJSON أو CSV"""
+        row_number = 0
+
+        if fmt == "ndjson":
+            async for line in self._iter_lines(chunks):
+                row_number += 1
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    yield row_number, None, f"JSON غير صالح: {e}"
+                    continue
+                if not isinstance(record, dict):
+                    yield row_number, None, "يجب أن يكون الصف كائن JSON"
+                    continue
+                yield row_number, record, None
+            return
+
+        header = None
+        record_lines = []
+        record_chars = 0
+        oversized = False
+        state = _FIELD_START
+        async for line in self._iter_lines(chunks):
+            # الحقول المقتبسة قد تمتد على عدة أسطر: السجل يكتمل عند انتهاء السطر خارج حقل مقتبس
+            state = _csv_line_state(line, state)
+            record_chars += len(line) + 1
+            if record_chars > settings.CASE_IMPORT_MAX_RECORD_CHARS:
+                # السجل الضخم يُتجاوز دون الاحتفاظ بأسطره حتى نهايته
+                oversized = True
+                record_lines = []
+            else:
+                record_lines.append(line)
+            if state == _IN_QUOTED:
+                continue
+
+            text = "\n".join(record_lines)
+            record_lines = []
+            record_chars = 0
+            if oversized:
+                oversized = False
+                row_number += 1
+                yield row_number, None, f"السجل يتجاوز الحجم المسموح ({settings.CASE_IMPORT_MAX_RECORD_CHARS} حرف)"
+                continue
+
+            if not text.strip():
+                continue
+
+            values = next(csv.reader([text]))
+            if header is None:
+                header = [name.strip() for name in values]
+                continue
+
+            row_number += 1
+            if len(values) != len(header):
+                yield row_number, None, "عدد الأعمدة لا يطابق الترويسة"
+                continue
+            yield row_number, {name: value or None for name, value in zip(header, values)}, None
+
+        if state == _IN_QUOTED:
+            yield row_number + 1, None, "علامة تنصيص غير مغلقة في نهاية الملف"
+
+    def insert_batch(self, cases: List[Dict], user_id: int) -> List[str]:
+        """إدراج دفعة من القضايا مع سجلات التدقيق في معاملة واحدة
+
+        اللاحقة العشوائية في معرف القضية قصيرة، فالاستيراد الكبير قد يصادف معرفًا مكررًا:
+        تُعاد الدفعة حينها بمعرفات جديدة بدل رفضها كاملة.
+        """
+        for attempt in range(self.INSERT_ID_ATTEMPTS):
+            try:
+                return self._insert_batch(cases, user_id)
+            except sqlite3.IntegrityError as e:
+                if "cases.case_id" not in str(e) or attempt == self.INSERT_ID_ATTEMPTS - 1:
+                    raise
+
+    def _insert_batch(self, cases: List[Dict], user_id: int) -> List[str]:
+        rows = [
+            (
+                generate_case_id(),
+                case["title"],
+                case["description"],
+                case["violation_type"],
+                case.get("reporter_name"),
+                case.get("reporter_contact"),
+                user_id,
+                "new"
+            )
+            for case in cases
+        ]
+        case_ids = [row[0] for row in rows]
+
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            cursor = conn.cursor()
+            cursor.executemany('''
+            INSERT INTO cases (case_id, title, description, violation_type,
+                              reporter_name, reporter_contact, created_by, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+
+            # سجلات التدقيق للدفعة كاملة في عبارة واحدة
+            cursor.execute(f'''
+            INSERT INTO audit_log (user_id, action, entity_type, entity_id, details)
+            SELECT ?, 'CREATE', 'CASE', id, 'إنشاء قضية جديدة: ' || title
+            FROM cases WHERE case_id IN ({', '.join('?' for _ in case_ids)})
+            ''', [user_id] + case_ids)
+
+            cursor.execute(
+                f"SELECT id FROM cases WHERE case_id IN ({', '.join('?' for _ in case_ids)})",
+                case_ids
+            )
+            contact_index.index_cases(cursor, [row[0] for row in cursor.fetchall()])
+
+            conn.commit()
+            return case_ids
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def stream_export(
+        self,
+        fmt: str,
+        status: Optional[str] = None,
+        access_filter: Callable[[str], Tuple[str, list]] = None
+    ) -> Iterator[str]:
+        """بث القضايا بصيغة NDJSON أو CSV مباشرة من مؤشر قاعدة البيانات
+
+        access_filter يعيد شرط SQL لعمود معرف القضية لتقييد التصدير بالقضايا المتاحة.
+        """
+        # قد يُستهلك المولد من خيوط مختلفة أثناء البث
+        conn = sqlite3.connect("cybershield.db", check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+
+        try:
+            cursor = conn.cursor()
+            query = f"SELECT {', '.join(EXPORT_FIELDS)} FROM cases WHERE 1 = 1"
+            params = []
+            if status:
+                query += " AND status = ?"
+                params.append(status)
+            if access_filter:
+                access_sql, access_params = access_filter("id")
+                query += access_sql
+                params.extend(access_params)
+            query += " ORDER BY id"
+            cursor.execute(query, params)
+
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if fmt == "csv":
+                writer.writerow(EXPORT_FIELDS)
+
+            while True:
+                rows = cursor.fetchmany(1000)
+                if not rows:
+                    break
+
+                if fmt == "csv":
+                    writer.writerows(rows)
+                else:
+                    for row in rows:
+                        buffer.write(json.dumps(dict(row), ensure_ascii=False))
+                        buffer.write("\n")
+
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+
+            if buffer.tell():
+                yield buffer.getvalue()
+        finally:
+            conn.close()
@@ -0,0 +1,90 @@
+import hashlib
+import os
+import tempfile
+import zlib
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+from app.config import settings
+
+
+class ContentStore:
+    """مخزن محتوى مضغوط معنون ببصمة SHA256 خارج قاعدة البيانات"""
+
+    def __init__(self, store_dir: str = None, compression_level: int = None):
+        self.store_dir = Path(store_dir or settings.CONTENT_STORE_DIR)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.compression_level = (
+            compression_level if compression_level is not None
+            else settings.CONTENT_STORE_COMPRESSION_LEVEL
+        )
+
+    def _path_for(self, content_hash: str) -> Path:
+        """مسار الكائن المضغوط (مجلد فرعي لكل بادئة لتجنب المجلدات الضخمة)"""
+        return self.store_dir / content_hash[:2] / f"{content_hash}.zz"
+
+    def exists(self, content_hash: str) -> bool:
+        return self._path_for(content_hash).exists()
+
+    def put(self, data: bytes) -> Tuple[str, int]:
+        """ضغط المحتوى وحفظه، وإرجاع (البصمة، الحجم الأصلي)"""
+        content_hash = hashlib.sha256(data).hexdigest()
+        path = self._path_for(content_hash)
+
+        # المحتوى المكرر يُحفظ مرة واحدة فقط
+        if path.exists():
+            return content_hash, len(data)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(zlib.compress(data, self.compression_level))
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return content_hash, len(data)
+
+    def get(self, content_hash: str) -> Optional[bytes]:
+        """قراءة المحتوى كاملاً بعد فك الضغط"""
+        path = self._path_for(content_hash)
+        if not path.exists():
+            return None
+        with open(path, "rb") as f:
+            return zlib.decompress(f.read())
+
+    def _iter_decompressed(self, content_hash: str, chunk_size: int) -> Iterator[bytes]:
+        decompressor = zlib.decompressobj()
+        with open(self._path_for(content_hash), "rb") as f:
+            for compressed in iter(lambda: f.read(chunk_size), b""):
+                data = decompressor.decompress(compressed)
+                if data:
+                    yield data
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+
+    def iter_content(
+        self,
+        content_hash: str,
+        start: int = 0,
+        end: Optional[int] = None,
+        chunk_size: int = 64 * 1024
+    ) -> Iterator[bytes]:
+        """بث المحتوى بعد فك الضغط تدريجيًا، مع دعم نطاق بايتات [start, end]"""
+        position = 0
+        for data in self._iter_decompressed(content_hash, chunk_size):
+            chunk_start = position
+            position += len(data)
+
+            if position <= start:
+                continue
+            if end is not None and chunk_start > end:
+                return
+
+            lower = max(start - chunk_start, 0)
+            upper = len(data) if end is None else min(end - chunk_start + 1, len(data))
+            yield data[lower:upper]
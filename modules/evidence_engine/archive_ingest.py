@@ -0,0 +1,432 @@
+import hashlib
+import json
+import sqlite3
+import stat
+import tarfile
+import threading
+import uuid
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path, PurePosixPath
+from typing import AsyncIterator, BinaryIO, Dict, List, Optional
+
+import aiofiles
+
+from app.config import settings
+from app.core.events import event_bus
+from app.modules.evidence_engine.evidence_manager import EvidenceManager
+from app.modules.evidence_engine.hash_index import known_hashes
+from app.modules.evidence_engine.merkle import merkle_root
+from app.modules.evidence_engine.metadata_extractor import metadata_extractor
+from app.modules.search.content_indexer import content_indexer
+
+
+def _timestamp(build) -> Optional[str]:
+    """تاريخ تعديل العنصر بصيغة ISO، أو None إذا كان التاريخ المخزن في الأرشيف غير صالح"""
+    try:
+        return build().isoformat()
+    except (ValueError, OverflowError, OSError):
+        return None
+
+
+class IngestError(Exception):
+    """خطأ في استيراد ملف مضغوط (مع رمز حالة HTTP)"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+class ArchiveIngester:
+    """استيراد محتويات ملف ZIP أو TAR كأدلة دفعة واحدة
+
+    الملف المضغوط يُحفظ كما هو في منطقة التجهيز، ثم يُكتب كل عنصر مباشرة إلى مخزن
+    الأدلة مع حساب بصمته وبصمات أجزائه أثناء الكتابة (دون شجرة ملفات مؤقتة).
+    عناصر ZIP تُعالج بالتوازي، وTAR يُقرأ تسلسليًا كتدفق. كل الأدلة وسجلات التدقيق
+    تُدرج في معاملة واحدة.
+    """
+
+    def __init__(self, evidence_manager: EvidenceManager, staging_dir: str = None):
+        self.evidence_manager = evidence_manager
+        self.staging_dir = Path(staging_dir or settings.UPLOAD_STAGING_DIR)
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+
+    async def spool(self, chunks: AsyncIterator[bytes]) -> Dict:
+        """حفظ جسم الطلب في منطقة التجهيز مع حساب بصمة الملف المضغوط"""
+        path = self.staging_dir / f"{uuid.uuid4().hex}.ingest"
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(path, "wb") as f:
+                async for data in chunks:
+                    size += len(data)
+                    if size > settings.INGEST_MAX_ARCHIVE_SIZE:
+                        raise IngestError(413, f"حجم الملف المضغوط يتجاوز الحد المسموح ({settings.INGEST_MAX_ARCHIVE_SIZE} بايت)")
+                    hasher.update(data)
+                    await f.write(data)
+        except BaseException:
+            path.unlink(missing_ok=True)
+            raise
+
+        if not size:
+            path.unlink(missing_ok=True)
+            raise IngestError(400, "لم يُرسل أي محتوى")
+
+        return {"path": path, "sha256": hasher.hexdigest(), "size": size}
+
+    def ingest(
+        self,
+        spooled: Dict,
+        case_id: int,
+        evidence_type: str,
+        archive_name: str,
+        description: Optional[str] = None,
+        uploaded_by: int = None
+    ) -> Dict:
+        """استخراج العناصر وتسجيلها، مع بيان بنتيجة كل عنصر"""
+        ingest_id = uuid.uuid4().hex[:12]
+        archive_path = spooled["path"]
+        try:
+            if zipfile.is_zipfile(archive_path):
+                archive_format = "zip"
+                members = self._extract_zip(archive_path, ingest_id)
+            elif tarfile.is_tarfile(archive_path):
+                archive_format = "tar"
+                members = self._extract_tar(archive_path, ingest_id)
+            else:
+                raise IngestError(400, "صيغة الملف غير مدعومة (ZIP أو TAR فقط)")
+        finally:
+            archive_path.unlink(missing_ok=True)
+
+        source = {
+            "ingest_id": ingest_id,
+            "archive": archive_name,
+            "archive_sha256": spooled["sha256"]
+        }
+        self._register(members, case_id, evidence_type, description, uploaded_by, source)
+
+        counts = {}
+        for member in members:
+            counts[member["status"]] = counts.get(member["status"], 0) + 1
+
+        event_bus.publish(
+            "evidence.ingested",
+            case_id=case_id,
+            ingest_id=ingest_id,
+            archive=archive_name,
+            counts=counts
+        )
+
+        return {
+            **source,
+            "format": archive_format,
+            "archive_size": spooled["size"],
+            "total": len(members),
+            "counts": counts,
+            "members": [
+                {key: value for key, value in member.items() if not key.startswith("_")}
+                for member in members
+            ]
+        }
+
+    def _member_result(self, index: int, name: str, size: int, status: str, error: str = None) -> Dict:
+        return {
+            "index": index,
+            "member": name,
+            "size": size,
+            "status": status,
+            "sha256": None,
+            "evidence_id": None,
+            "error": error
+        }
+
+    def _check_limits(self, count: int, total_size: int):
+        if count > settings.INGEST_MAX_MEMBERS:
+            raise IngestError(400, f"عدد الملفات يتجاوز الحد المسموح ({settings.INGEST_MAX_MEMBERS})")
+        if total_size > settings.INGEST_MAX_EXTRACTED_SIZE:
+            raise IngestError(413, f"الحجم الكلي للملفات يتجاوز الحد المسموح ({settings.INGEST_MAX_EXTRACTED_SIZE} بايت)")
+
+    def _extract_zip(self, archive_path: Path, ingest_id: str) -> List[Dict]:
+        """عناصر ZIP بالتوازي: لكل خيط مقبض مستقل للملف، وفك الضغط والبصمة يحرران GIL"""
+        try:
+            with zipfile.ZipFile(archive_path) as archive:
+                infos = [info for info in archive.infolist() if not info.is_dir()]
+        except zipfile.BadZipFile:
+            raise IngestError(400, "ملف ZIP تالف")
+
+        self._check_limits(len(infos), sum(info.file_size for info in infos))
+
+        local = threading.local()
+        handles = []
+        handles_lock = threading.Lock()
+
+        def process(index: int, info: zipfile.ZipInfo) -> Dict:
+            if stat.S_ISLNK(info.external_attr >> 16):
+                return self._member_result(index, info.filename, info.file_size, "skipped", "رابط رمزي")
+            if info.flag_bits & 0x1:
+                return self._member_result(index, info.filename, info.file_size, "skipped", "ملف مشفر")
+
+            archive = getattr(local, "archive", None)
+            if archive is None:
+                archive = local.archive = zipfile.ZipFile(archive_path)
+                with handles_lock:
+                    handles.append(archive)
+
+            modified_at = _timestamp(lambda: datetime(*info.date_time))
+            try:
+                with archive.open(info) as source:
+                    return self._store_member(source, index, info.filename, modified_at, ingest_id)
+            except (zipfile.BadZipFile, zlib.error, NotImplementedError, EOFError, OSError) as e:
+                return self._member_result(index, info.filename, info.file_size, "failed", f"تعذر فك الضغط: {e}")
+
+        members = []
+        error = None
+        try:
+            with ThreadPoolExecutor(max_workers=settings.INGEST_WORKERS, thread_name_prefix="ingest") as executor:
+                futures = [executor.submit(process, index, info) for index, info in enumerate(infos)]
+                for future in futures:
+                    try:
+                        members.append(future.result())
+                    except BaseException as e:
+                        error = error or e
+        finally:
+            for archive in handles:
+                archive.close()
+
+        if error is not None:
+            # خطأ غير متوقع في أحد العناصر: حذف ما كُتب إلى مخزن الأدلة قبل إعادة رفعه
+            self._discard(members)
+            raise error
+        return members
+
+    def _extract_tar(self, archive_path: Path, ingest_id: str) -> List[Dict]:
+        """عناصر TAR (مضغوط أو لا) كتدفق تسلسلي في قراءة واحدة"""
+        members = []
+        total_size = 0
+        try:
+            with tarfile.open(archive_path, "r|*") as archive:
+                for info in archive:
+                    if info.isdir():
+                        continue
+                    index = len(members)
+                    total_size += info.size
+                    self._check_limits(index + 1, total_size)
+
+                    if not info.isreg():
+                        members.append(self._member_result(index, info.name, info.size, "skipped", "ليس ملفًا عاديًا"))
+                        continue
+
+                    modified_at = _timestamp(lambda: datetime.fromtimestamp(info.mtime))
+                    members.append(self._store_member(archive.extractfile(info), index, info.name, modified_at, ingest_id))
+        except IngestError:
+            self._discard(members)
+            raise
+        except (tarfile.TarError, zlib.error, EOFError, OSError) as e:
+            if not members:
+                raise IngestError(400, f"ملف TAR تالف: {e}")
+            # ملف مقطوع: ما استُخرج قبل موضع التلف يبقى صالحًا
+            members.append(self._member_result(len(members), None, None, "failed", f"توقف القراءة: {e}"))
+        except BaseException:
+            self._discard(members)
+            raise
+        return members
+
+    def _store_member(self, source: BinaryIO, index: int, name: str, modified_at: Optional[str], ingest_id: str) -> Dict:
+        """كتابة العنصر إلى مخزن الأدلة مع SHA-256 الكامل وبصمات أجزاء Merkle في المرور نفسه"""
+        filename = PurePosixPath(name.replace("\\", "/")).name or f"member_{index}"
+        file_path = self.evidence_manager.storage_path(f"{ingest_id}_{index}_{filename}")
+        chunk_size = self.evidence_manager.merkle.chunk_size
+
+        digest = hashlib.sha256()
+        chunk_hasher = hashlib.sha256()
+        chunk_filled = 0
+        leaves = []
+        size = 0
+        try:
+            with open(file_path, "wb") as f:
+                for block in iter(lambda: source.read(1024 * 1024), b""):
+                    f.write(block)
+                    digest.update(block)
+                    size += len(block)
+                    view = memoryview(block)
+                    while view:
+                        take = min(len(view), chunk_size - chunk_filled)
+                        chunk_hasher.update(view[:take])
+                        chunk_filled += take
+                        view = view[take:]
+                        if chunk_filled == chunk_size:
+                            leaves.append(chunk_hasher.hexdigest())
+                            chunk_hasher = hashlib.sha256()
+                            chunk_filled = 0
+        except BaseException:
+            file_path.unlink(missing_ok=True)
+            raise
+
+        if chunk_filled or not leaves:
+            leaves.append(chunk_hasher.hexdigest())
+
+        result = self._member_result(index, name, size, "stored")
+        result.update({
+            "sha256": digest.hexdigest(),
+            "_filename": filename,
+            "_file_path": file_path,
+            "_leaves": leaves,
+            "_modified_at": modified_at
+        })
+        return result
+
+    def _discard(self, members: List[Dict]):
+        for member in members:
+            if member.get("_file_path"):
+                member["_file_path"].unlink(missing_ok=True)
+
+    def _register(
+        self,
+        members: List[Dict],
+        case_id: int,
+        evidence_type: str,
+        description: Optional[str],
+        uploaded_by: Optional[int],
+        source: Dict
+    ):
+        """إزالة التكرار ثم إدراج الأدلة والروابط وسجلات التدقيق في معاملة واحدة"""
+        first_by_hash = {}
+        new_members = []
+        existing_members = []
+        for member in members:
+            if member["status"] != "stored":
+                continue
+            first = first_by_hash.get(member["sha256"])
+            if first is not None:
+                # نسخة مكررة داخل الملف المضغوط نفسه
+                member["status"] = "duplicate"
+                member["_duplicate_of"] = first
+                continue
+            first_by_hash[member["sha256"]] = member
+
+            existing = known_hashes.lookup(member["sha256"])
+            if existing:
+                member["evidence_id"] = existing["id"]
+                member["status"] = "exists" if existing["case_id"] == case_id else "linked"
+                existing_members.append(member)
+            else:
+                new_members.append(member)
+
+        # الملفات المكررة لا تُحفظ مرتين
+        self._discard([member for member in members if member["status"] in ("duplicate", "exists", "linked")])
+
+        chunk_size = self.evidence_manager.merkle.chunk_size
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+
+            inserted = []
+            for member in new_members:
+                metadata = {
+                    "source_archive": source["archive"],
+                    "archive_sha256": source["archive_sha256"],
+                    "ingest_id": source["ingest_id"],
+                    "member_path": member["member"],
+                    "modified_at": member["_modified_at"]
+                }
+                cursor.execute('''
+                INSERT INTO evidence
+                (case_id, evidence_type, filename, file_hash, file_path, description, uploaded_by, metadata)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(file_hash) DO NOTHING
+                ''', (
+                    case_id,
+                    evidence_type,
+                    member["_filename"],
+                    member["sha256"],
+                    str(member["_file_path"]),
+                    description,
+                    uploaded_by,
+                    json.dumps(metadata, ensure_ascii=False)
+                ))
+                if cursor.rowcount:
+                    member["evidence_id"] = cursor.lastrowid
+                    inserted.append(member)
+                    continue
+
+                # سُجل المحتوى نفسه من طلب آخر بعد فحص التكرار
+                cursor.execute("SELECT id, case_id FROM evidence WHERE file_hash = ?", (member["sha256"],))
+                existing_id, existing_case_id = cursor.fetchone()
+                member["evidence_id"] = existing_id
+                member["status"] = "exists" if existing_case_id == case_id else "linked"
+                existing_members.append(member)
+
+            cursor.executemany('''
+            INSERT INTO evidence_merkle (evidence_id, chunk_size, chunk_count, file_size, merkle_root)
+            VALUES (?, ?, ?, ?, ?)
+            ''', [
+                (m["evidence_id"], chunk_size, len(m["_leaves"]), m["size"], merkle_root(m["_leaves"]))
+                for m in inserted
+            ])
+            cursor.executemany(
+                "INSERT INTO evidence_chunks (evidence_id, chunk_index, chunk_hash) VALUES (?, ?, ?)",
+                (
+                    (m["evidence_id"], index, leaf)
+                    for m in inserted
+                    for index, leaf in enumerate(m["_leaves"])
+                )
+            )
+
+            linked = [m for m in existing_members if m["status"] == "linked"]
+            cursor.executemany('''
+            INSERT OR IGNORE INTO evidence_links (evidence_id, case_id, description, linked_by)
+            VALUES (?, ?, ?, ?)
+            ''', [(m["evidence_id"], case_id, description, uploaded_by) for m in linked])
+
+            audit_records = [
+                (uploaded_by, "UPLOAD", "EVIDENCE", m["evidence_id"],
+                 f"رفع دليل: {m['_filename']} للقضية #{case_id} من الملف المضغوط {source['archive']}")
+                for m in inserted
+            ] + [
+                (uploaded_by, "LINK", "EVIDENCE", m["evidence_id"], f"ربط دليل موجود بالقضية #{case_id}")
+                for m in linked
+            ]
+            summary = (
+                f"استيراد الملف المضغوط {source['archive']} ({source['ingest_id']}): "
+                f"{len(inserted)} دليل جديد، {len(linked)} مرتبط، {len(members)} عنصر"
+            )
+            audit_records.append((uploaded_by, "INGEST", "CASE", case_id, summary))
+            if uploaded_by:
+                cursor.executemany('''
+                INSERT INTO audit_log (user_id, action, entity_type, entity_id, details)
+                VALUES (?, ?, ?, ?, ?)
+                ''', audit_records)
+
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            self._discard(new_members)
+            raise IngestError(500, f"خطأ في حفظ الأدلة: {str(e)}")
+        finally:
+            conn.close()
+
+        # الخاسر في سباق التسجيل لا يحتاج ملفه
+        self._discard([m for m in new_members if m["status"] != "stored"])
+
+        for member in inserted:
+            known_hashes.add(member["sha256"])
+            metadata_extractor.submit(member["sha256"])
+            content_indexer.submit(member["evidence_id"])
+        for member in members:
+            if member["status"] == "duplicate":
+                member["evidence_id"] = member.pop("_duplicate_of")["evidence_id"]
+
+        if uploaded_by:
+            event_bus.publish(
+                "audit",
+                case_id=case_id,
+                action="INGEST",
+                entity_type="CASE",
+                entity_id=case_id,
+                user_id=uploaded_by,
+                details=summary
+            )
@@ -1,14 +1,24 @@
 import hashlib
+import json
 import os
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, timedelta
+from typing import List, Optional
 import sqlite3
 from pathlib import Path
 
+from app.core.events import event_bus
+from app.core.single_flight import single_flight
+from app.config import settings
+from app.modules.evidence_engine.hash_index import known_hashes
+from app.modules.evidence_engine.merkle import MerkleHasher, merkle_root
+from app.modules.evidence_engine.metadata_extractor import metadata_extractor
+from app.modules.search.content_indexer import content_indexer
+
 class EvidenceManager:
     def __init__(self, upload_dir: str = "app/static/uploads"):
         self.upload_dir = Path(upload_dir)
         self.upload_dir.mkdir(parents=True, exist_ok=True)
+        self.merkle = MerkleHasher()
     
     def calculate_hash(self, file_path: str) -> str:
         """حساب بصمة SHA256 للملف"""
@@ -29,10 +39,7 @@ class EvidenceManager:
         url: Optional[str] = None
     ) -> dict:
         """حفظ دليل جديد"""
-        # إنشاء اسم فريد للملف
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        safe_filename = f"{timestamp}_{Path(filename).name}"
-        file_path = self.upload_dir / safe_filename
+        file_path = self.storage_path(filename)
         
         # حفظ الملف
         with open(file_path, "wb") as f:
@@ -41,15 +48,50 @@ class EvidenceManager:
         # حساب بصمة الملف
         file_hash = self.calculate_hash(str(file_path))
         
-        # حفظ في قاعدة البيانات
+        result = self.register_evidence_file(
+            case_id=case_id,
+            evidence_type=evidence_type,
+            file_path=file_path,
+            filename=filename,
+            file_hash=file_hash,
+            description=description,
+            uploaded_by=uploaded_by,
+            url=url
+        )
+        if "error" in result and result.get("file_hash"):
+            return self.link_duplicate(file_path, file_hash, case_id, description, uploaded_by) or result
+        return result
+    
+    def storage_path(self, filename: str) -> Path:
+        """مسار فريد لحفظ ملف الدليل"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        return self.upload_dir / f"{timestamp}_{Path(filename).name}"
+    
+    def register_evidence_file(
+        self,
+        case_id: int,
+        evidence_type: str,
+        file_path: Path,
+        filename: str,
+        file_hash: str,
+        description: Optional[str] = None,
+        uploaded_by: int = None,
+        url: Optional[str] = None,
+        metadata: Optional[dict] = None
+    ) -> dict:
+        """تسجيل ملف محفوظ ومعروف البصمة كدليل في قاعدة البيانات"""
+        # بصمات الأجزاء تُحسب بالتوازي قبل فتح معاملة الكتابة
+        root, leaves = self.merkle.build(str(file_path))
+        file_size = os.path.getsize(file_path)
+        
         conn = sqlite3.connect("cybershield.db")
         cursor = conn.cursor()
         
         try:
             cursor.execute('''
             INSERT INTO evidence 
-            (case_id, evidence_type, filename, file_hash, file_path, url, description, uploaded_by)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            (case_id, evidence_type, filename, file_hash, file_path, url, description, uploaded_by, metadata)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 case_id,
                 evidence_type,
@@ -58,11 +100,24 @@ class EvidenceManager:
                 str(file_path),
                 url,
                 description,
-                uploaded_by
+                uploaded_by,
+                json.dumps(metadata, ensure_ascii=False) if metadata else None
             ))
             
             evidence_id = cursor.lastrowid
+            self._store_chunk_index(cursor, evidence_id, file_size, root, leaves)
             conn.commit()
+            known_hashes.add(file_hash)
+            metadata_extractor.submit(file_hash)
+            content_indexer.submit(evidence_id)
+            
+            event_bus.publish(
+                "evidence.uploaded",
+                case_id=case_id,
+                evidence_id=evidence_id,
+                evidence_type=evidence_type,
+                filename=filename
+            )
             
             # تسجيل في سجل التدقيق
             if uploaded_by:
@@ -96,6 +151,7 @@ class EvidenceManager:
         finally:
             conn.close()
     
+    @single_flight.coalesce("verify_integrity")
     def verify_integrity(self, evidence_id: int) -> bool:
         """التحقق من سلامة الدليل (عدم التعديل)"""
         conn = sqlite3.connect("cybershield.db")
@@ -113,6 +169,285 @@ class EvidenceManager:
         current_hash = self.calculate_hash(evidence["file_path"])
         return current_hash == evidence["file_hash"]
     
+    def _store_chunk_index(self, cursor, evidence_id: int, file_size: int, root: str, leaves: List[str]):
+        cursor.execute('''
+        INSERT OR REPLACE INTO evidence_merkle (evidence_id, chunk_size, chunk_count, file_size, merkle_root)
+        VALUES (?, ?, ?, ?, ?)
+        ''', (evidence_id, self.merkle.chunk_size, len(leaves), file_size, root))
+        cursor.execute("DELETE FROM evidence_chunks WHERE evidence_id = ?", (evidence_id,))
+        cursor.executemany(
+            "INSERT INTO evidence_chunks (evidence_id, chunk_index, chunk_hash) VALUES (?, ?, ?)",
+            [(evidence_id, index, leaf) for index, leaf in enumerate(leaves)]
+        )
+    
+    def get_chunk_index(self, evidence_id: int, build_missing: bool = True) -> Optional[dict]:
+        """فهرس أجزاء الدليل، مع بنائه للأدلة القديمة بعد مطابقة بصمتها القانونية"""
+        conn = sqlite3.connect("cybershield.db")
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+            SELECT e.id, e.file_path, e.file_hash, m.chunk_size, m.chunk_count, m.file_size,
+                   m.merkle_root, m.verify_started_at
+            FROM evidence e
+            LEFT JOIN evidence_merkle m ON m.evidence_id = e.id
+            WHERE e.id = ?
+            ''', (evidence_id,))
+            evidence = cursor.fetchone()
+            if not evidence or not evidence["file_path"] or not os.path.exists(evidence["file_path"]):
+                return None
+            if evidence["merkle_root"] or not build_missing:
+                return dict(evidence) if evidence["merkle_root"] else None
+            
+            digest, root, leaves = self.merkle.build_with_digest(evidence["file_path"])
+            if digest != evidence["file_hash"]:
+                return {"error": "بصمة الملف لا تطابق البصمة القانونية المخزنة، لا يمكن فهرسة أجزائه"}
+            
+            file_size = os.path.getsize(evidence["file_path"])
+            self._store_chunk_index(cursor, evidence_id, file_size, root, leaves)
+            conn.commit()
+            
+            return {
+                **dict(evidence),
+                "chunk_size": self.merkle.chunk_size,
+                "chunk_count": len(leaves),
+                "file_size": file_size,
+                "merkle_root": root,
+                "verify_started_at": None
+            }
+        finally:
+            conn.close()
+    
+    def _check_chunks(self, conn, index: dict, indices: List[int], stored: dict):
+        """حساب بصمات الأجزاء المحددة بالتوازي وحفظ نتيجة كل جزء فور اكتماله"""
+        pending = []
+        
+        def record(chunk_index: int, chunk_hash: str):
+            status = "ok" if chunk_hash == stored[chunk_index] else "corrupt"
+            pending.append((status, datetime.now().isoformat(), index["id"], chunk_index))
+            # حفظ التقدم تدريجيًا ليُستأنف التحقق بعد أي انقطاع
+            if len(pending) >= 32:
+                flush()
+        
+        def flush():
+            conn.executemany(
+                "UPDATE evidence_chunks SET status = ?, verified_at = ? WHERE evidence_id = ? AND chunk_index = ?",
+                pending
+            )
+            conn.commit()
+            pending.clear()
+        
+        try:
+            self.merkle.hash_chunks(index["file_path"], indices, index["chunk_size"], on_result=record)
+        finally:
+            if pending:
+                flush()
+    
+    def _chunk_error(self, index: dict, chunk_index: int) -> dict:
+        start, end = self.merkle.chunk_range(chunk_index, index["file_size"], index["chunk_size"])
+        return {"index": chunk_index, "start": start, "end": end}
+    
+    @single_flight.coalesce("verify_chunks")
+    def verify_chunks(self, evidence_id: int, resume: bool = False) -> dict:
+        """تحقق متوازٍ من أجزاء الدليل مع تحديد مواضع التلف
+
+        resume=True يكمل آخر تحقق: يعيد فحص الأجزاء التالفة أو التي لم تُفحص منذ بدايته فقط.
+        """
+        index = self.get_chunk_index(evidence_id)
+        if not index:
+            return {}
+        if "error" in index:
+            return {"evidence_id": evidence_id, "verified": False, "error": index["error"]}
+        
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+            SELECT chunk_index, chunk_hash, status, verified_at FROM evidence_chunks
+            WHERE evidence_id = ? ORDER BY chunk_index
+            ''', (evidence_id,))
+            chunks = cursor.fetchall()
+            stored = {row[0]: row[1] for row in chunks}
+            
+            # الجذر يكشف أي تعديل على بصمات الأجزاء المخزنة نفسها
+            if merkle_root([row[1] for row in chunks]) != index["merkle_root"]:
+                return {"evidence_id": evidence_id, "verified": False, "error": "فهرس الأجزاء المخزن لا يطابق جذر Merkle"}
+            
+            started_at = index["verify_started_at"]
+            if resume and started_at:
+                indices = [
+                    row[0] for row in chunks
+                    if row[2] != "ok" or row[3] is None or row[3] < started_at
+                ]
+            else:
+                cursor.execute(
+                    "UPDATE evidence_merkle SET verify_started_at = ? WHERE evidence_id = ?",
+                    (datetime.now().isoformat(), evidence_id)
+                )
+                conn.commit()
+                indices = list(stored)
+            
+            self._check_chunks(conn, index, indices, stored)
+            
+            cursor.execute(
+                "SELECT chunk_index FROM evidence_chunks WHERE evidence_id = ? AND status = 'corrupt' ORDER BY chunk_index",
+                (evidence_id,)
+            )
+            corrupt = [self._chunk_error(index, row[0]) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+        
+        size_matches = os.path.getsize(index["file_path"]) == index["file_size"]
+        return {
+            "evidence_id": evidence_id,
+            "verified": not corrupt and size_matches,
+            "merkle_root": index["merkle_root"],
+            "chunk_size": index["chunk_size"],
+            "chunk_count": index["chunk_count"],
+            "checked_chunks": len(indices),
+            "size_matches": size_matches,
+            "corrupt_chunks": corrupt
+        }
+    
+    def verify_range(self, evidence_id: int, start: int, end: int) -> List[dict]:
+        """التحقق من الأجزاء التي يغطيها نطاق التنزيل، وإرجاع التالف منها
+
+        الأجزاء التي تم التحقق منها مؤخرًا لا يُعاد فحصها، والأدلة غير المفهرسة تُتجاوز.
+        """
+        index = self.get_chunk_index(evidence_id, build_missing=False)
+        if not index:
+            return []
+        
+        chunk_size = index["chunk_size"]
+        first, last = start // chunk_size, end // chunk_size
+        cutoff = (datetime.now() - timedelta(seconds=settings.MERKLE_REVERIFY_SECONDS)).isoformat()
+        
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+            SELECT chunk_index, chunk_hash, status, verified_at FROM evidence_chunks
+            WHERE evidence_id = ? AND chunk_index BETWEEN ? AND ?
+            ''', (evidence_id, first, last))
+            chunks = cursor.fetchall()
+            stored = {row[0]: row[1] for row in chunks}
+            stale = [
+                row[0] for row in chunks
+                if row[2] != "ok" or row[3] is None or row[3] < cutoff
+            ]
+            if stale:
+                self._check_chunks(conn, index, stale, stored)
+            
+            cursor.execute('''
+            SELECT chunk_index FROM evidence_chunks
+            WHERE evidence_id = ? AND chunk_index BETWEEN ? AND ? AND status = 'corrupt'
+            ''', (evidence_id, first, last))
+            return [self._chunk_error(index, row[0]) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+    
+    def get_evidence_case_ids(self, evidence_id: int) -> List[int]:
+        """القضايا المرتبطة بالدليل: قضية الرفع ثم القضايا المربوطة (للتحقق من الصلاحية)"""
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+            SELECT case_id FROM evidence WHERE id = ?
+            UNION ALL
+            SELECT case_id FROM evidence_links WHERE evidence_id = ?
+            ''', (evidence_id, evidence_id))
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            conn.close()
+    
+    def get_evidence_file(self, evidence_id: int) -> Optional[dict]:
+        """بيانات ملف الدليل اللازمة للتنزيل (دون حساب البصمة)"""
+        conn = sqlite3.connect("cybershield.db")
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id, case_id, filename, file_hash, file_path FROM evidence WHERE id = ?",
+                (evidence_id,)
+            )
+            row = cursor.fetchone()
+            return dict(row) if row else None
+        finally:
+            conn.close()
+    
+    def find_by_hash(self, file_hash: str, size: Optional[int] = None) -> Optional[dict]:
+        """دليل مخزن بنفس البصمة (والحجم إن وُجد) وملفه ما زال موجودًا"""
+        existing = known_hashes.lookup(file_hash)
+        if not existing or not os.path.exists(existing["file_path"]):
+            return None
+        if size is not None and os.path.getsize(existing["file_path"]) != size:
+            return None
+        return existing
+    
+    def link_existing(
+        self,
+        evidence_id: int,
+        case_id: int,
+        description: Optional[str] = None,
+        linked_by: int = None
+    ) -> bool:
+        """ربط دليل موجود بقضية أخرى دون نسخ الملف؛ False إذا كان مرتبطًا بها مسبقًا"""
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+            INSERT OR IGNORE INTO evidence_links (evidence_id, case_id, description, linked_by)
+            SELECT id, ?, ?, ? FROM evidence WHERE id = ? AND case_id != ?
+            ''', (case_id, description, linked_by, evidence_id, case_id))
+            conn.commit()
+            linked = cursor.rowcount > 0
+        finally:
+            conn.close()
+        
+        if linked:
+            event_bus.publish("evidence.linked", case_id=case_id, evidence_id=evidence_id)
+            
+            if linked_by:
+                from app.core.security import log_audit
+                log_audit(
+                    linked_by,
+                    "LINK",
+                    "EVIDENCE",
+                    evidence_id,
+                    f"ربط دليل موجود بالقضية #{case_id}"
+                )
+        
+        return linked
+    
+    def link_duplicate(
+        self,
+        file_path: Path,
+        file_hash: str,
+        case_id: int,
+        description: Optional[str] = None,
+        linked_by: int = None
+    ) -> Optional[dict]:
+        """المحتوى المستلم مطابق لدليل مخزن: حذف النسخة المكررة وربط الدليل الموجود بالقضية
+
+        يُستدعى فقط بعد استلام الملف كاملًا ومطابقة بصمته، فمعرفة البصمة وحدها لا تكفي للربط.
+        """
+        existing = self.find_by_hash(file_hash)
+        if not existing:
+            return None
+        
+        # قد يكون الملف الجديد كُتب فوق ملف الدليل نفسه (نفس الاسم في نفس الثانية)
+        if os.path.abspath(file_path) != os.path.abspath(existing["file_path"]):
+            Path(file_path).unlink(missing_ok=True)
+        
+        linked = self.link_existing(existing["id"], case_id, description=description, linked_by=linked_by)
+        return {
+            "id": existing["id"],
+            "filename": existing["filename"],
+            "file_hash": file_hash,
+            "linked": linked,
+            "message": "الدليل موجود مسبقًا وتم ربطه بالقضية" if linked else "الدليل مرتبط بالقضية مسبقًا"
+        }
+    
     def get_evidence_info(self, evidence_id: int) -> dict:
         """الحصول على معلومات الدليل"""
         conn = sqlite3.connect("cybershield.db")
@@ -147,51 +482,6 @@ class EvidenceManager:
             "uploaded_by": evidence["uploaded_by_name"],
             "uploaded_at": evidence["uploaded_at"],
             "integrity_verified": is_integrity_ok,
-            "file_exists": os.path.exists(evidence["file_path"])
+            "file_exists": os.path.exists(evidence["file_path"]),
+            "metadata": json.loads(evidence["metadata"]) if evidence["metadata"] else None
         }
-    
-    def archive_url(self, url: str, case_id: int, uploaded_by: int) -> dict:
-        """أرشفة رابط كدليل"""
-        import requests
-        from urllib.parse import urlparse
-        
-        try:
-            # استخراج معلومات الرابط
-            parsed_url = urlparse(url)
-            domain = parsed_url.netloc
-            filename = f"url_archive_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-            
-            # محتوى الأرشيف
-            archive_content = f"""
-            === معلومات الأرشفة ===
-            الرابط: {url}
-            النطاق: {domain}
-            وقت الأرشفة: {datetime.now().isoformat()}
-            حالة القضية: #{case_id}
-            
-            === محتوى الصفحة (لاحقاً يمكن إضافة حفظ الصفحة) ===
-            [سيتم حفظ محتوى الصفحة في إصدارات لاحقة]
-            """
-            
-            # حفظ كملف نصي
-            file_path = self.upload_dir / filename
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(archive_content)
-            
-            # قراءة المحتوى للبصمة
-            with open(file_path, "rb") as f:
-                file_content = f.read()
-            
-            # حفظ في قاعدة البيانات
-            return self.save_evidence(
-                case_id=case_id,
-                evidence_type="url_archive",
-                file_content=file_content,
-                filename=filename,
-                description=f"أرشيف للرابط: {url}",
-                uploaded_by=uploaded_by,
-                url=url
-            )
-            
-        except Exception as e:
-            return {"error": f"خطأ في أرشفة الرابط: {str(e)}"}
@@ -0,0 +1,87 @@
+import math
+import sqlite3
+import threading
+from typing import Optional
+
+from app.config import settings
+
+
+class BloomFilter:
+    """مرشح Bloom لبصمات SHA-256 (النفي مؤكد، والإثبات يحتاج تأكيدًا من القاعدة)"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, sha256_hex: str):
+        # البصمة نفسها موزعة بانتظام، فتكفي التجزئة المزدوجة من أجزائها
+        h1 = int(sha256_hex[:16], 16)
+        h2 = int(sha256_hex[16:32], 16) | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, sha256_hex: str):
+        for position in self._positions(sha256_hex):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, sha256_hex: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(sha256_hex))
+
+
+class KnownHashIndex:
+    """فهرس البصمات المعروفة: مرشح Bloom في الذاكرة مع تأكيد من جدول الأدلة"""
+
+    def __init__(self, capacity: int = None, error_rate: float = None):
+        self.capacity = capacity or settings.EVIDENCE_BLOOM_CAPACITY
+        self.error_rate = error_rate or settings.EVIDENCE_BLOOM_ERROR_RATE
+        self._lock = threading.Lock()
+        self._filter = BloomFilter(self.capacity, self.error_rate)
+
+    def rebuild(self) -> int:
+        """إعادة بناء المرشح من جدول الأدلة (عند بدء التشغيل)"""
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        count = 0
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT file_hash FROM evidence WHERE file_hash IS NOT NULL")
+            while True:
+                rows = cursor.fetchmany(5000)
+                if not rows:
+                    break
+                for (file_hash,) in rows:
+                    bloom.add(file_hash.lower())
+                count += len(rows)
+        finally:
+            conn.close()
+
+        with self._lock:
+            self._filter = bloom
+        return count
+
+    def add(self, sha256_hex: str):
+        with self._lock:
+            self._filter.add(sha256_hex.lower())
+
+    def lookup(self, sha256_hex: str) -> Optional[dict]:
+        """الدليل المخزن بهذه البصمة، دون الوصول للقاعدة إذا نفى المرشح وجودها"""
+        sha256_hex = sha256_hex.lower()
+        if sha256_hex not in self._filter:
+            return None
+
+        conn = sqlite3.connect("cybershield.db")
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id, case_id, evidence_type, filename, file_path FROM evidence WHERE file_hash = ?",
+                (sha256_hex,)
+            )
+            row = cursor.fetchone()
+            return dict(row) if row else None
+        finally:
+            conn.close()
+
+
+known_hashes = KnownHashIndex()
@@ -0,0 +1,106 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from app.config import settings
+
+
+def merkle_root(leaves: List[str]) -> str:
+    """جذر شجرة Merkle من بصمات الأجزاء (العقدة المفردة في المستوى تُرفع كما هي)"""
+    if not leaves:
+        return hashlib.sha256(b"").hexdigest()
+
+    level = [bytes.fromhex(leaf) for leaf in leaves]
+    while len(level) > 1:
+        next_level = [
+            hashlib.sha256(level[i] + level[i + 1]).digest()
+            for i in range(0, len(level) - 1, 2)
+        ]
+        if len(level) % 2:
+            next_level.append(level[-1])
+        level = next_level
+    return level[0].hex()
+
+
+class MerkleHasher:
+    """بصمات أجزاء الملف بالتوازي
+
+    hashlib يحرر GIL أثناء حساب البصمة، فالخيوط تستخدم كل الأنوية
+    والقراءة بـ os.pread لا تتشارك موضع الملف بين الخيوط.
+    """
+
+    def __init__(self, chunk_size: int = None, workers: int = None):
+        self.chunk_size = chunk_size or settings.MERKLE_CHUNK_SIZE
+        self.workers = workers or settings.MERKLE_HASH_WORKERS
+
+    def chunk_count(self, size: int, chunk_size: int = None) -> int:
+        chunk_size = chunk_size or self.chunk_size
+        return max(1, (size + chunk_size - 1) // chunk_size)
+
+    def chunk_range(self, index: int, size: int, chunk_size: int = None) -> Tuple[int, int]:
+        """نطاق البايتات (شامل) للجزء"""
+        chunk_size = chunk_size or self.chunk_size
+        start = index * chunk_size
+        return start, min(start + chunk_size, size) - 1
+
+    def _hash_chunk(self, fd: int, index: int, chunk_size: int) -> str:
+        hasher = hashlib.sha256()
+        offset = index * chunk_size
+        remaining = chunk_size
+        while remaining:
+            block = os.pread(fd, min(remaining, 1024 * 1024), offset)
+            if not block:
+                break
+            hasher.update(block)
+            offset += len(block)
+            remaining -= len(block)
+        return hasher.hexdigest()
+
+    def hash_chunks(
+        self,
+        file_path: str,
+        indices: Optional[Iterable[int]] = None,
+        chunk_size: int = None,
+        on_result: Callable[[int, str], None] = None
+    ) -> List[Tuple[int, str]]:
+        """بصمات الأجزاء المطلوبة (أو كلها) بالترتيب؛ on_result تُستدعى عند اكتمال كل جزء"""
+        chunk_size = chunk_size or self.chunk_size
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            if indices is None:
+                indices = range(self.chunk_count(os.fstat(fd).st_size, chunk_size))
+            indices = list(indices)
+
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="merkle") as executor:
+                futures = [executor.submit(self._hash_chunk, fd, index, chunk_size) for index in indices]
+                results = []
+                for index, future in zip(indices, futures):
+                    chunk_hash = future.result()
+                    results.append((index, chunk_hash))
+                    if on_result:
+                        on_result(index, chunk_hash)
+                return results
+        finally:
+            os.close(fd)
+
+    def build(self, file_path: str) -> Tuple[str, List[str]]:
+        """(الجذر، بصمات الأجزاء) للملف كاملًا"""
+        leaves = [chunk_hash for _, chunk_hash in self.hash_chunks(file_path)]
+        return merkle_root(leaves), leaves
+
+    def build_with_digest(self, file_path: str) -> Tuple[str, str, List[str]]:
+        """(SHA-256 الكامل، الجذر، بصمات الأجزاء) في قراءة تسلسلية واحدة
+
+        يُستخدم لفهرسة الأدلة القديمة: لا تُحفظ بصمات الأجزاء إلا إذا طابق
+        SHA-256 الكامل البصمة القانونية المخزنة.
+        """
+        digest = hashlib.sha256()
+        leaves = []
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                digest.update(chunk)
+                leaves.append(hashlib.sha256(chunk).hexdigest())
+        if not leaves:
+            leaves.append(hashlib.sha256(b"").hexdigest())
+        return digest.hexdigest(), merkle_root(leaves), leaves
@@ -0,0 +1,442 @@
+import codecs
+import html
+import json
+import os
+import queue
+import re
+import sqlite3
+import struct
+import threading
+import zipfile
+from datetime import datetime
+from html.parser import HTMLParser
+from typing import Dict, Iterator, Optional, Tuple
+
+from app.config import settings
+from app.core.events import event_bus
+
+
+# (الإزاحة، التوقيع، نوع MIME) حسب البايتات الأولى للملف
+MAGIC_SIGNATURES = [
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (0, b"BM", "image/bmp"),
+    (0, b"%PDF-", "application/pdf"),
+    (0, b"PK\x03\x04", "application/zip"),
+    (0, b"PK\x05\x06", "application/zip"),
+    (0, b"\x1f\x8b", "application/gzip"),
+    (0, b"7z\xbc\xaf\x27\x1c", "application/x-7z-compressed"),
+    (0, b"Rar!\x1a\x07", "application/vnd.rar"),
+    (0, b"SQLite format 3\x00", "application/vnd.sqlite3"),
+    (0, b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "application/x-ole-storage"),
+    (0, b"OggS", "audio/ogg"),
+    (0, b"ID3", "audio/mpeg"),
+    (0, b"\x1aE\xdf\xa3", "video/webm"),
+    (4, b"ftyp", "video/mp4"),
+    (257, b"ustar", "application/x-tar"),
+]
+
+# حاويات ZIP المعروفة: (مسار عنصر مميز، نوع MIME)
+ZIP_CONTAINERS = [
+    ("word/document.xml", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"),
+    ("xl/workbook.xml", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    ("ppt/presentation.xml", "application/vnd.openxmlformats-officedocument.presentationml.presentation"),
+    ("AndroidManifest.xml", "application/vnd.android.package-archive"),
+]
+
+TEXT_MIME_TYPES = ("text/plain", "text/html", "text/csv", "application/json", "application/xml")
+
+EXIF_TAGS = {
+    0x010F: "camera_make",
+    0x0110: "camera_model",
+    0x0131: "software",
+    0x0132: "modified_at",
+    0x9003: "taken_at",
+    0x9004: "digitized_at",
+}
+
+
+def sniff_mime(header: bytes) -> str:
+    """نوع المحتوى من التوقيع (البايتات السحرية)، ثم التحقق من كونه نصًا"""
+    for offset, signature, mime_type in MAGIC_SIGNATURES:
+        if header[offset:offset + len(signature)] == signature:
+            return mime_type
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+        return "audio/wav"
+
+    encoding = _text_encoding(header)
+    if not encoding:
+        return "application/octet-stream"
+
+    text = header.decode(encoding, errors="ignore").lstrip("\ufeff \t\r\n").lower()
+    if text.startswith(("<!doctype html", "<html", "<head", "<body")):
+        return "text/html"
+    if text.startswith("<?xml"):
+        return "application/xml"
+    if text.startswith(("{", "[")):
+        return "application/json"
+    return "text/plain"
+
+
+def _text_encoding(header: bytes) -> Optional[str]:
+    if header.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    if b"\x00" in header:
+        return None
+    try:
+        # الحرف الأخير قد يكون مقطوعًا عند حد القراءة
+        codecs.getincrementaldecoder("utf-8")().decode(header, final=False)
+    except UnicodeDecodeError:
+        return None
+    return "utf-8-sig" if header.startswith(codecs.BOM_UTF8) else "utf-8"
+
+
+def image_dimensions(header: bytes, mime_type: str) -> Optional[Tuple[int, int]]:
+    """(العرض، الارتفاع) من ترويسة الصورة دون فك ترميزها"""
+    try:
+        if mime_type == "image/png":
+            return struct.unpack(">II", header[16:24])
+        if mime_type == "image/gif":
+            return struct.unpack("<HH", header[6:10])
+        if mime_type == "image/bmp":
+            width, height = struct.unpack("<ii", header[18:26])
+            return width, abs(height)
+        if mime_type == "image/webp":
+            chunk = header[12:16]
+            if chunk == b"VP8 ":
+                width, height = struct.unpack("<HH", header[26:30])
+                return width & 0x3FFF, height & 0x3FFF
+            if chunk == b"VP8L":
+                bits = int.from_bytes(header[21:25], "little")
+                return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if chunk == b"VP8X":
+                return int.from_bytes(header[24:27], "little") + 1, int.from_bytes(header[27:30], "little") + 1
+        if mime_type == "image/jpeg":
+            for marker, segment in _jpeg_segments(header):
+                if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                    height, width = struct.unpack(">HH", segment[1:5])
+                    return width, height
+    except struct.error:
+        return None
+    return None
+
+
+def _jpeg_segments(header: bytes) -> Iterator[Tuple[int, bytes]]:
+    """مقاطع JPEG حتى بداية بيانات الصورة (SOS)"""
+    position = 2
+    while position + 4 <= len(header):
+        if header[position] != 0xFF:
+            return
+        marker = header[position + 1]
+        if marker == 0xFF:
+            position += 1
+            continue
+        if marker == 0xDA:
+            return
+        length = struct.unpack(">H", header[position + 2:position + 4])[0]
+        yield marker, header[position + 4:position + 2 + length]
+        position += 2 + length
+
+
+def exif_fields(header: bytes) -> Dict:
+    """التواريخ وبيانات الجهاز من EXIF في صور JPEG"""
+    for marker, segment in _jpeg_segments(header):
+        if marker == 0xE1 and segment.startswith(b"Exif\x00\x00"):
+            try:
+                return _parse_exif(segment[6:])
+            except (struct.error, IndexError, ValueError):
+                return {}
+    return {}
+
+
+def _parse_exif(tiff: bytes) -> Dict:
+    endian = "<" if tiff[:2] == b"II" else ">"
+    fields = {}
+
+    def read_ifd(offset: int) -> Optional[int]:
+        exif_offset = None
+        count = struct.unpack(endian + "H", tiff[offset:offset + 2])[0]
+        for i in range(count):
+            entry = offset + 2 + i * 12
+            tag, value_type, value_count = struct.unpack(endian + "HHI", tiff[entry:entry + 8])
+            if tag == 0x8769:
+                exif_offset = struct.unpack(endian + "I", tiff[entry + 8:entry + 12])[0]
+            elif tag in EXIF_TAGS and value_type == 2:
+                start = entry + 8 if value_count <= 4 else struct.unpack(endian + "I", tiff[entry + 8:entry + 12])[0]
+                value = tiff[start:start + value_count].split(b"\x00")[0].decode("ascii", errors="ignore").strip()
+                if value:
+                    fields[EXIF_TAGS[tag]] = value
+        return exif_offset
+
+    exif_offset = read_ifd(struct.unpack(endian + "I", tiff[4:8])[0])
+    if exif_offset:
+        read_ifd(exif_offset)
+
+    for name in ("modified_at", "taken_at", "digitized_at"):
+        if name in fields:
+            try:
+                fields[name] = datetime.strptime(fields[name], "%Y:%m:%d %H:%M:%S").isoformat()
+            except ValueError:
+                pass
+    return fields
+
+
+def pdf_fields(header: bytes) -> Dict:
+    """تواريخ الإنشاء والتعديل وبرنامج الإنتاج من قاموس معلومات PDF (إن كان في بداية الملف)"""
+    fields = {}
+    for key, name in ((b"CreationDate", "created_at"), (b"ModDate", "modified_at")):
+        match = re.search(rb"/" + key + rb"\s*\(D:(\d{14})", header)
+        if match:
+            try:
+                fields[name] = datetime.strptime(match.group(1).decode(), "%Y%m%d%H%M%S").isoformat()
+            except ValueError:
+                pass
+    match = re.search(rb"/Producer\s*\(([^)]{1,200})\)", header)
+    if match:
+        fields["producer"] = match.group(1).decode("latin-1")
+    return fields
+
+
+class _HTMLTextParser(HTMLParser):
+    """نص HTML المرئي بدون الوسوم والسكربتات"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("script", "style"):
+            self._skip += 1
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style") and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+    def take(self) -> str:
+        text = " ".join(part.strip() for part in self.parts if part.strip())
+        self.parts = []
+        return text
+
+
+def iter_text(file_path: str, mime_type: str, block_size: int = 1024 * 1024) -> Iterator[str]:
+    """النص القابل للقراءة من الملف على دفعات متتابعة (لا يُحمّل الملف كاملًا في الذاكرة)"""
+    if mime_type not in TEXT_MIME_TYPES:
+        return
+
+    with open(file_path, "rb") as f:
+        encoding = _text_encoding(f.read(4096)) or "utf-8"
+        f.seek(0)
+        decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        parser = _HTMLTextParser() if mime_type == "text/html" else None
+
+        for block in iter(lambda: f.read(block_size), b""):
+            text = decoder.decode(block)
+            if parser:
+                parser.feed(text)
+                text = parser.take()
+            if text:
+                yield text
+
+        text = decoder.decode(b"", final=True)
+        if parser:
+            parser.feed(text)
+            parser.close()
+            text = parser.take()
+        if text:
+            yield text
+
+
+def extract_metadata(file_path: str) -> Dict:
+    """البيانات الوصفية للملف: النوع، الحجم، أبعاد الصورة، التواريخ، ومقتطف النص"""
+    stat = os.stat(file_path)
+    with open(file_path, "rb") as f:
+        header = f.read(settings.METADATA_SNIFF_BYTES)
+
+    mime_type = sniff_mime(header)
+    metadata = {
+        "mime_type": mime_type,
+        "size": stat.st_size,
+        "file_modified_at": datetime.fromtimestamp(stat.st_mtime).isoformat()
+    }
+
+    if mime_type.startswith("image/"):
+        dimensions = image_dimensions(header, mime_type)
+        if dimensions:
+            metadata["width"], metadata["height"] = dimensions
+        if mime_type == "image/jpeg":
+            metadata.update(exif_fields(header))
+    elif mime_type == "application/pdf":
+        metadata.update(pdf_fields(header))
+    elif mime_type == "application/zip":
+        try:
+            with zipfile.ZipFile(file_path) as archive:
+                names = archive.namelist()
+                metadata["archive_members"] = len(names)
+                if "mimetype" in names:
+                    metadata["mime_type"] = archive.read("mimetype")[:100].decode("ascii", errors="ignore").strip() or mime_type
+                for member, container_type in ZIP_CONTAINERS:
+                    if member in names:
+                        metadata["mime_type"] = container_type
+                        break
+        except (zipfile.BadZipFile, OSError):
+            pass
+    elif mime_type in TEXT_MIME_TYPES:
+        excerpt_limit = settings.METADATA_TEXT_EXCERPT_CHARS
+        excerpt = []
+        excerpt_length = 0
+        chars = 0
+        lines = 0
+        last_char = ""
+        for text in iter_text(file_path, mime_type):
+            chars += len(text)
+            lines += text.count("\n")
+            last_char = text[-1]
+            if excerpt_length < excerpt_limit:
+                excerpt.append(text[:excerpt_limit - excerpt_length])
+                excerpt_length += len(excerpt[-1])
+        metadata["encoding"] = _text_encoding(header)
+        metadata["text_chars"] = chars
+        if mime_type != "text/html":
+            metadata["text_lines"] = lines + (1 if chars and last_char != "\n" else 0)
+        metadata["text_excerpt"] = "".join(excerpt)
+        if mime_type == "text/html":
+            match = re.search(r"<title[^>]*>([^<]{1,500})</title>", header.decode("utf-8", errors="ignore"), re.IGNORECASE)
+            if match and match.group(1).strip():
+                metadata["title"] = html.unescape(match.group(1).strip())
+
+    return metadata
+
+
+class MetadataExtractor:
+    """استخراج البيانات الوصفية للأدلة في الخلفية بعد الرفع
+
+    العمل مفهرس ببصمة الملف: كل محتوى يُعالج مرة واحدة مهما تكرر طلبه، والنتيجة تُدمج
+    في عمود metadata تحت المفتاح extracted. الطابور محدود؛ ما لا يتسع له يبقى معلقًا
+    في القاعدة (metadata_extracted_at فارغ) ويُعاد تحميله عند فراغ الطابور أو إعادة التشغيل.
+    """
+
+    def __init__(self, workers: int = None, queue_size: int = None):
+        self.workers = workers or settings.METADATA_WORKERS
+        self._queue = queue.Queue(maxsize=queue_size or settings.METADATA_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._backlog = False
+        self._threads = []
+
+    def _start(self):
+        if self._threads:
+            return
+        with self._lock:
+            if not self._threads:
+                self._threads = [
+                    threading.Thread(target=self._run, name=f"metadata-{i}", daemon=True)
+                    for i in range(self.workers)
+                ]
+                for thread in self._threads:
+                    thread.start()
+
+    def submit(self, file_hash: str):
+        """جدولة استخراج البيانات الوصفية لمحتوى بصمته file_hash"""
+        self._start()
+        with self._lock:
+            if file_hash in self._pending:
+                return
+            try:
+                self._queue.put_nowait(file_hash)
+            except queue.Full:
+                self._backlog = True
+                return
+            self._pending.add(file_hash)
+
+    def resume(self) -> int:
+        """إعادة جدولة الأدلة التي لم تُستخرج بياناتها (عند بدء التشغيل)"""
+        with self._lock:
+            self._backlog = False
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT file_hash FROM evidence WHERE metadata_extracted_at IS NULL AND file_hash IS NOT NULL ORDER BY id LIMIT ?",
+                (self._queue.maxsize,)
+            )
+            hashes = [row[0] for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+        for file_hash in hashes:
+            self.submit(file_hash)
+        return len(hashes)
+
+    def _run(self):
+        while True:
+            file_hash = self._queue.get()
+            try:
+                self.process(file_hash)
+            except Exception as e:
+                print(f"❌ خطأ في استخراج البيانات الوصفية ({file_hash[:12]}): {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(file_hash)
+                    refill = self._backlog and self._queue.empty()
+                self._queue.task_done()
+            if refill:
+                self.resume()
+
+    def process(self, file_hash: str) -> Optional[Dict]:
+        """استخراج البيانات الوصفية وحفظها (لا يفعل شيئًا إذا سبق استخراجها)"""
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT file_path FROM evidence WHERE file_hash = ? AND metadata_extracted_at IS NULL",
+                (file_hash,)
+            )
+            row = cursor.fetchone()
+        finally:
+            conn.close()
+        if not row:
+            return None
+
+        try:
+            extracted = extract_metadata(row[0])
+        except OSError as e:
+            extracted = {"error": f"تعذر قراءة الملف: {e.strerror or e}"}
+        except Exception as e:
+            # ملف بترويسة تالفة: تُحفظ النتيجة كخطأ حتى لا تُعاد المحاولة معه بلا نهاية
+            extracted = {"error": f"تعذر استخراج البيانات الوصفية: {e}"}
+
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+            UPDATE evidence
+            SET metadata = json_set(COALESCE(metadata, '{}'), '$.extracted', json(?)),
+                metadata_extracted_at = ?
+            WHERE file_hash = ? AND metadata_extracted_at IS NULL
+            RETURNING id, case_id
+            ''', (json.dumps(extracted, ensure_ascii=False), datetime.now().isoformat(), file_hash))
+            updated = cursor.fetchone()
+            conn.commit()
+        finally:
+            conn.close()
+
+        if updated:
+            event_bus.publish(
+                "evidence.metadata_extracted",
+                case_id=updated[1],
+                evidence_id=updated[0],
+                mime_type=extracted.get("mime_type")
+            )
+        return extracted
+
+
+metadata_extractor = MetadataExtractor()
@@ -0,0 +1,303 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import aiofiles
+
+from app.config import settings
+from app.modules.evidence_engine.evidence_manager import EvidenceManager
+
+
+class UploadError(Exception):
+    """خطأ في بروتوكول الرفع القابل للاستئناف (مع رمز حالة HTTP)"""
+
+    def __init__(self, status_code: int, message: str, offset: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+        self.offset = offset
+
+
+class UploadSessionManager:
+    """رفع الأدلة الكبيرة على أجزاء قابلة للاستئناف
+
+    الأجزاء تُكتب مباشرة إلى ملف في منطقة التجهيز وتُحسب البصمة تدريجيًا أثناء الكتابة،
+    ثم يُنقل الملف إلى مخزن الأدلة عند الإنهاء بعد مطابقة بصمة العميل.
+    الكتابة والإنهاء يحجزان الجلسة في قاعدة البيانات، فيعمل ذلك مع عدة عمليات (workers).
+    """
+
+    def __init__(self, evidence_manager: EvidenceManager, staging_dir: str = None):
+        self.evidence_manager = evidence_manager
+        self.staging_dir = Path(staging_dir or settings.UPLOAD_STAGING_DIR)
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # كائن البصمة التدريجي لكل جلسة مع عدد البايتات التي غطاها
+        self._hashers: Dict[str, Tuple["hashlib._Hash", int]] = {}
+
+    def _staging_path(self, session_id: str) -> Path:
+        return self.staging_dir / f"{session_id}.part"
+
+    def create_session(
+        self,
+        case_id: int,
+        evidence_type: str,
+        filename: str,
+        total_size: int,
+        sha256: str,
+        description: Optional[str] = None,
+        uploaded_by: int = None
+    ) -> Dict:
+        if total_size <= 0 or total_size > settings.RESUMABLE_UPLOAD_MAX_SIZE:
+            raise UploadError(413, f"حجم الملف يجب ألا يتجاوز {settings.RESUMABLE_UPLOAD_MAX_SIZE} بايت")
+
+        # تنظيف الجلسات المهجورة عند فتح جلسات جديدة
+        self.cleanup_expired()
+
+        session_id = uuid.uuid4().hex
+        now = datetime.now()
+        expires_at = (now + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)).isoformat()
+        self._staging_path(session_id).touch()
+
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            conn.execute('''
+            INSERT INTO upload_sessions
+            (id, case_id, evidence_type, filename, description, total_size, sha256,
+             uploaded_by, created_at, updated_at, expires_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                session_id, case_id, evidence_type, filename, description, total_size,
+                sha256.lower(), uploaded_by, now.isoformat(), now.isoformat(), expires_at
+            ))
+            conn.commit()
+        finally:
+            conn.close()
+
+        with self._lock:
+            self._hashers[session_id] = (hashlib.sha256(), 0)
+
+        return {
+            "upload_id": session_id,
+            "offset": 0,
+            "total_size": total_size,
+            "chunk_size": settings.UPLOAD_CHUNK_MAX_SIZE,
+            "expires_at": expires_at
+        }
+
+    def get_session(self, session_id: str, user_id: int) -> Dict:
+        """الجلسة المفتوحة لهذا المستخدم، أو UploadError"""
+        conn = sqlite3.connect("cybershield.db")
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM upload_sessions WHERE id = ?", (session_id,))
+            session = cursor.fetchone()
+        finally:
+            conn.close()
+
+        if not session or session["uploaded_by"] != user_id:
+            raise UploadError(404, "جلسة الرفع غير موجودة")
+        if session["expires_at"] < datetime.now().isoformat():
+            raise UploadError(410, "انتهت صلاحية جلسة الرفع")
+        return dict(session)
+
+    def _take_hasher(self, session_id: str, received: int):
+        """كائن البصمة التدريجي لأول received بايت (يُستدعى والجلسة محجوزة)
+
+        الكائن المحفوظ في الذاكرة يُستخدم فقط إذا غطى received بالضبط؛ فإن كتبت
+        عملية أخرى أجزاءً بعده أو أُعيد تشغيل العملية تُعاد البصمة من الملف.
+        """
+        with self._lock:
+            cached = self._hashers.pop(session_id, None)
+        if cached and cached[1] == received:
+            return cached[0]
+
+        hasher = hashlib.sha256()
+        with open(self._staging_path(session_id), "r+b") as f:
+            # ما بعد آخر إزاحة مؤكدة غير موثوق
+            f.truncate(received)
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(block)
+        return hasher
+
+    def _claim(self, session_id: str, received: int) -> Optional[str]:
+        """حجز الجلسة لكاتب واحد بمقارنة وتبديل على received_bytes؛ None إذا كانت محجوزة أو تغيرت"""
+        token = uuid.uuid4().hex
+        now = datetime.now()
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+            UPDATE upload_sessions SET writer_token = ?, writer_expires_at = ?
+            WHERE id = ? AND received_bytes = ? AND (writer_token IS NULL OR writer_expires_at < ?)
+            ''', (
+                token, (now + timedelta(seconds=settings.UPLOAD_WRITE_LEASE_SECONDS)).isoformat(),
+                session_id, received, now.isoformat()
+            ))
+            conn.commit()
+            return token if cursor.rowcount else None
+        finally:
+            conn.close()
+
+    def _renew(self, session_id: str, token: str) -> bool:
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE upload_sessions SET writer_expires_at = ? WHERE id = ? AND writer_token = ?",
+                ((datetime.now() + timedelta(seconds=settings.UPLOAD_WRITE_LEASE_SECONDS)).isoformat(), session_id, token)
+            )
+            conn.commit()
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+
+    def _release(self, session_id: str, token: str, received: int) -> bool:
+        """تسجيل الإزاحة الجديدة وفك الحجز؛ False إذا فُقد الحجز (فما كُتب لا يُعتمد)"""
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+            UPDATE upload_sessions
+            SET received_bytes = ?, updated_at = ?, writer_token = NULL, writer_expires_at = NULL
+            WHERE id = ? AND writer_token = ?
+            ''', (received, datetime.now().isoformat(), session_id, token))
+            conn.commit()
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+
+    def _claim_or_raise(self, session_id: str, user_id: int, offset: int) -> str:
+        token = self._claim(session_id, offset)
+        if token:
+            return token
+        received = self.get_session(session_id, user_id)["received_bytes"]
+        if received != offset:
+            raise UploadError(409, "الإزاحة لا تطابق آخر بايت مستلم", offset=received)
+        raise UploadError(409, "جزء آخر من الملف قيد الرفع", offset=received)
+
+    async def write_chunk(
+        self,
+        session_id: str,
+        user_id: int,
+        offset: int,
+        chunks: AsyncIterator[bytes]
+    ) -> Dict:
+        """كتابة جزء عند الإزاحة الحالية بالتدفق دون تحميله في الذاكرة
+
+        ما يُستلم قبل انقطاع الاتصال يُحفظ، فيستأنف العميل من الإزاحة المعادة.
+        """
+        session = self.get_session(session_id, user_id)
+        received = session["received_bytes"]
+        if offset != received:
+            raise UploadError(409, "الإزاحة لا تطابق آخر بايت مستلم", offset=received)
+
+        token = self._claim_or_raise(session_id, user_id, offset)
+        limit = min(session["total_size"] - received, settings.UPLOAD_CHUNK_MAX_SIZE)
+        written = 0
+        hasher = None
+
+        try:
+            hasher = self._take_hasher(session_id, received)
+            renewed_at = time.monotonic()
+            async with aiofiles.open(self._staging_path(session_id), "r+b") as f:
+                await f.seek(received)
+                async for data in chunks:
+                    if written + len(data) > limit:
+                        raise UploadError(413, "الجزء يتجاوز الحجم المسموح أو حجم الملف المعلن", offset=received + written)
+                    await f.write(data)
+                    hasher.update(data)
+                    written += len(data)
+                    # تجديد الحجز أثناء الأجزاء البطيئة
+                    if time.monotonic() - renewed_at > settings.UPLOAD_WRITE_LEASE_SECONDS / 3:
+                        if not self._renew(session_id, token):
+                            raise UploadError(409, "انتهت مهلة حجز جلسة الرفع", offset=received)
+                        renewed_at = time.monotonic()
+        finally:
+            if self._release(session_id, token, received + written):
+                received += written
+                if hasher is not None:
+                    with self._lock:
+                        self._hashers[session_id] = (hasher, received)
+
+        return {"upload_id": session_id, "offset": received, "total_size": session["total_size"]}
+
+    def finalize(self, session_id: str, user_id: int) -> Dict:
+        """مطابقة الحجم والبصمة ثم نقل الملف إلى مخزن الأدلة وتسجيله"""
+        session = self.get_session(session_id, user_id)
+        if session["received_bytes"] != session["total_size"]:
+            raise UploadError(409, "لم يكتمل رفع الملف", offset=session["received_bytes"])
+
+        # حجز الجلسة حتى لا يتزامن الإنهاء مع كتابة جزء أو إنهاء آخر
+        token = self._claim_or_raise(session_id, user_id, session["received_bytes"])
+        try:
+            file_hash = self._take_hasher(session_id, session["received_bytes"]).hexdigest()
+        except Exception:
+            self._release(session_id, token, session["received_bytes"])
+            raise
+
+        if file_hash != session["sha256"]:
+            # المحتوى تالف: يجب إعادة الرفع من البداية
+            self._discard(session_id)
+            raise UploadError(422, "بصمة الملف المستلم لا تطابق البصمة المعلنة")
+
+        file_path = self.evidence_manager.storage_path(session["filename"])
+        os.replace(self._staging_path(session_id), file_path)
+        self._discard(session_id)
+
+        result = self.evidence_manager.register_evidence_file(
+            case_id=session["case_id"],
+            evidence_type=session["evidence_type"],
+            file_path=file_path,
+            filename=session["filename"],
+            file_hash=file_hash,
+            description=session["description"],
+            uploaded_by=user_id
+        )
+        if "error" in result:
+            linked = self.evidence_manager.link_duplicate(
+                file_path, file_hash, session["case_id"], session["description"], user_id
+            )
+            if linked:
+                return linked
+            file_path.unlink(missing_ok=True)
+        return result
+
+    def abort(self, session_id: str, user_id: int):
+        self.get_session(session_id, user_id)
+        self._discard(session_id)
+
+    def _discard(self, session_id: str):
+        with self._lock:
+            self._hashers.pop(session_id, None)
+        self._staging_path(session_id).unlink(missing_ok=True)
+
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            conn.execute("DELETE FROM upload_sessions WHERE id = ?", (session_id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def cleanup_expired(self) -> int:
+        """حذف الجلسات المهجورة وملفاتها المؤقتة"""
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id FROM upload_sessions WHERE expires_at < ?",
+                (datetime.now().isoformat(),)
+            )
+            expired = [row[0] for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+        for session_id in expired:
+            self._discard(session_id)
+        return len(expired)
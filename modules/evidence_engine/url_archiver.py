@@ -0,0 +1,377 @@
+import asyncio
+import hashlib
+import ipaddress
+import mimetypes
+import socket
+import sqlite3
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import aiofiles
+import httpcore
+import httpx
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.modules.evidence_engine.evidence_manager import EvidenceManager
+
+
+class ArchiveError(Exception):
+    """فشل أرشفة رابط (رسالة تُحفظ مع العنصر)"""
+
+
+async def _resolve_host(host: str, port: int) -> List[str]:
+    """عناوين IP للمضيف بترتيب نظام التحليل ودون تكرار"""
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    return list(dict.fromkeys(info[4][0] for info in infos))
+
+
+def _is_internal(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%")[0])
+    return ip.is_private or ip.is_loopback or ip.is_link_local or ip.is_reserved or ip.is_multicast
+
+
+class PublicAddressBackend(httpcore.AsyncNetworkBackend):
+    """اتصال TCP بالعنوان الذي تم التحقق منه نفسه
+
+    التحقق والاتصال يستخدمان نتيجة تحليل DNS واحدة، فلا تستطيع إعادة الربط (DNS rebinding)
+    توجيه الاتصال إلى عنوان داخلي بعد التحقق. ترويسة Host واسم SNI يبقيان لاسم المضيف
+    الأصلي لأن httpcore يأخذهما من الرابط لا من عنوان الاتصال.
+    """
+
+    def __init__(self):
+        self._backend = httpcore.AnyIOBackend()
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        try:
+            addresses = await _resolve_host(host, port)
+        except OSError:
+            raise ArchiveError("تعذر تحليل اسم المضيف")
+        if not addresses:
+            raise ArchiveError("تعذر تحليل اسم المضيف")
+        if not settings.ARCHIVE_ALLOW_PRIVATE_HOSTS and any(_is_internal(address) for address in addresses):
+            raise ArchiveError("لا يُسمح بأرشفة عناوين الشبكة الداخلية")
+
+        error = None
+        for address in addresses:
+            try:
+                return await self._backend.connect_tcp(
+                    address, port, timeout=timeout, local_address=local_address, socket_options=socket_options
+                )
+            except httpcore.ConnectError as e:
+                error = e
+        raise error
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        raise ArchiveError("بروتوكول غير مدعوم")
+
+    async def sleep(self, seconds):
+        await self._backend.sleep(seconds)
+
+
+class PublicAddressTransport(httpx.AsyncHTTPTransport):
+    """ناقل httpx يتصل عبر PublicAddressBackend (دون وكيل)"""
+
+    def __init__(self, limits: httpx.Limits):
+        super().__init__(limits=limits)
+        self._pool = httpcore.AsyncConnectionPool(
+            ssl_context=httpx.create_ssl_context(),
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            network_backend=PublicAddressBackend()
+        )
+
+
+class UrlArchiver:
+    """أرشفة الروابط كأدلة عبر مجموعة عمال غير متزامنة
+
+    عميل HTTP واحد مشترك يعيد استخدام الاتصالات لكل مضيف، مع حد للطلبات المتزامنة
+    لكل مضيف. محتوى الصفحة يُكتب مباشرة إلى مخزن الأدلة مع حساب البصمة أثناء الكتابة.
+    المهام محفوظة في قاعدة البيانات وتُستأنف بعد إعادة التشغيل.
+    """
+
+    def __init__(self, evidence_manager: EvidenceManager):
+        self.evidence_manager = evidence_manager
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._client: Optional[httpx.AsyncClient] = None
+        # المضيف -> [حد الطلبات المتزامنة، عدد العمال الذين يستخدمونه أو ينتظرونه]
+        self._host_slots: Dict[str, list] = {}
+
+    async def start(self):
+        """تشغيل العمال في حلقة الأحداث الحالية واستئناف العناصر غير المكتملة"""
+        if self._workers:
+            return
+
+        self._queue = asyncio.Queue()
+        self._client = httpx.AsyncClient(
+            transport=PublicAddressTransport(httpx.Limits(
+                max_connections=settings.ARCHIVE_WORKERS * 2,
+                max_keepalive_connections=settings.ARCHIVE_WORKERS,
+                keepalive_expiry=30
+            )),
+            timeout=httpx.Timeout(settings.ARCHIVE_TIMEOUT_SECONDS, connect=settings.ARCHIVE_CONNECT_TIMEOUT_SECONDS),
+            follow_redirects=True,
+            max_redirects=5,
+            headers={"User-Agent": settings.ARCHIVE_USER_AGENT},
+            event_hooks={"request": [self._check_request]}
+        )
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(settings.ARCHIVE_WORKERS)]
+
+        for item_id in await run_in_threadpool(self._unfinished_items):
+            self._queue.put_nowait(item_id)
+
+    async def shutdown(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+    async def submit(
+        self,
+        case_id: int,
+        urls: List[str],
+        requested_by: int,
+        description: Optional[str] = None
+    ) -> Dict:
+        """إنشاء مهمة أرشفة لمجموعة روابط وإضافتها للطابور"""
+        await self.start()
+        job_id, item_ids = await run_in_threadpool(self._create_job, case_id, urls, requested_by, description)
+        for item_id in item_ids:
+            self._queue.put_nowait(item_id)
+        return await run_in_threadpool(self.get_job, job_id)
+
+    def _create_job(self, case_id: int, urls: List[str], requested_by: int, description: Optional[str]):
+        job_id = uuid.uuid4().hex
+        now = datetime.now().isoformat()
+
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+            INSERT INTO archive_jobs (id, case_id, requested_by, description, created_at)
+            VALUES (?, ?, ?, ?, ?)
+            ''', (job_id, case_id, requested_by, description, now))
+            item_ids = []
+            for url in urls:
+                cursor.execute(
+                    "INSERT INTO archive_items (job_id, url, status, created_at) VALUES (?, ?, 'pending', ?)",
+                    (job_id, url, now)
+                )
+                item_ids.append(cursor.lastrowid)
+            conn.commit()
+        finally:
+            conn.close()
+
+        return job_id, item_ids
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """حالة المهمة وعناصرها"""
+        conn = sqlite3.connect("cybershield.db")
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM archive_jobs WHERE id = ?", (job_id,))
+            job = cursor.fetchone()
+            if not job:
+                return None
+            cursor.execute('''
+            SELECT id, url, status, evidence_id, http_status, bytes, error, started_at, finished_at
+            FROM archive_items WHERE job_id = ? ORDER BY id
+            ''', (job_id,))
+            items = [dict(row) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+        counts = {}
+        for item in items:
+            counts[item["status"]] = counts.get(item["status"], 0) + 1
+
+        if counts.get("pending", 0) + counts.get("fetching", 0):
+            job_status = "running" if len(items) > counts.get("pending", 0) else "pending"
+        elif counts.get("failed") == len(items):
+            job_status = "failed"
+        elif counts.get("failed"):
+            job_status = "partial"
+        else:
+            job_status = "completed"
+
+        return {**dict(job), "status": job_status, "total": len(items), "counts": counts, "items": items}
+
+    def _unfinished_items(self) -> List[int]:
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM archive_items WHERE status IN ('pending', 'fetching') ORDER BY id")
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    def _load_item(self, item_id: int) -> Optional[Dict]:
+        conn = sqlite3.connect("cybershield.db")
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+            UPDATE archive_items SET status = 'fetching', started_at = ?
+            WHERE id = ? AND status IN ('pending', 'fetching')
+            ''', (datetime.now().isoformat(), item_id))
+            conn.commit()
+            cursor.execute('''
+            SELECT i.id, i.url, j.case_id, j.requested_by, j.description
+            FROM archive_items i JOIN archive_jobs j ON j.id = i.job_id
+            WHERE i.id = ? AND i.status = 'fetching'
+            ''', (item_id,))
+            item = cursor.fetchone()
+            return dict(item) if item else None
+        finally:
+            conn.close()
+
+    def _finish_item(self, item_id: int, status: str, **fields):
+        fields["finished_at"] = datetime.now().isoformat()
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            conn.execute(
+                f"UPDATE archive_items SET status = ?, {', '.join(f'{name} = ?' for name in fields)} WHERE id = ?",
+                [status] + list(fields.values()) + [item_id]
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    async def _worker(self):
+        while True:
+            item_id = await self._queue.get()
+            try:
+                await self._archive_item(item_id)
+            except Exception as e:
+                await run_in_threadpool(self._finish_item, item_id, "failed", error=str(e) or type(e).__name__)
+            finally:
+                self._queue.task_done()
+
+    async def _archive_item(self, item_id: int):
+        item = await run_in_threadpool(self._load_item, item_id)
+        if not item:
+            return
+
+        async with self._host_slot(urlparse(item["url"]).hostname or ""):
+            try:
+                fetched = await asyncio.wait_for(self._fetch(item), timeout=settings.ARCHIVE_TIMEOUT_SECONDS)
+            except (asyncio.TimeoutError, httpx.TimeoutException):
+                raise ArchiveError("انتهت مهلة جلب الرابط")
+            except httpx.HTTPError as e:
+                raise ArchiveError(f"تعذر جلب الرابط: {type(e).__name__}")
+
+        result = await run_in_threadpool(
+            self.evidence_manager.register_evidence_file,
+            case_id=item["case_id"],
+            evidence_type="url_archive",
+            file_path=fetched["file_path"],
+            filename=fetched["filename"],
+            file_hash=fetched["file_hash"],
+            description=item["description"] or f"أرشيف للرابط: {item['url']}",
+            uploaded_by=item["requested_by"],
+            url=item["url"],
+            metadata=fetched["metadata"]
+        )
+
+        if "error" in result:
+            # المحتوى نفسه مؤرشف مسبقًا: ربطه بالقضية بدل تكراره
+            linked = await run_in_threadpool(
+                self.evidence_manager.link_duplicate,
+                fetched["file_path"], fetched["file_hash"], item["case_id"], item["description"], item["requested_by"]
+            )
+            if not linked:
+                fetched["file_path"].unlink(missing_ok=True)
+                raise ArchiveError(result["error"])
+            result = linked
+        evidence_id = result["id"]
+
+        await run_in_threadpool(
+            self._finish_item, item_id, "done",
+            evidence_id=evidence_id,
+            http_status=fetched["metadata"]["http_status"],
+            bytes=fetched["size"]
+        )
+
+    @asynccontextmanager
+    async def _host_slot(self, host: str):
+        """حجز مكان ضمن حد الطلبات المتزامنة للمضيف، وحذف حده حين لا يستخدمه أحد"""
+        slot = self._host_slots.get(host)
+        if slot is None:
+            slot = self._host_slots[host] = [asyncio.Semaphore(settings.ARCHIVE_PER_HOST_CONCURRENCY), 0]
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                yield
+        finally:
+            slot[1] -= 1
+            if not slot[1]:
+                del self._host_slots[host]
+
+    async def _fetch(self, item: Dict) -> Dict:
+        """تنزيل الصفحة بالتدفق إلى مخزن الأدلة مع حساب البصمة أثناء الكتابة"""
+        max_bytes = settings.ARCHIVE_MAX_BYTES
+        async with self._client.stream("GET", item["url"]) as response:
+            if response.status_code >= 400:
+                raise ArchiveError(f"استجابة HTTP {response.status_code}")
+
+            declared = response.headers.get("content-length")
+            if declared and declared.isdigit() and int(declared) > max_bytes:
+                raise ArchiveError(f"حجم المحتوى يتجاوز الحد المسموح ({max_bytes} بايت)")
+
+            content_type = response.headers.get("content-type", "application/octet-stream")
+            extension = mimetypes.guess_extension(content_type.split(";")[0].strip()) or ".bin"
+            filename = f"url_archive_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{item['id']}{extension}"
+            file_path = self.evidence_manager.storage_path(filename)
+
+            hasher = hashlib.sha256()
+            size = 0
+            try:
+                async with aiofiles.open(file_path, "wb") as f:
+                    async for data in response.aiter_bytes():
+                        size += len(data)
+                        if size > max_bytes:
+                            raise ArchiveError(f"حجم المحتوى يتجاوز الحد المسموح ({max_bytes} بايت)")
+                        hasher.update(data)
+                        await f.write(data)
+            except BaseException:
+                Path(file_path).unlink(missing_ok=True)
+                raise
+
+            metadata = {
+                "requested_url": item["url"],
+                "final_url": str(response.url),
+                "http_status": response.status_code,
+                "content_type": content_type,
+                "fetched_at": datetime.now().isoformat(),
+                "headers": {
+                    name: response.headers[name]
+                    for name in ("date", "last-modified", "server", "etag")
+                    if name in response.headers
+                }
+            }
+
+        return {
+            "file_path": file_path,
+            "filename": filename,
+            "file_hash": hasher.hexdigest(),
+            "size": size,
+            "metadata": metadata
+        }
+
+    async def _check_request(self, request: httpx.Request):
+        """رفض البروتوكولات غير المدعومة (بما فيها وجهات إعادة التوجيه)
+
+        عناوين الشبكة الداخلية تُرفض عند الاتصال في PublicAddressBackend.
+        """
+        if request.url.scheme not in ("http", "https"):
+            raise ArchiveError("بروتوكول غير مدعوم")
@@ -3,6 +3,8 @@ import sqlite3
 from typing import List, Dict, Set, Tuple
 from collections import defaultdict
 
+from app.core.single_flight import single_flight
+
 class NetworkDetector:
     def __init__(self):
         self.conn = sqlite3.connect("cybershield.db")
@@ -27,6 +29,7 @@ class NetworkDetector:
         
         return list(usernames)
     
+    @single_flight.coalesce("find_network_connections")
     def find_network_connections(self, case_id: int) -> Dict:
         """إيجاد روابط الشبكة للقضية"""
         # الحصول على محتوى القضية
@@ -0,0 +1,172 @@
+import hashlib
+import io
+import json
+import sqlite3
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.config import settings
+from app.modules.report_gen.report_generator import ReportGenerator
+
+
+class _ZipStreamBuffer(io.RawIOBase):
+    """مخزن غير قابل للتنقل يستقبل مخرجات zipfile ويُفرَّغ بعد كل ملف"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._offset = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        """إرجاع البايتات المتراكمة منذ آخر تفريغ"""
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class BulkReportExporter:
+    def __init__(self, max_workers: int = None):
+        self.max_workers = max_workers or settings.REPORT_BULK_WORKERS
+
+    def resolve_case_ids(
+        self,
+        case_ids: Optional[List[str]] = None,
+        network_id: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        access_filter: Callable[[str], Tuple[str, list]] = None
+    ) -> List[int]:
+        """تحديد معرفات القضايا المطلوبة من قائمة أو شبكة أو نطاق زمني
+
+        access_filter يعيد شرط SQL لعمود معرف القضية لتقييد النتائج بالقضايا المتاحة.
+        """
+        query = "SELECT DISTINCT c.id FROM cases c"
+        conditions = []
+        params = []
+
+        if network_id:
+            query += """
+            JOIN case_network cn ON c.id = cn.case_id
+            JOIN networks n ON cn.network_id = n.id
+            """
+            conditions.append("n.network_id = ?")
+            params.append(network_id)
+
+        if case_ids:
+            conditions.append(f"c.case_id IN ({', '.join('?' for _ in case_ids)})")
+            params.extend(case_ids)
+
+        if date_from:
+            conditions.append("c.created_at >= ?")
+            params.append(date_from)
+
+        if date_to:
+            conditions.append("c.created_at <= ?")
+            params.append(date_to)
+
+        query += " WHERE " + (" AND ".join(conditions) if conditions else "1 = 1")
+
+        if access_filter:
+            access_sql, access_params = access_filter("c.id")
+            query += access_sql
+            params.extend(access_params)
+
+        query += " ORDER BY c.id LIMIT ?"
+        params.append(settings.REPORT_BULK_MAX_CASES)
+
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    def _generate_one(self, case_id: int, report_type: str) -> Dict:
+        """توليد تقرير واحد داخل خيط عامل (لكل خيط اتصال مستقل)"""
+        generator = ReportGenerator()
+        try:
+            result = generator.generate_case_report(case_id, report_type)
+            if "error" in result:
+                return {"case_id": case_id, "error": result["error"]}
+
+            report = generator.get_report(result["report_id"])
+            return {
+                "case_id": case_id,
+                "report_id": result["report_id"],
+                "content": report["content"].encode("utf-8")
+            }
+        except Exception as e:
+            return {"case_id": case_id, "error": str(e)}
+        finally:
+            generator.conn.close()
+
+    def stream_zip(self, case_ids: List[int], report_type: str = "detailed") -> Iterator[bytes]:
+        """توليد التقارير بالتوازي وبثها داخل أرشيف ZIP فور اكتمال كل تقرير"""
+        buffer = _ZipStreamBuffer()
+        manifest = {
+            "generated_at": datetime.now().isoformat(),
+            "report_type": report_type,
+            "reports": [],
+            "errors": []
+        }
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        pending = set()
+        remaining = iter(case_ids)
+        # نافذة محدودة من المهام الجارية حتى لا تتراكم التقارير في الذاكرة
+        window = self.max_workers * 2
+
+        try:
+            with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+                while True:
+                    while len(pending) < window:
+                        case_id = next(remaining, None)
+                        if case_id is None:
+                            break
+                        pending.add(executor.submit(self._generate_one, case_id, report_type))
+
+                    if not pending:
+                        break
+
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        result = future.result()
+                        if "error" in result:
+                            manifest["errors"].append(result)
+                            continue
+
+                        filename = f"{result['report_id']}.txt"
+                        archive.writestr(filename, result["content"])
+                        manifest["reports"].append({
+                            "case_id": result["case_id"],
+                            "report_id": result["report_id"],
+                            "filename": filename,
+                            "sha256": hashlib.sha256(result["content"]).hexdigest(),
+                            "size": len(result["content"])
+                        })
+                        yield buffer.drain()
+
+                manifest["total_reports"] = len(manifest["reports"])
+                archive.writestr(
+                    "manifest.json",
+                    json.dumps(manifest, ensure_ascii=False, indent=2)
+                )
+            yield buffer.drain()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
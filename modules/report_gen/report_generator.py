@@ -1,13 +1,19 @@
 from datetime import datetime
 import sqlite3
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 import json
 
+from app.core.single_flight import single_flight
+from app.modules.content_store.content_store import ContentStore
+
 class ReportGenerator:
     def __init__(self):
-        self.conn = sqlite3.connect("cybershield.db")
+        # قد يُحرر المولد في خيط غير الذي أنشأه (البث المتدفق وخيوط التوليد المجمع)
+        self.conn = sqlite3.connect("cybershield.db", check_same_thread=False)
         self.conn.row_factory = sqlite3.Row
+        self.content_store = ContentStore()
     
+    @single_flight.coalesce("generate_case_report")
     def generate_case_report(self, case_id: int, report_type: str = "detailed") -> Dict:
         """توليد تقرير مفصل للقضية"""
         cursor = self.conn.cursor()
@@ -69,15 +75,19 @@ class ReportGenerator:
             report_type=report_type
         )
         
-        # حفظ التقرير في قاعدة البيانات
+        # حفظ محتوى التقرير مضغوطًا في مخزن المحتوى والبيانات الوصفية فقط في قاعدة البيانات
+        content_hash, content_size = self.content_store.put(report_content.encode("utf-8"))
+        
         cursor.execute("""
-        INSERT INTO reports (report_id, case_id, report_type, content, generated_at, status)
-        VALUES (?, ?, ?, ?, ?, ?)
+        INSERT INTO reports (report_id, case_id, report_type, content, content_hash, content_size,
+                             generated_at, status)
+        VALUES (?, ?, ?, '', ?, ?, ?, ?)
         """, (
             report_id,
             case_id,
             report_type,
-            report_content,
+            content_hash,
+            content_size,
             datetime.now().isoformat(),
             "generated"
         ))
@@ -309,14 +319,18 @@ class ReportGenerator:
         """
         
         # حفظ التقرير
+        content_hash, content_size = self.content_store.put(content.encode("utf-8"))
+        
         cursor = self.conn.cursor()
         cursor.execute("""
-        INSERT INTO reports (report_id, report_type, content, generated_at, status)
-        VALUES (?, ?, ?, ?, ?)
+        INSERT INTO reports (report_id, report_type, content, content_hash, content_size,
+                             generated_at, status)
+        VALUES (?, ?, '', ?, ?, ?, ?)
         """, (
             report_id,
             "network_report",
-            content,
+            content_hash,
+            content_size,
             datetime.now().isoformat(),
             "generated"
         ))
@@ -341,7 +355,38 @@ class ReportGenerator:
         if not report:
             return None
         
-        return dict(report)
+        report = dict(report)
+        
+        # التقارير الحديثة محفوظة في مخزن المحتوى، والقديمة داخل الجدول
+        if report["content_hash"]:
+            content = self.content_store.get(report["content_hash"])
+            report["content"] = content.decode("utf-8") if content is not None else None
+        
+        return report
+    
+    def get_report_metadata(self, report_id: str) -> Optional[Dict]:
+        """الحصول على البيانات الوصفية للتقرير دون المحتوى"""
+        cursor = self.conn.cursor()
+        cursor.execute("""
+        SELECT id, report_id, case_id, report_type, content_hash,
+               COALESCE(content_size, LENGTH(CAST(content AS BLOB))) as content_size,
+               generated_by, generated_at, sent_to, sent_at, status
+        FROM reports WHERE report_id = ?
+        """, (report_id,))
+        
+        report = cursor.fetchone()
+        return dict(report) if report else None
+    
+    def iter_report_content(self, report: Dict, start: int = 0, end: Optional[int] = None):
+        """بث محتوى التقرير (مع دعم النطاقات) من مخزن المحتوى"""
+        if report["content_hash"]:
+            return self.content_store.iter_content(report["content_hash"], start, end)
+        
+        # تقرير قديم محفوظ داخل الجدول (يُقرأ هنا لأن البث يجري في خيط آخر)
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT content FROM reports WHERE id = ?", (report["id"],))
+        content = cursor.fetchone()["content"].encode("utf-8")
+        return iter([content[start:None if end is None else end + 1]])
     
     def __del__(self):
         """إغلاق اتصال قاعدة البيانات"""
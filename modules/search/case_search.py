@@ -0,0 +1,189 @@
+import re
+import sqlite3
+from typing import Callable, Dict, Optional, Tuple
+
+from app.core.text_normalization import mark_original, normalize_arabic
+from app.database import CONTENT_ROWID_STRIDE
+
+
+class CaseSearch:
+    # نطاقات البحث المتاحة
+    SCOPES = ("all", "cases", "evidence", "content")
+
+    _TERM_PATTERN = re.compile(r'"([^"]+)"|(\S+)')
+
+    # عدد كلمات المقتطف حول أول مطابقة (كما في snippet الخاصة بـ FTS5)
+    SNIPPET_TOKENS = 16
+
+    def build_match_query(self, query: str) -> Optional[str]:
+        """تحويل نص المستخدم إلى استعلام FTS5 آمن
+
+        كل كلمة (أو عبارة بين علامتي تنصيص) تتحول إلى عبارة FTS5 مقتبسة،
+        والكلمة الأخيرة غير المقتبسة تُبحث كبادئة لدعم الكتابة التدريجية.
+        """
+        phrases = []
+        last_is_prefix = False
+
+        for quoted, word in self._TERM_PATTERN.findall(query or ""):
+            term = normalize_arabic(quoted or word).replace('"', " ").strip()
+            if not term:
+                continue
+            phrases.append(f'"{term}"')
+            last_is_prefix = not quoted
+
+        if not phrases:
+            return None
+
+        if last_is_prefix:
+            phrases[-1] += "*"
+
+        return " ".join(phrases)
+
+    def search(
+        self,
+        query: str,
+        scope: str = "all",
+        page: int = 1,
+        limit: int = 20,
+        access_filter: Callable[[str], Tuple[str, list]] = None
+    ) -> Dict:
+        """بحث مرتب حسب الصلة في القضايا والأدلة مع إبراز المطابقات
+
+        access_filter يعيد شرط SQL لعمود معرف القضية لتقييد النتائج بالقضايا المتاحة.
+        """
+        match_query = self.build_match_query(query)
+        result = {"results": [], "total": 0, "page": page, "limit": limit, "total_pages": 0}
+        if not match_query:
+            return result
+
+        if access_filter is None:
+            access_filter = lambda column: ("", [])
+
+        selects = []
+        counts = []
+        params = []
+
+        if scope in ("all", "cases"):
+            selects.append("""
+            SELECT 'case' AS type, c.case_id, c.id AS case_db_id, NULL AS evidence_id,
+                   highlight(cases_fts, 0, '<mark>', '</mark>') AS title,
+                   highlight(cases_fts, 1, '<mark>', '</mark>') AS snippet,
+                   bm25(cases_fts, 5.0, 1.0) AS rank, NULL AS content_rowid,
+                   c.title AS source_title, c.description AS source_text
+            FROM cases_fts
+            JOIN cases c ON c.id = cases_fts.rowid
+            WHERE cases_fts MATCH ?{access_sql}
+            """.format(access_sql=access_filter("c.id")[0]))
+            access_sql, access_params = access_filter("rowid")
+            counts.append(f"SELECT COUNT(*) FROM cases_fts WHERE cases_fts MATCH ?{access_sql}")
+            params.append([match_query] + access_params)
+
+        if scope in ("all", "evidence"):
+            selects.append("""
+            SELECT 'evidence' AS type, c.case_id, c.id AS case_db_id, evidence_fts.rowid AS evidence_id,
+                   c.title AS title,
+                   CASE WHEN instr(highlight(evidence_fts, 0, '<mark>', '</mark>'), '<mark>')
+                        THEN highlight(evidence_fts, 0, '<mark>', '</mark>')
+                        ELSE highlight(evidence_fts, 1, '<mark>', '</mark>') END AS snippet,
+                   bm25(evidence_fts) AS rank, NULL AS content_rowid,
+                   NULL AS source_title,
+                   CASE WHEN instr(highlight(evidence_fts, 0, '<mark>', '</mark>'), '<mark>')
+                        THEN e.description ELSE e.url END AS source_text
+            FROM evidence_fts
+            JOIN evidence e ON e.id = evidence_fts.rowid
+            JOIN cases c ON c.id = evidence_fts.case_id
+            WHERE evidence_fts MATCH ?{access_sql}
+            """.format(access_sql=access_filter("c.id")[0]))
+            access_sql, access_params = access_filter("case_id")
+            counts.append(f"SELECT COUNT(*) FROM evidence_fts WHERE evidence_fts MATCH ?{access_sql}")
+            params.append([match_query] + access_params)
+
+        if scope in ("all", "content"):
+            # نص ملفات الأدلة مفهرس على أجزاء: أفضل جزء مطابق لكل دليل (عمود rank المخفي
+            # لأن bm25 لا تعمل داخل التجميع)، ومقتطفه يُحسب لاحقًا لنتائج الصفحة فقط
+            selects.append("""
+            SELECT 'content' AS type, c.case_id, c.id AS case_db_id, e.id AS evidence_id,
+                   e.filename AS title, NULL AS snippet,
+                   MIN(evidence_content_fts.rank) AS rank, evidence_content_fts.rowid AS content_rowid,
+                   NULL AS source_title, NULL AS source_text
+            FROM evidence_content_fts
+            JOIN evidence e ON e.id = evidence_content_fts.rowid / {stride}
+            JOIN cases c ON c.id = e.case_id
+            WHERE evidence_content_fts MATCH ?{access_sql}
+            GROUP BY e.id
+            """.format(stride=CONTENT_ROWID_STRIDE, access_sql=access_filter("c.id")[0]))
+            access_sql, access_params = access_filter("e.case_id")
+            counts.append(f"""
+            SELECT COUNT(DISTINCT e.id) FROM evidence_content_fts
+            JOIN evidence e ON e.id = evidence_content_fts.rowid / {CONTENT_ROWID_STRIDE}
+            WHERE evidence_content_fts MATCH ?{access_sql}
+            """)
+            params.append([match_query] + access_params)
+
+        offset = (page - 1) * limit
+
+        conn = sqlite3.connect("cybershield.db")
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.cursor()
+
+            cursor.execute(
+                f"SELECT * FROM ({' UNION ALL '.join(selects)}) ORDER BY rank LIMIT ? OFFSET ?",
+                [param for select_params in params for param in select_params] + [limit, offset]
+            )
+            result["results"] = [dict(row) for row in cursor.fetchall()]
+            self._apply_original_text(result["results"])
+            self._add_content_snippets(cursor, match_query, result["results"])
+
+            total = 0
+            for count_query, select_params in zip(counts, params):
+                cursor.execute(count_query, select_params)
+                total += cursor.fetchone()[0]
+        except sqlite3.OperationalError:
+            # استعلام FTS5 غير صالح رغم التنظيف
+            return result
+        finally:
+            conn.close()
+
+        result["total"] = total
+        result["total_pages"] = (total + limit - 1) // limit
+        return result
+
+    def _apply_original_text(self, results: list):
+        """الفهارس تحفظ النص موحدًا، فيُنقل الإبراز إلى النص الأصلي ويُقتطع منه"""
+        for row in results:
+            source_title = row.pop("source_title")
+            source_text = row.pop("source_text")
+            if source_title is not None:
+                row["title"] = mark_original(source_title, row["title"])
+            if row["snippet"] is not None:
+                row["snippet"] = self.make_snippet(mark_original(source_text, row["snippet"]))
+
+    def make_snippet(self, marked: str) -> str:
+        """مقتطف من SNIPPET_TOKENS كلمة يبدأ قبيل أول مطابقة مبرزة"""
+        words = marked.split()
+        if len(words) <= self.SNIPPET_TOKENS:
+            return " ".join(words)
+
+        first = next((i for i, word in enumerate(words) if "<mark>" in word), 0)
+        start = max(0, min(first - self.SNIPPET_TOKENS // 4, len(words) - self.SNIPPET_TOKENS))
+        end = start + self.SNIPPET_TOKENS
+        snippet = " ".join(words[start:end])
+
+        # إغلاق إبراز قطعه حد المقتطف
+        if snippet.count("<mark>") > snippet.count("</mark>"):
+            snippet += "</mark>"
+        return ("…" if start > 0 else "") + snippet + ("…" if end < len(words) else "")
+
+    def _add_content_snippets(self, cursor, match_query: str, results: list):
+        chunks = {row["content_rowid"]: row for row in results if row["content_rowid"] is not None}
+        if chunks:
+            cursor.execute(f'''
+            SELECT rowid, highlight(evidence_content_fts, 0, '<mark>', '</mark>'), original
+            FROM evidence_content_fts
+            WHERE evidence_content_fts MATCH ? AND rowid IN ({", ".join("?" * len(chunks))})
+            ''', [match_query] + list(chunks))
+            for rowid, marked, original in cursor.fetchall():
+                chunks[rowid]["snippet"] = self.make_snippet(mark_original(original, marked))
+        for row in results:
+            del row["content_rowid"]
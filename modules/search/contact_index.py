@@ -0,0 +1,143 @@
+import sqlite3
+from datetime import datetime
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, List
+
+from app.config import settings
+from app.core.contact_normalization import extract_contacts, parse_contact_field
+
+
+class ContactIndex:
+    """مطابقة جهات اتصال المبلغين والمشتبه بهم بين القضايا
+
+    كل قضية تُخزن جهات اتصالها موحدةً (هاتف E.164، بريد بأحرف صغيرة، اسم حساب)
+    مع مفتاح تجميع مفهرس. المطابقة تجلب فقط القيم التي تشترك في مفتاح التجميع
+    ثم تقارن القيم الموحدة فعليًا، فلا تُقارن كل جهات الاتصال ببعضها.
+    """
+
+    def index_cases(self, cursor, case_ids: Iterable[int]):
+        """حساب جهات اتصال القضايا وكتابتها ضمن معاملة المستدعي (قبل commit)"""
+        case_ids = list(case_ids)
+        now = datetime.now().isoformat()
+        for start in range(0, len(case_ids), 500):
+            chunk = case_ids[start:start + 500]
+            placeholders = ", ".join("?" for _ in chunk)
+            cursor.execute(
+                f"SELECT id, reporter_contact, title, description FROM cases WHERE id IN ({placeholders})",
+                chunk
+            )
+            rows = []
+            indexed = []
+            for case_id, reporter_contact, title, description in cursor.fetchall():
+                reporter = parse_contact_field(reporter_contact) if reporter_contact else []
+                rows.extend((case_id, "reporter", *contact) for contact in reporter)
+                rows.extend(
+                    (case_id, "mentioned", *contact)
+                    for contact in extract_contacts(f"{title or ''}\n{description or ''}")
+                    if contact not in reporter
+                )
+                indexed.append((case_id, now))
+
+            cursor.execute(f"DELETE FROM case_contacts WHERE case_id IN ({placeholders})", chunk)
+            cursor.executemany('''
+            INSERT OR IGNORE INTO case_contacts (case_id, role, kind, value, block_key)
+            VALUES (?, ?, ?, ?, ?)
+            ''', rows)
+            cursor.executemany(
+                "INSERT OR REPLACE INTO case_contact_index (case_id, indexed_at) VALUES (?, ?)",
+                indexed
+            )
+
+    def resume(self) -> int:
+        """فهرسة القضايا التي لم تُحسب جهات اتصالها أو تغير نصها (عند بدء التشغيل)"""
+        total = 0
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            cursor = conn.cursor()
+            while True:
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute('''
+                SELECT c.id FROM cases c
+                LEFT JOIN case_contact_index i ON i.case_id = c.id
+                WHERE i.case_id IS NULL
+                LIMIT ?
+                ''', (settings.CONTACT_RESUME_BATCH_SIZE,))
+                case_ids = [row[0] for row in cursor.fetchall()]
+                if case_ids:
+                    self.index_cases(cursor, case_ids)
+                conn.commit()
+                total += len(case_ids)
+                if len(case_ids) < settings.CONTACT_RESUME_BATCH_SIZE:
+                    return total
+        finally:
+            conn.close()
+
+    @staticmethod
+    def similarity(first: str, second: str) -> float:
+        if first == second:
+            return 1.0
+        return SequenceMatcher(None, first, second).ratio()
+
+    def related_cases(self, case_id: int, limit: int = 10) -> List[Dict]:
+        """القضايا التي تشترك مع القضية في جهة اتصال مطابقة أو شبه مطابقة"""
+        conn = sqlite3.connect("cybershield.db")
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1 FROM case_contact_index WHERE case_id = ?", (case_id,))
+            if not cursor.fetchone():
+                # القضية عُدلت ولم تُعد فهرستها بعد
+                cursor.execute("BEGIN IMMEDIATE")
+                self.index_cases(cursor, [case_id])
+                conn.commit()
+
+            cursor.execute(
+                "SELECT role, kind, value, block_key FROM case_contacts WHERE case_id = ?",
+                (case_id,)
+            )
+            own_contacts = cursor.fetchall()
+
+            matches = {}
+            for contact in own_contacts:
+                cursor.execute('''
+                SELECT case_id, role, value FROM case_contacts
+                WHERE kind = ? AND block_key = ? AND case_id != ?
+                LIMIT ?
+                ''', (contact["kind"], contact["block_key"], case_id, settings.CONTACT_BLOCK_MAX_CANDIDATES))
+                for candidate in cursor.fetchall():
+                    score = self.similarity(contact["value"], candidate["value"])
+                    if score < settings.CONTACT_MATCH_THRESHOLD:
+                        continue
+                    match = matches.setdefault(candidate["case_id"], {"score": 0.0, "matched_contacts": []})
+                    match["score"] = max(match["score"], score)
+                    match["matched_contacts"].append({
+                        "kind": contact["kind"],
+                        "value": contact["value"],
+                        "role": contact["role"],
+                        "matched_value": candidate["value"],
+                        "matched_role": candidate["role"],
+                        "similarity": round(score, 3)
+                    })
+
+            # الأعلى تشابهًا ثم الأكثر جهات اتصال مشتركة
+            ranked = sorted(
+                matches.items(),
+                key=lambda item: (item[1]["score"], len(item[1]["matched_contacts"])),
+                reverse=True
+            )[:limit]
+
+            results = []
+            for related_id, match in ranked:
+                cursor.execute(
+                    "SELECT id, case_id, title, violation_type, created_at FROM cases WHERE id = ?",
+                    (related_id,)
+                )
+                case = cursor.fetchone()
+                if case:
+                    results.append({**dict(case), "score": round(match["score"], 3), "matched_contacts": match["matched_contacts"]})
+            return results
+        finally:
+            conn.close()
+
+
+contact_index = ContactIndex()
@@ -0,0 +1,174 @@
+import queue
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Iterator, Optional
+
+from app.config import settings
+from app.core.text_normalization import normalize_arabic
+from app.database import CONTENT_ROWID_STRIDE
+from app.modules.evidence_engine.metadata_extractor import TEXT_MIME_TYPES, iter_text, sniff_mime
+
+
+def split_text(texts: Iterator[str], chunk_chars: int) -> Iterator[str]:
+    """إعادة تقسيم دفعات النص إلى أجزاء بحجم ثابت تقريبًا دون قطع الكلمات"""
+    buffer = ""
+    for text in texts:
+        buffer += text
+        start = 0
+        while len(buffer) - start >= chunk_chars:
+            end = start + chunk_chars
+            cut = max(buffer.rfind(" ", start, end), buffer.rfind("\n", start, end))
+            if cut < start + chunk_chars // 2:
+                cut = end
+            yield buffer[start:cut]
+            start = cut
+        buffer = buffer[start:]
+    if buffer.strip():
+        yield buffer
+
+
+class ContentIndexer:
+    """فهرسة نصوص ملفات الأدلة في evidence_content_fts في الخلفية
+
+    النص يُستخرج على دفعات ويُقسم إلى أجزاء، وكل جزء صف في فهرس FTS5 رقمه مشتق من معرف
+    الدليل، فيُحذف فهرس الدليل كاملًا بنطاق rowid. الفهرسة تدريجية: الدليل الذي سُجلت
+    بصمة ملفه في evidence_content_index لا يُعاد فهرسته ما دامت البصمة لم تتغير.
+    """
+
+    def __init__(self, workers: int = None, queue_size: int = None):
+        self.workers = workers or settings.CONTENT_INDEX_WORKERS
+        self._queue = queue.Queue(maxsize=queue_size or settings.CONTENT_INDEX_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._backlog = False
+        self._threads = []
+
+    def _start(self):
+        if self._threads:
+            return
+        with self._lock:
+            if not self._threads:
+                self._threads = [
+                    threading.Thread(target=self._run, name=f"content-index-{i}", daemon=True)
+                    for i in range(self.workers)
+                ]
+                for thread in self._threads:
+                    thread.start()
+
+    def submit(self, evidence_id: int):
+        """جدولة فهرسة نص الدليل"""
+        self._start()
+        with self._lock:
+            if evidence_id in self._pending:
+                return
+            try:
+                self._queue.put_nowait(evidence_id)
+            except queue.Full:
+                self._backlog = True
+                return
+            self._pending.add(evidence_id)
+
+    def resume(self) -> int:
+        """جدولة الأدلة غير المفهرسة أو التي تغيرت بصمتها (عند بدء التشغيل)"""
+        with self._lock:
+            self._backlog = False
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+            SELECT e.id FROM evidence e
+            LEFT JOIN evidence_content_index i ON i.evidence_id = e.id
+            WHERE e.file_path IS NOT NULL AND (i.evidence_id IS NULL OR i.file_hash != e.file_hash)
+            ORDER BY e.id LIMIT ?
+            ''', (self._queue.maxsize,))
+            evidence_ids = [row[0] for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+        for evidence_id in evidence_ids:
+            self.submit(evidence_id)
+        return len(evidence_ids)
+
+    def _run(self):
+        while True:
+            evidence_id = self._queue.get()
+            try:
+                self.index_evidence(evidence_id)
+            except Exception as e:
+                print(f"❌ خطأ في فهرسة نص الدليل #{evidence_id}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(evidence_id)
+                    refill = self._backlog and self._queue.empty()
+                self._queue.task_done()
+            if refill:
+                self.resume()
+
+    def index_evidence(self, evidence_id: int, force: bool = False) -> Optional[int]:
+        """فهرسة نص الدليل؛ يعيد عدد الأجزاء المفهرسة أو None إذا كان الفهرس محدثًا"""
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+            SELECT e.file_path, e.file_hash, i.file_hash
+            FROM evidence e
+            LEFT JOIN evidence_content_index i ON i.evidence_id = e.id
+            WHERE e.id = ?
+            ''', (evidence_id,))
+            row = cursor.fetchone()
+            if not row or not row[0]:
+                return None
+            file_path, file_hash, indexed_hash = row
+            if indexed_hash == file_hash and not force:
+                return None
+
+            try:
+                with open(file_path, "rb") as f:
+                    mime_type = sniff_mime(f.read(4096))
+            except OSError:
+                return None
+
+            first_rowid = evidence_id * CONTENT_ROWID_STRIDE
+            cursor.execute(
+                "DELETE FROM evidence_content_fts WHERE rowid BETWEEN ? AND ?",
+                (first_rowid, first_rowid + CONTENT_ROWID_STRIDE - 1)
+            )
+            conn.commit()
+
+            chunk_count = 0
+            text_chars = 0
+            batch = []
+            if mime_type in TEXT_MIME_TYPES:
+                for chunk in split_text(iter_text(file_path, mime_type), settings.CONTENT_INDEX_CHUNK_CHARS):
+                    if chunk_count == CONTENT_ROWID_STRIDE:
+                        # ملف نصي ضخم: ما بعد أقصى عدد أجزاء لا يُفهرس
+                        break
+                    batch.append((first_rowid + chunk_count, normalize_arabic(chunk), chunk))
+                    chunk_count += 1
+                    text_chars += len(chunk)
+                    # الكتابة على دفعات قصيرة حتى لا يُحجز قفل الكتابة طوال فهرسة ملف كبير
+                    if len(batch) >= settings.CONTENT_INDEX_BATCH_ROWS:
+                        cursor.executemany("INSERT INTO evidence_content_fts (rowid, content, original) VALUES (?, ?, ?)", batch)
+                        conn.commit()
+                        batch = []
+                if batch:
+                    cursor.executemany("INSERT INTO evidence_content_fts (rowid, content, original) VALUES (?, ?, ?)", batch)
+
+            # تسجيل البصمة بعد اكتمال الأجزاء فقط، فالفهرسة المنقطعة تُعاد عند الاستئناف
+            cursor.execute('''
+            INSERT INTO evidence_content_index (evidence_id, file_hash, chunk_count, text_chars, indexed_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(evidence_id) DO UPDATE SET
+                file_hash = excluded.file_hash,
+                chunk_count = excluded.chunk_count,
+                text_chars = excluded.text_chars,
+                indexed_at = excluded.indexed_at
+            ''', (evidence_id, file_hash, chunk_count, text_chars, datetime.now().isoformat()))
+            conn.commit()
+            return chunk_count
+        finally:
+            conn.close()
+
+
+content_indexer = ContentIndexer()
@@ -0,0 +1,268 @@
+import hashlib
+import random
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from array import array
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from app.config import settings
+from app.core.text_normalization import normalize_arabic
+from app.modules.evidence_engine.metadata_extractor import TEXT_MIME_TYPES, iter_text, sniff_mime
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+class MinHasher:
+    """بصمة MinHash لمجموعة مقاطع الكلمات المتتالية (shingles) في النص
+
+    تطابق نسبة القيم المتساوية بين بصمتين يقدّر تشابه Jaccard بين مجموعتي المقاطع.
+    """
+
+    def __init__(self, num_perm: int = None, shingle_size: int = None, seed: int = 1):
+        self.num_perm = num_perm or settings.NEAR_DUP_NUM_PERM
+        self.shingle_size = shingle_size or settings.NEAR_DUP_SHINGLE_SIZE
+        # معاملات التباديل ثابتة بين العمليات لتبقى البصمات المخزنة قابلة للمقارنة
+        rng = random.Random(seed)
+        self._permutations = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(self.num_perm)
+        ]
+
+    def shingles(self, texts: Iterable[str], max_chars: int = None) -> set:
+        """بصمات 32 بت لمقاطع الكلمات؛ النص يُقرأ على دفعات مع وصل المقاطع عبر حدودها"""
+        max_chars = max_chars or settings.NEAR_DUP_MAX_TEXT_CHARS
+        size = self.shingle_size
+        shingles = set()
+        window = []
+        consumed = 0
+        for text in texts:
+            if consumed >= max_chars:
+                break
+            text = text[:max_chars - consumed]
+            consumed += len(text)
+            window.extend(_WORD_PATTERN.findall(normalize_arabic(text)))
+            for i in range(len(window) - size + 1):
+                shingles.add(zlib.crc32(" ".join(window[i:i + size]).encode()))
+            window = window[-(size - 1):] if size > 1 else []
+
+        if not shingles and window:
+            # نص أقصر من مقطع واحد
+            shingles.add(zlib.crc32(" ".join(window).encode()))
+        return shingles
+
+    def signature(self, shingles: set) -> Optional[array]:
+        if not shingles:
+            return None
+        return array("I", (
+            min((a * shingle + b) % _MERSENNE_PRIME for shingle in shingles) & 0xFFFFFFFF
+            for a, b in self._permutations
+        ))
+
+    @staticmethod
+    def similarity(first: array, second: array) -> float:
+        if len(first) != len(second):
+            return 0.0
+        return sum(1 for x, y in zip(first, second) if x == y) / len(first)
+
+
+class NearDuplicateIndex:
+    """كشف القضايا والأدلة ذات النصوص شبه المكررة عبر MinHash مع نطاقات LSH
+
+    البصمة تُقسم إلى نطاقات، ولكل نطاق مفتاح في near_dup_bands. المرشحون هم المستندات
+    التي تشترك في نطاق واحد على الأقل (بحث بالفهرس بدل المقارنة الزوجية)، ثم يُحسب
+    التشابه الفعلي من البصمات. المستندات الجديدة أو المعدلة تصل عبر طابور تملؤه المشغلات.
+    """
+
+    def __init__(self, hasher: MinHasher = None, bands: int = None):
+        self.hasher = hasher or MinHasher()
+        self.bands = bands or settings.NEAR_DUP_BANDS
+        self.rows_per_band = self.hasher.num_perm // self.bands
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """تشغيل خيط معالجة الطابور في الخلفية"""
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="near-duplicates", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                processed = self.process_queue(settings.NEAR_DUP_BATCH_SIZE)
+            except Exception as e:
+                print(f"❌ خطأ في فهرسة النصوص شبه المكررة: {e}")
+                processed = 0
+            if not processed:
+                time.sleep(settings.NEAR_DUP_POLL_SECONDS)
+
+    def process_queue(self, limit: int) -> int:
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT doc_type, doc_id, queued_at FROM near_dup_queue LIMIT ?", (limit,))
+            queued = cursor.fetchall()
+        finally:
+            conn.close()
+
+        for doc_type, doc_id, queued_at in queued:
+            self.index_document(doc_type, doc_id, queued_at)
+        return len(queued)
+
+    def _document_texts(self, conn, doc_type: str, doc_id: int) -> Optional[Iterator[str]]:
+        cursor = conn.cursor()
+        if doc_type == "case":
+            cursor.execute("SELECT title, description FROM cases WHERE id = ?", (doc_id,))
+            row = cursor.fetchone()
+            return iter([" ".join(part for part in row if part)]) if row else None
+
+        cursor.execute("SELECT description, file_path FROM evidence WHERE id = ?", (doc_id,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        description, file_path = row
+
+        def texts():
+            if description:
+                yield description
+            try:
+                with open(file_path, "rb") as f:
+                    mime_type = sniff_mime(f.read(4096))
+                if mime_type in TEXT_MIME_TYPES:
+                    yield from iter_text(file_path, mime_type)
+            except (OSError, TypeError):
+                return
+        return texts()
+
+    def index_document(self, doc_type: str, doc_id: int, queued_at: str = None):
+        """حساب بصمة المستند وتحديث نطاقاته، ثم إزالته من الطابور إن لم يتغير أثناء المعالجة"""
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            texts = self._document_texts(conn, doc_type, doc_id)
+            shingles = self.hasher.shingles(texts) if texts is not None else set()
+            signature = self.hasher.signature(shingles)
+
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("DELETE FROM near_dup_bands WHERE doc_type = ? AND doc_id = ?", (doc_type, doc_id))
+            if texts is None:
+                cursor.execute("DELETE FROM near_dup_signatures WHERE doc_type = ? AND doc_id = ?", (doc_type, doc_id))
+            else:
+                cursor.execute('''
+                INSERT OR REPLACE INTO near_dup_signatures (doc_type, doc_id, shingle_count, signature, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ''', (doc_type, doc_id, len(shingles), signature.tobytes() if signature else None, datetime.now().isoformat()))
+                if signature:
+                    cursor.executemany(
+                        "INSERT OR IGNORE INTO near_dup_bands (band, bucket, doc_type, doc_id) VALUES (?, ?, ?, ?)",
+                        [(band, bucket, doc_type, doc_id) for band, bucket in self._band_buckets(signature)]
+                    )
+            if queued_at is not None:
+                cursor.execute(
+                    "DELETE FROM near_dup_queue WHERE doc_type = ? AND doc_id = ? AND queued_at = ?",
+                    (doc_type, doc_id, queued_at)
+                )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _band_buckets(self, signature: array) -> List[tuple]:
+        """مفتاح كل نطاق: بصمة 64 بت (بإشارة لتناسب INTEGER) لقيم صفوفه"""
+        buckets = []
+        for band in range(self.bands):
+            start = band * self.rows_per_band
+            digest = hashlib.blake2b(signature[start:start + self.rows_per_band].tobytes(), digest_size=8).digest()
+            buckets.append((band, int.from_bytes(digest, "little", signed=True)))
+        return buckets
+
+    def find_similar(self, doc_type: str, doc_id: int, threshold: float = None, limit: int = 20) -> Optional[List[Dict]]:
+        """القضايا والأدلة شبه المكررة للمستند مرتبة حسب التشابه؛ None إذا لم يوجد المستند"""
+        threshold = settings.NEAR_DUP_THRESHOLD if threshold is None else threshold
+
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT queued_at FROM near_dup_queue WHERE doc_type = ? AND doc_id = ?",
+                (doc_type, doc_id)
+            )
+            queued = cursor.fetchone()
+        finally:
+            conn.close()
+        if queued:
+            # المستند تغير ولم يُعالج بعد: حساب بصمته الآن
+            self.index_document(doc_type, doc_id, queued[0])
+
+        conn = sqlite3.connect("cybershield.db")
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT signature FROM near_dup_signatures WHERE doc_type = ? AND doc_id = ?",
+                (doc_type, doc_id)
+            )
+            row = cursor.fetchone()
+            if not row:
+                return None
+            if not row["signature"]:
+                return []
+            signature = array("I")
+            signature.frombytes(row["signature"])
+
+            candidates = set()
+            for band, bucket in self._band_buckets(signature):
+                cursor.execute(
+                    "SELECT doc_type, doc_id FROM near_dup_bands WHERE band = ? AND bucket = ?",
+                    (band, bucket)
+                )
+                candidates.update((r["doc_type"], r["doc_id"]) for r in cursor.fetchall())
+            candidates.discard((doc_type, doc_id))
+
+            matches = []
+            for candidate_type, candidate_id in candidates:
+                cursor.execute(
+                    "SELECT signature FROM near_dup_signatures WHERE doc_type = ? AND doc_id = ?",
+                    (candidate_type, candidate_id)
+                )
+                candidate = cursor.fetchone()
+                if not candidate or not candidate["signature"]:
+                    continue
+                other = array("I")
+                other.frombytes(candidate["signature"])
+                score = self.hasher.similarity(signature, other)
+                if score >= threshold:
+                    matches.append((score, candidate_type, candidate_id))
+
+            matches.sort(key=lambda match: match[0], reverse=True)
+            return [self._describe(cursor, *match) for match in matches[:limit]]
+        finally:
+            conn.close()
+
+    def _describe(self, cursor, score: float, doc_type: str, doc_id: int) -> Dict:
+        if doc_type == "case":
+            cursor.execute("SELECT id AS case_db_id, case_id, title FROM cases WHERE id = ?", (doc_id,))
+        else:
+            cursor.execute('''
+            SELECT c.id AS case_db_id, c.case_id, e.filename AS title
+            FROM evidence e JOIN cases c ON c.id = e.case_id
+            WHERE e.id = ?
+            ''', (doc_id,))
+        row = cursor.fetchone()
+        return {
+            "type": doc_type,
+            "id": doc_id,
+            "case_db_id": row["case_db_id"] if row else None,
+            "case_id": row["case_id"] if row else None,
+            "title": row["title"] if row else None,
+            "similarity": round(score, 3)
+        }
+
+
+near_duplicates = NearDuplicateIndex()
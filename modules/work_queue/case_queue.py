@@ -0,0 +1,96 @@
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from app.config import settings
+
+
+class CaseWorkQueue:
+    """طابور عمل المحللين: سحب القضية التالية بشكل ذري مع مهلة حجز"""
+
+    def __init__(self, lease_minutes: int = None):
+        self.lease_minutes = lease_minutes or settings.CASE_LEASE_MINUTES
+
+    def _lease_window(self):
+        now = datetime.now()
+        return now.isoformat(), (now + timedelta(minutes=self.lease_minutes)).isoformat()
+
+    def claim_next(self, user_id: int, role: str, violation_type: Optional[str] = None) -> Optional[Dict]:
+        """حجز القضية غير المسندة ذات الأولوية الأعلى في عبارة UPDATE واحدة
+
+        القضايا المحجوزة التي انتهت مهلتها تعود للطابور تلقائيًا.
+        الإسناد اليدوي (بدون مهلة) لا يُسحب أبدًا.
+        لكل حالة استعلام LIMIT 1 يقرأ الفهرس بترتيب الأولوية، ثم يُختار الأفضل بينها،
+        فلا تُرتب كل القضايا المؤهلة أثناء حجز قفل الكتابة.
+        """
+        statuses = settings.WORK_QUEUE_STATUSES.get(role)
+        if not statuses:
+            return None
+
+        now, lease_expires_at = self._lease_window()
+
+        probe = f'''
+            SELECT * FROM (
+                SELECT id, priority, created_at FROM cases
+                WHERE status = ? {"AND violation_type = ?" if violation_type else ""}
+                AND (assigned_to IS NULL OR lease_expires_at < ?)
+                ORDER BY priority DESC, created_at, id
+                LIMIT 1
+            )'''
+        query = f'''
+        UPDATE cases
+        SET assigned_to = ?, claimed_at = ?, lease_expires_at = ?, updated_at = ?
+        WHERE id = (
+            SELECT id FROM ({" UNION ALL ".join(probe for _ in statuses)})
+            ORDER BY priority DESC, created_at, id
+            LIMIT 1
+        )
+        RETURNING id, case_id, title, violation_type, status, priority, lease_expires_at
+        '''
+        params = [user_id, now, lease_expires_at, now]
+        for queue_status in statuses:
+            params.extend([queue_status, violation_type, now] if violation_type else [queue_status, now])
+
+        conn = sqlite3.connect("cybershield.db")
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            case = cursor.fetchone()
+            conn.commit()
+            return dict(case) if case else None
+        finally:
+            conn.close()
+
+    def renew_lease(self, case_id: str, user_id: int) -> Optional[str]:
+        """تمديد مهلة الحجز إذا كانت القضية ما زالت محجوزة لنفس المستخدم"""
+        now, lease_expires_at = self._lease_window()
+
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+            UPDATE cases SET lease_expires_at = ?
+            WHERE case_id = ? AND assigned_to = ? AND lease_expires_at >= ?
+            ''', (lease_expires_at, case_id, user_id, now))
+            conn.commit()
+            return lease_expires_at if cursor.rowcount else None
+        finally:
+            conn.close()
+
+    def release(self, case_id: str, user_id: int) -> Optional[int]:
+        """إعادة القضية المحجوزة إلى الطابور، وإرجاع معرفها الداخلي"""
+        conn = sqlite3.connect("cybershield.db")
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+            UPDATE cases
+            SET assigned_to = NULL, claimed_at = NULL, lease_expires_at = NULL, updated_at = ?
+            WHERE case_id = ? AND assigned_to = ? AND lease_expires_at IS NOT NULL
+            RETURNING id
+            ''', (datetime.now().isoformat(), case_id, user_id))
+            released = cursor.fetchone()
+            conn.commit()
+            return released[0] if released else None
+        finally:
+            conn.close()
@@ -0,0 +1,57 @@
+import asyncio
+
+from app.core.rate_limit import MemoryBucketStore, RateLimitMiddleware
+from app.core.security import create_access_token
+
+LIMITS = {
+    "verify": {
+        "user_rate": 0.01, "user_burst": 5,
+        "route_rate": 0.01, "route_burst": 20,
+        "concurrency": 4, "queue_timeout": 1,
+    }
+}
+
+
+async def _app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+def _request(middleware, user_id: int) -> int:
+    token = create_access_token({"sub": f"user{user_id}", "role": "analyst", "id": user_id})
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/api/evidence/5/verify",
+        "headers": [(b"authorization", f"Bearer {token}".encode("latin-1"))],
+        "client": ("127.0.0.1", 1234),
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(middleware(scope, receive, send))
+    return messages[0]["status"]
+
+
+def test_user_over_limit_does_not_exhaust_route_bucket():
+    middleware = RateLimitMiddleware(_app, store=MemoryBucketStore(), classes=LIMITS)
+
+    statuses = [_request(middleware, 1) for _ in range(40)]
+    assert statuses.count(200) == 5
+    assert statuses.count(429) == 35
+
+    # الرصيد المشترك للفئة لم يُستهلك إلا بالطلبات المقبولة
+    assert _request(middleware, 2) == 200
+
+
+def test_route_bucket_limits_all_users():
+    middleware = RateLimitMiddleware(_app, store=MemoryBucketStore(), classes=LIMITS)
+
+    statuses = [_request(middleware, user_id) for user_id in range(1, 26)]
+    assert statuses.count(200) == 20
+    assert statuses.count(429) == 5
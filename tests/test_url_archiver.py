@@ -0,0 +1,102 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.config import settings
+from app.database import init_db
+from app.modules.evidence_engine import url_archiver
+from app.modules.evidence_engine.evidence_manager import EvidenceManager
+from app.modules.evidence_engine.url_archiver import UrlArchiver
+
+PAGE = "<html><body>صفحة مؤرشفة</body></html>".encode("utf-8")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    hosts = []
+
+    def do_GET(self):
+        self.hosts.append(self.headers["Host"])
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(PAGE)))
+        self.end_headers()
+        self.wfile.write(PAGE)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    _Handler.hosts = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    init_db()
+    conn = sqlite3.connect("cybershield.db")
+    conn.execute("INSERT INTO cases (case_id, title, violation_type) VALUES ('CASE-1', 'قضية', 'fraud')")
+    conn.commit()
+    conn.close()
+
+
+def _archive(urls):
+    async def run():
+        archiver = UrlArchiver(EvidenceManager())
+        try:
+            job = await archiver.submit(1, urls, requested_by=1)
+            await archiver._queue.join()
+            return archiver.get_job(job["id"]), archiver._host_slots
+        finally:
+            await archiver.shutdown()
+
+    return asyncio.run(run())
+
+
+def test_archives_from_the_checked_address(database, server, monkeypatch):
+    monkeypatch.setattr(settings, "ARCHIVE_ALLOW_PRIVATE_HOSTS", True)
+    resolved = []
+
+    async def resolve(host, port):
+        resolved.append(host)
+        return ["127.0.0.1"]
+
+    # اسم لا يحلله نظام DNS: الاتصال ينجح فقط عبر العنوان الذي تم التحقق منه
+    monkeypatch.setattr(url_archiver, "_resolve_host", resolve)
+    job, host_slots = _archive([f"http://archive.invalid:{server}/page"])
+
+    item = job["items"][0]
+    assert item["status"] == "done", item["error"]
+    assert resolved == ["archive.invalid"]
+    assert _Handler.hosts == [f"archive.invalid:{server}"]
+    assert host_slots == {}
+
+    conn = sqlite3.connect("cybershield.db")
+    file_path, file_hash = conn.execute(
+        "SELECT file_path, file_hash FROM evidence WHERE id = ?", (item["evidence_id"],)
+    ).fetchone()
+    conn.close()
+    assert file_hash == hashlib.sha256(PAGE).hexdigest()
+    with open(file_path, "rb") as f:
+        assert f.read() == PAGE
+
+
+def test_rejects_internal_addresses(database, server, monkeypatch):
+    monkeypatch.setattr(settings, "ARCHIVE_ALLOW_PRIVATE_HOSTS", False)
+    job, host_slots = _archive([f"http://127.0.0.1:{server}/page", f"http://localhost:{server}/page"])
+
+    assert [item["status"] for item in job["items"]] == ["failed", "failed"]
+    assert all(item["error"] == "لا يُسمح بأرشفة عناوين الشبكة الداخلية" for item in job["items"])
+    assert _Handler.hosts == []
+    assert host_slots == {}